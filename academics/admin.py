@@ -3,6 +3,8 @@ from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import CourseNote, Department, Course, CourseDocument, StudentCourseEnrollment
+from . import search
+from uniSchooling.renditions import thumbnail_urls
 
 
 class CourseDocumentInline(admin.TabularInline):
@@ -24,10 +26,6 @@ class DepartmentAdmin(admin.ModelAdmin):
     search_fields = ('name', 'code')
     list_filter = ('created_at',)
     readonly_fields = ('created_at', 'updated_at')
-    
-    def course_count(self, obj):
-        return obj.courses.count()
-    course_count.short_description = 'Number of Courses'
 
 
 @admin.register(Course)
@@ -54,12 +52,16 @@ class CourseAdmin(admin.ModelAdmin):
     )
     
     def document_count(self, obj):
-        count = obj.documents.filter(is_active=True).count()
+        count = obj.active_document_count
         if count > 0:
             url = reverse('admin:academics_coursedocument_changelist') + f'?course={obj.id}'
             return format_html('<a href="{}">{} documents</a>', url, count)
         return '0 documents'
     document_count.short_description = 'Documents'
+    document_count.admin_order_field = 'active_document_count'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('department')
 
 
 @admin.register(CourseDocument)
@@ -108,10 +110,12 @@ class CourseDocumentAdmin(admin.ModelAdmin):
             
             # Create different previews based on file type
             if obj.document_type in ['jpg', 'jpeg', 'png', 'gif']:
+                # Prefer the small rendition over embedding the full upload
+                thumbnails = thumbnail_urls(obj.renditions)
                 return format_html(
                     '<img src="{}" style="max-width: 200px; max-height: 150px;" alt="{}"/><br>'
                     '<a href="{}" target="_blank">View Full Size</a>',
-                    file_url, file_name, file_url
+                    thumbnails['small'] if thumbnails else file_url, file_name, file_url
                 )
             else:
                 return format_html(
@@ -147,6 +151,13 @@ class CourseNoteAdmin(admin.ModelAdmin):
     search_fields = ['title', 'content', 'tags']
     readonly_fields = ['word_count', 'estimated_read_time']
     ordering = ['course', 'order', '-created_at']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Answer searches from the inverted index instead of LIKE scans over content
+        if not search_term.strip():
+            return queryset, False
+        hits = search.search(search_term, kind='note', active_only=False, limit=None)
+        return queryset.filter(pk__in=[object_id for _, object_id, _ in hits]), False
     
     fieldsets = (
         ('Basic Information', {
@@ -0,0 +1,94 @@
+"""
+Reference counting for the content-addressed document store.
+
+Each ``CourseDocument`` holds one reference to the ``StoredBlob`` matching its
+``content_hash``. Single-row saves and deletes acquire and release
+references from the signal handlers in ``academics.signals``; bulk queryset
+operations bypass those, and ``reconcile`` recomputes every count from the
+documents (``dedupe_documents`` runs it).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min
+
+from .models import CourseDocument, StoredBlob
+
+
+def storage():
+    return CourseDocument._meta.get_field('file').storage
+
+
+def acquire(digest, name, size=0):
+    """Add a reference to the blob with ``digest``, registering it if needed"""
+    if not digest:
+        return
+    if StoredBlob.objects.filter(sha256=digest).update(refcount=F('refcount') + 1):
+        return
+    try:
+        with transaction.atomic():
+            StoredBlob.objects.create(sha256=digest, name=name, size=size or 0, refcount=1)
+    except IntegrityError:
+        # Registered concurrently by another upload of the same content
+        StoredBlob.objects.filter(sha256=digest).update(refcount=F('refcount') + 1)
+
+
+def release(digest):
+    """
+    Drop a reference. The last one leaves the blob at zero references and
+    deletes it once the transaction commits, unless it is acquired again
+    first.
+    """
+    if not digest:
+        return
+    with transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(sha256=digest).first()
+        if blob is None:
+            return
+        if blob.refcount > 0:
+            StoredBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+        if blob.refcount <= 1:
+            transaction.on_commit(lambda: delete_unreferenced(blob.sha256, blob.name))
+
+
+def delete_unreferenced(digest, name):
+    with transaction.atomic():
+        # Under the row lock: storing the same content again takes it too
+        # (see ContentAddressedStorage._save), so the file can't be linked
+        # to between this check and the unlink
+        blob = StoredBlob.objects.select_for_update().filter(sha256=digest).first()
+        if blob is not None:
+            if blob.refcount > 0:
+                return
+            blob.delete()
+        storage().delete(name)
+
+
+def reconcile():
+    """
+    Recompute every ``StoredBlob`` from the documents referencing it. Returns
+    ``(created, updated)`` counts. Blobs nothing references any more are
+    left at zero references.
+    """
+    referenced = {
+        row['content_hash']: row
+        for row in CourseDocument.objects.exclude(content_hash='').order_by()
+        .values('content_hash')
+        .annotate(references=Count('pk'), name=Min('file'), size=Max('file_size'))
+    }
+    existing = {blob.sha256: blob for blob in StoredBlob.objects.all()}
+
+    changed = []
+    for digest, blob in existing.items():
+        references = referenced[digest]['references'] if digest in referenced else 0
+        if blob.refcount != references:
+            blob.refcount = references
+            changed.append(blob)
+    missing = [
+        StoredBlob(sha256=digest, name=row['name'], size=row['size'] or 0, refcount=row['references'])
+        for digest, row in referenced.items()
+        if digest not in existing
+    ]
+
+    with transaction.atomic():
+        StoredBlob.objects.bulk_update(changed, ['refcount'], batch_size=500)
+        StoredBlob.objects.bulk_create(missing, batch_size=500, ignore_conflicts=True)
+    return len(missing), len(changed)
@@ -0,0 +1,84 @@
+"""
+Response caching for the read-only catalog and note endpoints.
+
+Responses are cached per namespace, keyed by path, query params, host and
+the caller's role, and invalidated by bumping the namespace from the model
+signals in ``academics.signals``.
+"""
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+from uniSchooling.cache import TieredCache
+
+
+CATALOG = 'catalog'
+NOTES = 'notes'
+
+response_cache = TieredCache(
+    prefix='academics:responses',
+    local_size=getattr(settings, 'RESPONSE_CACHE_LOCAL_SIZE', 512),
+    local_ttl=getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300),
+    timeout=getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300),
+)
+
+
+def user_role(user):
+    if not user or not user.is_authenticated:
+        return 'anonymous'
+    if user.is_staff:
+        return 'staff'
+    return 'student'
+
+
+def cached_response(namespace):
+    """
+    Cache the data of successful responses from a read-only view method,
+    sync or async. Concurrent misses for the same key run the view once.
+    """
+    def key_parts(request):
+        return (
+            request.get_host(),
+            request.path,
+            sorted(request.query_params.lists()),
+            user_role(request.user),
+        )
+
+    def decorator(method):
+        if iscoroutinefunction(method):
+            @wraps(method)
+            async def async_wrapper(self, request, *args, **kwargs):
+                key = await response_cache.amake_key(namespace, *key_parts(request))
+
+                async def compute():
+                    response = await method(self, request, *args, **kwargs)
+                    return response.status_code, response.data
+
+                status_code, data = await response_cache.aget_or_set(
+                    key, compute, cacheable=lambda value: value[0] == status.HTTP_200_OK
+                )
+                return Response(data, status=status_code)
+            return async_wrapper
+
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            key = response_cache.make_key(namespace, *key_parts(request))
+
+            def compute():
+                response = method(self, request, *args, **kwargs)
+                return response.status_code, response.data
+
+            status_code, data = response_cache.get_or_set(
+                key, compute, cacheable=lambda value: value[0] == status.HTTP_200_OK
+            )
+            return Response(data, status=status_code)
+        return wrapper
+    return decorator
+
+
+def invalidate(*namespaces):
+    for namespace in namespaces:
+        response_cache.invalidate(namespace)
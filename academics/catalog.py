@@ -0,0 +1,124 @@
+"""
+Materialized department/course catalog.
+
+The catalog changes a few times per semester but every app launch fetches
+it, so it is serialized once into a ``CatalogSnapshot`` whenever a
+department or course is saved or deleted, and served from process memory.
+Each rebuild gets a higher version; processes notice newer versions through
+the shared cache, so a warm request does no ORM work at all.
+"""
+import hashlib
+import json
+import threading
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Prefetch
+
+from uniSchooling.renditions import thumbnail_urls
+
+from .models import CatalogSnapshot, Course, Department
+
+
+VERSION_CACHE_KEY = 'academics:catalog:version'
+# Old snapshots kept around for debugging; the newest one is always served
+KEEP_SNAPSHOTS = 5
+
+Snapshot = namedtuple('Snapshot', ['version', 'etag', 'body'])
+
+_lock = threading.Lock()
+_current = None
+
+
+def serialize_catalog():
+    departments = Department.objects.order_by('name').prefetch_related(
+        Prefetch('courses', queryset=Course.objects.order_by('title'))
+    )
+    return [
+        {
+            'id': department.id,
+            'name': department.name,
+            'code': department.code,
+            'description': department.description,
+            'logo': department.logo.url if department.logo else None,
+            'thumbnails': thumbnail_urls(department.renditions),
+            'courses': [
+                {
+                    'id': course.id,
+                    'title': course.title,
+                    'module_code': course.module_code,
+                    'description': course.description,
+                    'icon_name': course.icon_name,
+                    'color_code': course.color_code,
+                }
+                for course in department.courses.all()
+            ],
+        }
+        for department in departments
+    ]
+
+
+def _as_snapshot(row):
+    return Snapshot(row.version, row.etag, row.payload.encode('utf-8'))
+
+
+@transaction.atomic
+def rebuild():
+    """Serialize the catalog into a new, higher-versioned snapshot"""
+    departments = serialize_catalog()
+    row = CatalogSnapshot.objects.create(payload='')
+    row.payload = json.dumps({'version': row.version, 'departments': departments},
+                             separators=(',', ':'))
+    digest = hashlib.sha256(row.payload.encode('utf-8')).hexdigest()[:16]
+    row.etag = f'"{row.version}-{digest}"'
+    row.save(update_fields=['payload', 'etag'])
+
+    stale = CatalogSnapshot.objects.values_list('id', flat=True)[KEEP_SNAPSHOTS:]
+    CatalogSnapshot.objects.filter(id__in=list(stale)).delete()
+
+    snapshot = _as_snapshot(row)
+    transaction.on_commit(lambda: _publish(snapshot))
+    return snapshot
+
+
+def _publish(snapshot):
+    global _current
+    with _lock:
+        if _current is None or snapshot.version > _current.version:
+            _current = snapshot
+    cache.set(VERSION_CACHE_KEY, snapshot.version, None)
+
+
+def schedule_rebuild():
+    """
+    Rebuild once the current transaction commits. Saving many courses in one
+    transaction still only triggers a single rebuild.
+    """
+    if connection.in_atomic_block and any(
+        func is rebuild for _, func, _ in connection.run_on_commit
+    ):
+        return
+    transaction.on_commit(rebuild)
+
+
+def get_snapshot():
+    """
+    Return the newest snapshot. Only the shared-cache version lookup happens
+    while this process is up to date.
+    """
+    global _current
+    current = _current
+    latest_version = cache.get(VERSION_CACHE_KEY)
+    if current is not None and latest_version is not None and latest_version <= current.version:
+        return current
+
+    with _lock:
+        row = CatalogSnapshot.objects.order_by('-id').first()
+        if row is not None:
+            _current = _as_snapshot(row)
+    if row is None:
+        _publish(rebuild())
+    else:
+        cache.add(VERSION_CACHE_KEY, row.version, None)
+    return _current
@@ -0,0 +1,133 @@
+"""
+Denormalized counters on ``Course`` and ``Department``.
+
+Single-row saves and deletes apply deltas with ``F()`` updates from the
+signal handlers in ``academics.signals``. Bulk queryset operations recompute
+the affected courses set-wise instead (see ``CounterQuerySet``), and
+``reconcile_counters`` recomputes everything.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db.models import BigIntegerField, Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Course, CourseDocument, CourseNote, Department, StudentCourseEnrollment
+
+
+COURSE_COUNTERS = (
+    'active_document_count',
+    'active_note_count',
+    'active_enrollment_count',
+    'total_file_size',
+)
+
+_state = threading.local()
+
+
+def is_suspended():
+    return getattr(_state, 'suspended', 0) > 0
+
+
+@contextmanager
+def suspended():
+    """
+    Skip per-row delta updates, e.g. while a bulk operation is going to
+    recompute the affected courses afterwards.
+    """
+    _state.suspended = getattr(_state, 'suspended', 0) + 1
+    try:
+        yield
+    finally:
+        _state.suspended -= 1
+
+
+def contribution(instance):
+    """The counter values a single document, note or enrollment adds to its course"""
+    if not instance.is_active:
+        return {}
+    if isinstance(instance, CourseDocument):
+        return {'active_document_count': 1, 'total_file_size': instance.file_size or 0}
+    if isinstance(instance, CourseNote):
+        return {'active_note_count': 1}
+    if isinstance(instance, StudentCourseEnrollment):
+        return {'active_enrollment_count': 1}
+    return {}
+
+
+def apply_delta(course_id, delta, sign=1):
+    """Add ``delta`` (times ``sign``) to a course and to its department"""
+    changes = {field: F(field) + sign * value for field, value in delta.items() if value}
+    if not changes or course_id is None:
+        return
+    Course.objects.filter(pk=course_id).update(**changes)
+    Department.objects.filter(
+        pk=Subquery(Course.objects.filter(pk=course_id).values('department_id')[:1])
+    ).update(**changes)
+
+
+def apply_change(course_id, old, new, old_course_id=None):
+    """Move a row's contribution from ``old`` to ``new``"""
+    if old_course_id is not None and old_course_id != course_id:
+        apply_delta(old_course_id, old, sign=-1)
+        apply_delta(course_id, new)
+        return
+    fields = set(old) | set(new)
+    apply_delta(course_id, {field: new.get(field, 0) - old.get(field, 0) for field in fields})
+
+
+def _aggregate(queryset, group_by, expression):
+    """Correlated ``(SELECT <expression> ... GROUP BY <group_by>)``, 0 when empty"""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values(group_by).annotate(total=expression).values('total'),
+        ),
+        Value(0),
+        output_field=BigIntegerField(),
+    )
+
+
+def course_counter_expressions():
+    def active(model):
+        return model.objects.filter(course=OuterRef('pk'), is_active=True)
+
+    return {
+        'active_document_count': _aggregate(active(CourseDocument), 'course', Count('pk')),
+        'active_note_count': _aggregate(active(CourseNote), 'course', Count('pk')),
+        'active_enrollment_count': _aggregate(active(StudentCourseEnrollment), 'course', Count('pk')),
+        'total_file_size': _aggregate(active(CourseDocument), 'course', Sum('file_size')),
+    }
+
+
+def department_counter_expressions():
+    courses = Course.objects.filter(department=OuterRef('pk'))
+    expressions = {field: _aggregate(courses, 'department', Sum(field)) for field in COURSE_COUNTERS}
+    expressions['course_count'] = _aggregate(courses, 'department', Count('pk'))
+    return expressions
+
+
+def refresh_courses(course_ids=None):
+    """
+    Recompute the counters of the given courses (all when ``None``) and of
+    their departments with one UPDATE per table.
+    """
+    courses = Course.objects.all()
+    departments = Department.objects.all()
+    if course_ids is not None:
+        course_ids = {course_id for course_id in course_ids if course_id is not None}
+        if not course_ids:
+            return
+        courses = courses.filter(pk__in=course_ids)
+        department_ids = set(courses.values_list('department_id', flat=True))
+        departments = departments.filter(pk__in=department_ids)
+
+    courses.update(**course_counter_expressions())
+    departments.update(**department_counter_expressions())
+
+
+def refresh_departments(department_ids=None):
+    """Recompute department counters from their courses' counters"""
+    departments = Department.objects.all()
+    if department_ids is not None:
+        departments = departments.filter(pk__in=set(department_ids))
+    departments.update(**department_counter_expressions())
@@ -0,0 +1,160 @@
+"""
+Serving course document files.
+
+Downloads answer conditional requests from the stored content hash (``ETag``)
+and ``updated_at`` (``Last-Modified``). With ``DOCUMENT_DOWNLOAD_BACKEND``
+set, the transfer is handed to the web server via ``X-Accel-Redirect``
+(nginx) or ``X-Sendfile`` (Apache), which also take care of ``Range``.
+Otherwise the file is streamed from Python with single-range support, so an
+interrupted download can resume where it stopped.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe
+from django.utils.text import slugify
+
+from .models import StudentCourseEnrollment
+
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+
+def can_download(user, document):
+    """Staff and the uploader always; enrolled students while the document is active"""
+    if user.is_staff or document.uploaded_by_id == user.pk:
+        return True
+    if not document.is_active:
+        return False
+    return StudentCourseEnrollment.objects.filter(
+        student=user, course_id=document.course_id, is_active=True
+    ).exists()
+
+
+def etag_for(document):
+    if document.content_hash:
+        return f'"{document.content_hash}"'
+    # Files outside the blob store have no hash; fall back to a weak validator
+    return f'W/"{document.pk}-{int(document.updated_at.timestamp())}"'
+
+
+def download_filename(document):
+    extension = os.path.splitext(document.file.name)[1]
+    return f'{slugify(document.title) or "document"}{extension}'
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) for a single ``bytes=`` range, ``None`` when
+    the header should be ignored and the whole file sent. Raises
+    ``ValueError`` for a range that lies outside the file.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple or malformed ranges: a full response is always allowed
+        return None
+    start, end = match.group('start'), match.group('end')
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last ``end`` bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError('Empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """Whether an ``If-Range`` precondition (if any) still holds"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Only strong validators may be used for ranges
+        return not etag.startswith('W/') and etag in parse_etags(if_range)
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def iter_range(handle, start, length):
+    try:
+        handle.seek(start)
+        remaining = length
+        while remaining > 0:
+            block = handle.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+    finally:
+        handle.close()
+
+
+def serve(request, document):
+    etag = etag_for(document)
+    last_modified = int(document.updated_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _transfer(request, document, etag, last_modified)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _transfer(request, document, etag, last_modified):
+    name = document.file.name
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(True, download_filename(document))
+
+    backend = settings.DOCUMENT_DOWNLOAD_BACKEND
+    if backend in ('nginx', 'apache'):
+        response = HttpResponse(content_type=content_type)
+        if backend == 'nginx':
+            prefix = settings.DOCUMENT_ACCEL_REDIRECT_PREFIX.rstrip('/')
+            response['X-Accel-Redirect'] = quote(f'{prefix}/{name}')
+        else:
+            response['X-Sendfile'] = document.file.path
+        response['Content-Disposition'] = disposition
+        return response
+
+    try:
+        size = document.file.storage.size(name)
+        handle = document.file.storage.open(name, 'rb')
+    except FileNotFoundError:
+        raise Http404('The file of this document is missing')
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            handle.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(handle, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(iter_range(handle, start, length), status=206,
+                                         content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = disposition
+    return response
@@ -0,0 +1,154 @@
+"""
+Bulk enrollment of many students in many courses.
+
+Identifiers are resolved with one query per identifier kind, existing
+enrollments are read with one query, and new rows are inserted with
+``bulk_create(ignore_conflicts=True)`` in chunks and read back once, so
+enrolling a 400-student cohort costs a handful of queries and concurrent
+requests for the same pairs can't fail on the ``unique_together``
+constraint.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import StudentProfile
+
+from .models import Course, StudentCourseEnrollment
+
+
+User = get_user_model()
+
+CREATED = 'created'
+REACTIVATED = 'reactivated'
+ALREADY_ENROLLED = 'already_enrolled'
+UNKNOWN_STUDENT = 'unknown_student'
+UNKNOWN_COURSE = 'unknown_course'
+
+CHUNK_SIZE = 500
+
+
+def _normalize_email(email):
+    return User.objects.normalize_email(email.strip())
+
+
+def resolve_students(identifiers):
+    """
+    Map each identifier to a user id: integers are user ids, strings with an
+    ``@`` are emails and other strings are ``StudentProfile.student_id``.
+    Unknown identifiers are left out.
+    """
+    ids = {identifier for identifier in identifiers if isinstance(identifier, int)}
+    emails = {_normalize_email(i) for i in identifiers if isinstance(i, str) and '@' in i}
+    student_ids = {i.strip() for i in identifiers if isinstance(i, str) and '@' not in i}
+
+    known_ids = set(User.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+    by_email = dict(User.objects.filter(email__in=emails).values_list('email', 'pk')) if emails else {}
+    by_student_id = (
+        dict(StudentProfile.objects.filter(student_id__in=student_ids).values_list('student_id', 'user_id'))
+        if student_ids else {}
+    )
+
+    resolved = {}
+    for identifier in identifiers:
+        if isinstance(identifier, int):
+            user_id = identifier if identifier in known_ids else None
+        elif '@' in identifier:
+            user_id = by_email.get(_normalize_email(identifier))
+        else:
+            user_id = by_student_id.get(identifier.strip())
+        if user_id is not None:
+            resolved[identifier] = user_id
+    return resolved
+
+
+def resolve_courses(identifiers):
+    """Map module codes (or integer course ids) to course ids"""
+    ids = {identifier for identifier in identifiers if isinstance(identifier, int)}
+    codes = {identifier.strip() for identifier in identifiers if isinstance(identifier, str)}
+    known_ids = set(Course.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+    by_code = dict(Course.objects.filter(module_code__in=codes).values_list('module_code', 'pk')) if codes else {}
+
+    resolved = {}
+    for identifier in identifiers:
+        if isinstance(identifier, int):
+            course_id = identifier if identifier in known_ids else None
+        else:
+            course_id = by_code.get(identifier.strip())
+        if course_id is not None:
+            resolved[identifier] = course_id
+    return resolved
+
+
+def _rows(pairs):
+    return StudentCourseEnrollment.objects.filter(
+        student_id__in={student for student, _ in pairs},
+        course_id__in={course for _, course in pairs},
+    ).order_by().values_list('pk', 'student_id', 'course_id', 'enrolled_at', 'is_active')
+
+
+def _record(rows, pairs, statuses, inserted_at=None):
+    """
+    Set the status of each of ``pairs`` found in ``rows``, and return the
+    primary keys of inactive rows to reactivate. Active rows enrolled at or
+    after ``inserted_at`` are the ones this request created.
+    """
+    inactive = []
+    for pk, student_id, course_id, enrolled_at, is_active in rows:
+        pair = (student_id, course_id)
+        if pair not in pairs:
+            continue
+        if not is_active:
+            statuses[pair] = REACTIVATED
+            inactive.append(pk)
+        elif inserted_at is not None and enrolled_at >= inserted_at:
+            statuses[pair] = CREATED
+        else:
+            statuses[pair] = ALREADY_ENROLLED
+    return inactive
+
+
+def bulk_enroll(students, courses, chunk_size=CHUNK_SIZE):
+    """
+    Enroll every student in every course. Returns ``(results, summary)``,
+    with one ``{'student', 'course', 'status'}`` result per pair.
+    """
+    students = list(dict.fromkeys(students))
+    courses = list(dict.fromkeys(courses))
+    student_ids = resolve_students(students)
+    course_ids = resolve_courses(courses)
+    pairs = {(student_ids[s], course_ids[c]) for s in students if s in student_ids for c in courses if c in course_ids}
+
+    statuses = {}
+    if pairs:
+        with transaction.atomic():
+            inactive = _record(_rows(pairs), pairs, statuses)
+
+            missing = pairs - set(statuses)
+            if missing:
+                inserted_at = timezone.now()
+                # Pairs inserted concurrently by another request are skipped, not errors
+                StudentCourseEnrollment.objects.bulk_create(
+                    [StudentCourseEnrollment(student_id=student, course_id=course) for student, course in sorted(missing)],
+                    batch_size=chunk_size,
+                    ignore_conflicts=True,
+                )
+                # So read back what they hold now: such a row may be inactive,
+                # or may have been there before this insert
+                inactive += _record(_rows(missing), missing, statuses, inserted_at)
+            if inactive:
+                StudentCourseEnrollment.objects.filter(pk__in=inactive).update(is_active=True)
+
+    results = []
+    for student in students:
+        for course in courses:
+            if student not in student_ids:
+                status = UNKNOWN_STUDENT
+            elif course not in course_ids:
+                status = UNKNOWN_COURSE
+            else:
+                status = statuses[(student_ids[student], course_ids[course])]
+            results.append({'student': student, 'course': course, 'status': status})
+    return results, dict(Counter(result['status'] for result in results))
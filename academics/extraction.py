@@ -0,0 +1,290 @@
+"""
+Plain-text extraction from uploaded course documents for the search index.
+
+Word, Excel and PowerPoint files are parsed straight out of their OOXML zip
+containers with ``iterparse``, clearing elements as they are consumed, and
+text files are decoded incrementally, so memory stays bounded regardless of
+file size. Extraction is CPU-bound pure Python, so it runs in a process
+pool: ``extract_document`` is the background job for a single upload and
+``extract_document_text`` backfills existing documents on every core.
+
+Alongside the text, each document gets segments (``{'label', 'start'}``
+character offsets of pages, slides or sheets) so search can point at where
+a match is.
+"""
+import codecs
+import csv
+import io
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from jobs.queue import task
+
+from . import search
+from .models import CourseDocument, DocumentText
+
+
+EXTRACTABLE_TYPES = ('txt', 'csv', 'docx', 'xlsx', 'pptx')
+READ_BLOCK_SIZE = 64 * 1024
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+S = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+_pool = None
+
+
+class TextBuilder:
+    """Accumulates text and segment offsets, stopping at ``limit`` characters"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.parts = []
+        self.length = 0
+        self.segments = []
+
+    @property
+    def full(self):
+        return self.length >= self.limit
+
+    def write(self, text):
+        if not text or self.full:
+            return
+        text = text[:self.limit - self.length]
+        self.parts.append(text)
+        self.length += len(text)
+
+    def newline(self):
+        if self.parts and not self.parts[-1].endswith('\n'):
+            self.write('\n')
+
+    def segment(self, label):
+        if not self.full:
+            self.newline()
+            self.segments.append({'label': label, 'start': self.length})
+
+    def result(self):
+        return ''.join(self.parts), self.segments
+
+
+def _numbered(names, pattern):
+    """Zip members matching ``pattern`` ordered by their number (slide10 after slide9)"""
+    regex = re.compile(pattern)
+    matches = ((regex.match(name), name) for name in names)
+    return [name for match, name in sorted(
+        ((match, name) for match, name in matches if match), key=lambda item: int(item[0].group(1))
+    )]
+
+
+def _iter_elements(archive, member):
+    """``end`` events for ``member``, clearing finished elements to keep memory flat"""
+    with archive.open(member) as stream:
+        for _, element in iterparse(stream, events=('end',)):
+            yield element
+            if element.tag in (f'{W}p', f'{A}p', f'{S}row', f'{S}si'):
+                element.clear()
+
+
+def _extract_docx(path, out):
+    with zipfile.ZipFile(path) as archive:
+        page = 1
+        out.segment(f'Page {page}')
+        with archive.open('word/document.xml') as stream:
+            for event, element in iterparse(stream, events=('start', 'end')):
+                if out.full:
+                    break
+                tag = element.tag
+                if event == 'start':
+                    page_break = (
+                        tag == f'{W}lastRenderedPageBreak'
+                        or (tag == f'{W}br' and element.get(f'{W}type') == 'page')
+                    )
+                    if page_break:
+                        page += 1
+                        out.segment(f'Page {page}')
+                    continue
+                if tag == f'{W}t':
+                    out.write(element.text)
+                elif tag == f'{W}tab':
+                    out.write('\t')
+                elif tag == f'{W}p':
+                    out.newline()
+                    element.clear()
+
+
+def _extract_pptx(path, out):
+    with zipfile.ZipFile(path) as archive:
+        slides = _numbered(archive.namelist(), r'^ppt/slides/slide(\d+)\.xml$')
+        for number, member in enumerate(slides, start=1):
+            if out.full:
+                break
+            out.segment(f'Slide {number}')
+            for element in _iter_elements(archive, member):
+                if element.tag == f'{A}t':
+                    out.write(element.text)
+                    out.write(' ')
+                elif element.tag == f'{A}p':
+                    out.newline()
+
+
+def _extract_xlsx(path, out):
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        shared = []
+        if 'xl/sharedStrings.xml' in names:
+            for element in _iter_elements(archive, 'xl/sharedStrings.xml'):
+                if element.tag == f'{S}si':
+                    shared.append(''.join(t.text or '' for t in element.iter(f'{S}t')))
+
+        sheets = _numbered(names, r'^xl/worksheets/sheet(\d+)\.xml$')
+        for number, member in enumerate(sheets, start=1):
+            if out.full:
+                break
+            out.segment(f'Sheet {number}')
+            row = []
+            for element in _iter_elements(archive, member):
+                tag = element.tag
+                if tag == f'{S}c':
+                    kind = element.get('t')
+                    value = element.find(f'{S}v')
+                    if kind == 's' and value is not None and value.text:
+                        index = int(value.text)
+                        if index < len(shared):
+                            row.append(shared[index])
+                    elif kind == 'inlineStr':
+                        row.append(''.join(t.text or '' for t in element.iter(f'{S}t')))
+                    elif kind == 'str' and value is not None:
+                        row.append(value.text or '')
+                elif tag == f'{S}row':
+                    if row:
+                        out.write(' '.join(row))
+                        out.newline()
+                    row = []
+                    if out.full:
+                        break
+
+
+def _extract_txt(path, out):
+    # Form feeds separate pages in text exported from other tools
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    page = 1
+    out.segment(f'Page {page}')
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(READ_BLOCK_SIZE), b''):
+            pages = decoder.decode(block).split('\f')
+            out.write(pages[0])
+            for text in pages[1:]:
+                page += 1
+                out.segment(f'Page {page}')
+                out.write(text)
+            if out.full:
+                return
+        out.write(decoder.decode(b'', final=True))
+
+
+def _extract_csv(path, out):
+    with open(path, 'rb') as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace', newline='')
+        for row in csv.reader(text):
+            out.write(' '.join(cell for cell in row if cell))
+            out.newline()
+            if out.full:
+                return
+
+
+EXTRACTORS = {
+    'txt': _extract_txt,
+    'csv': _extract_csv,
+    'docx': _extract_docx,
+    'xlsx': _extract_xlsx,
+    'pptx': _extract_pptx,
+}
+
+
+def extract(path, document_type, limit=None):
+    """
+    ``(text, segments)`` for the file at ``path``. Runs in worker processes,
+    so it only takes and returns plain data.
+    """
+    out = TextBuilder(limit or settings.EXTRACTION_MAX_CHARS)
+    EXTRACTORS[document_type](path, out)
+    return out.result()
+
+
+def extract_safely(job):
+    """
+    ``extract`` for a ``(pk, path, document_type, limit)`` tuple, returning
+    errors instead of raising so one bad file doesn't stop a batch.
+    """
+    pk, path, document_type, limit = job
+    try:
+        text, segments = extract(path, document_type, limit)
+        return pk, text, segments, ''
+    except Exception as error:
+        # Parsers raise more than parse errors: zipfile raises RuntimeError for
+        # encrypted members and NotImplementedError for unknown compression.
+        # Retrying won't help either way, so record it like any bad file.
+        return pk, '', [], f'{type(error).__name__}: {error}'
+
+
+def processes():
+    configured = settings.EXTRACTION_PROCESSES
+    if configured is None:
+        return os.cpu_count() or 1
+    return configured
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=processes())
+    return _pool
+
+
+def is_extractable(document):
+    return bool(document.file) and document.document_type in EXTRACTABLE_TYPES
+
+
+def needs_extraction(document):
+    if not is_extractable(document):
+        return False
+    current = DocumentText.objects.filter(document=document).values_list('content_hash', flat=True).first()
+    return current != document.content_hash
+
+
+def store(document, text, segments, error=''):
+    """Save extracted text for ``document`` and reindex it"""
+    with transaction.atomic():
+        DocumentText.objects.update_or_create(
+            document=document,
+            defaults={
+                'text': text,
+                'segments': segments,
+                'content_hash': document.content_hash,
+                'error': error,
+                'extracted_at': timezone.now(),
+            },
+        )
+        # Drop the cached reverse relation so the index sees the new text
+        CourseDocument.extracted_text.related.delete_cached_value(document)
+        search.index_instance(document)
+
+
+@task(priority=-5, max_attempts=3)
+def extract_document(document_id):
+    document = CourseDocument.objects.filter(pk=document_id).first()
+    if document is None or not is_extractable(document):
+        return
+    job = (document.pk, document.file.path, document.document_type, settings.EXTRACTION_MAX_CHARS)
+    if processes():
+        _, text, segments, error = get_pool().submit(extract_safely, job).result()
+    else:
+        _, text, segments, error = extract_safely(job)
+    store(document, text, segments, error)
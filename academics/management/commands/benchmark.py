@@ -0,0 +1,130 @@
+import json
+import platform
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from academics.cache import response_cache
+from uniSchooling import benchmark
+
+
+# seed_scale sizes for --fresh
+SCALES = {
+    'small': ['--departments', '5', '--courses', '50', '--students', '500', '--notes', '2000',
+              '--documents', '500', '--messages', '2000'],
+    'medium': ['--departments', '20', '--courses', '400', '--students', '10000', '--notes', '20000',
+               '--documents', '5000', '--messages', '50000'],
+    'large': ['--departments', '50', '--courses', '2000', '--students', '200000', '--notes', '1e6',
+              '--documents', '2e5', '--messages', '5e6', '--processes', '4'],
+}
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the API routes (latency percentiles, throughput, SQL queries, peak memory), '
+            'optionally against a JSON baseline and budgets')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--route', action='append', dest='routes', metavar='NAME',
+                            help='Only benchmark this URL name, e.g. course-list (repeatable)')
+        parser.add_argument('--base-url', help='Benchmark a running server instead of in process '
+                                               '(latency and throughput only)')
+        parser.add_argument('--password', default='password',
+                            help="The benchmark student's password, for the login route")
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the caches before every request')
+        parser.add_argument('--fresh', choices=sorted(SCALES),
+                            help='Run against a throwaway test database seeded with seed_scale at this size')
+        parser.add_argument('--save', metavar='PATH', help='Write the results as a JSON baseline')
+        parser.add_argument('--baseline', metavar='PATH', help='Compare with a saved baseline')
+        parser.add_argument('--budgets', metavar='PATH', default=settings.BENCHMARK_BUDGETS,
+                            help='JSON budgets: {"default": {...}, "routes": {"<name>": {...}}}')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed slowdown/memory growth against the baseline (0.25 = 25%%)')
+
+    def handle(self, *args, **options):
+        if not options['fresh']:
+            return self.benchmark(options)
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command('seed_scale', *SCALES[options['fresh']], '--password', options['password'],
+                         stdout=self.stdout)
+            return self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def benchmark(self, options):
+        try:
+            fixtures = benchmark.find_fixtures(options['password'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        scenarios, skipped = benchmark.build_scenarios(fixtures, only=options['routes'])
+        if not scenarios:
+            raise CommandError('No routes to benchmark')
+
+        if options['base_url']:
+            runner = benchmark.HTTPRunner(options['base_url'], fixtures['user'])
+        else:
+            runner = benchmark.InProcessRunner(fixtures['user'], before_request=self.clear_caches
+                                               if options['cold'] else None)
+
+        results = []
+        self.stdout.write(f"{'route':36} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} "
+                          f"{'queries':>7} {'peak KB':>9}")
+        for scenario in scenarios:
+            result = runner.run(scenario, options['iterations'], options['warmup'])
+            results.append(result)
+            self.stdout.write(
+                f"{result['name']:36} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                f"{result['p99_ms']:>9.2f} {result['throughput_rps'] or 0:>8.1f} "
+                f"{self.optional(result['queries']):>7} {self.optional(result['peak_memory_kb']):>9}"
+            )
+        for name, reason in sorted(skipped.items()):
+            self.stdout.write(f'Skipped {name}: {reason}')
+
+        report = {
+            'created_at': datetime.now(dt_timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'cold': options['cold'],
+            'results': results,
+        }
+        if options['save']:
+            with open(options['save'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Saved results to {options['save']}")
+
+        problems = benchmark.compare(
+            results,
+            baseline=self.load(options['baseline']) if options['baseline'] else None,
+            budgets=self.load(options['budgets']) if options['budgets'] else None,
+            tolerance=options['tolerance'],
+        )
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(problem))
+        if problems:
+            raise CommandError(f'{len(problems)} performance regressions')
+        self.stdout.write(self.style.SUCCESS(f'Benchmarked {len(results)} routes, no regressions'))
+
+    def clear_caches(self):
+        cache.clear()
+        response_cache.local.clear()
+
+    def load(self, path):
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Could not read {path}: {error}')
+
+    @staticmethod
+    def optional(value):
+        return '-' if value is None else value
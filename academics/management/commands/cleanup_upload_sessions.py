@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from academics import uploads
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired chunked upload sessions and their temporary files'
+
+    def handle(self, *args, **options):
+        removed = uploads.cleanup_expired()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired upload sessions'))
@@ -0,0 +1,120 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from academics import blobs
+from academics.models import CourseDocument
+from academics.storage import blob_name, hash_path
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves existing course document files into the content-addressed blob store, '
+        'hashing them in parallel and storing identical files once'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 4,
+                            help='Number of files hashed concurrently')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of documents migrated per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how much space deduplication would save')
+
+    def handle(self, *args, **options):
+        self.storage = blobs.storage()
+        self.dry_run = options['dry_run']
+        self.seen = set()
+        # Legacy names already migrated, for documents that shared a file
+        self.resolved = {}
+        self.migrated = 0
+        self.reclaimed = 0
+        self.missing = 0
+
+        pending = (
+            CourseDocument.objects.filter(content_hash='').exclude(file='')
+            .order_by('pk').values_list('pk', 'file')
+        )
+        batch_size = options['batch_size']
+        # hashlib releases the GIL while hashing, so threads hash in parallel
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            batch = []
+            for row in pending.iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    self.migrate_batch(pool, batch)
+                    batch = []
+            if batch:
+                self.migrate_batch(pool, batch)
+
+        if self.dry_run:
+            self.stdout.write(
+                f'{self.migrated} documents would move into the blob store, '
+                f'saving {self.reclaimed} bytes'
+            )
+            return
+
+        created, updated = blobs.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f'Migrated {self.migrated} documents, reclaimed {self.reclaimed} bytes '
+            f'({created} blobs registered, {updated} reference counts fixed)'
+        ))
+        if self.missing:
+            self.stdout.write(self.style.WARNING(f'Skipped {self.missing} documents whose file is missing'))
+
+    def hash_row(self, row):
+        pk, name = row
+        if name in self.resolved:
+            return (pk, name) + self.resolved[name]
+        path = self.storage.path(name)
+        if not os.path.exists(path):
+            return pk, name, None, 0
+        return pk, name, hash_path(path), os.path.getsize(path)
+
+    def migrate_batch(self, pool, rows):
+        documents = []
+        sources = {}
+        for pk, name, digest, size in pool.map(self.hash_row, rows):
+            if digest is None:
+                self.missing += 1
+                continue
+            target = blob_name(digest, name)
+            if target == name:
+                # Already in the blob store, e.g. bulk created; only the hash is missing
+                documents.append(CourseDocument(pk=pk, file=target, content_hash=digest))
+                self.seen.add(digest)
+                continue
+            if digest in self.seen or self.storage.exists(target):
+                if name not in sources and name not in self.resolved:
+                    self.reclaimed += size
+            elif not self.dry_run:
+                self.materialize(self.storage.path(name), self.storage.path(target))
+            self.seen.add(digest)
+            sources[name] = (digest, size)
+            documents.append(CourseDocument(pk=pk, file=target, content_hash=digest))
+            self.migrated += 1
+
+        if self.dry_run or not documents:
+            return
+        with transaction.atomic():
+            CourseDocument.objects.bulk_update(documents, ['file', 'content_hash'])
+        # Originals are only removed once nothing points at them any more
+        for name, hashed in sources.items():
+            if name not in self.resolved:
+                self.resolved[name] = hashed
+                self.storage.delete(name)
+
+    def materialize(self, source, target):
+        """Hard-link ``source`` into the blob store, copying across filesystems"""
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(source, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            temporary = f'{target}.incoming'
+            shutil.copyfile(source, temporary)
+            os.replace(temporary, target)
@@ -0,0 +1,73 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from academics import extraction, search
+from academics.models import CourseDocument, DocumentText
+
+
+class Command(BaseCommand):
+    help = 'Extracts searchable text from existing course documents on all cores and reindexes them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes (default: one per core)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Documents saved and reindexed per transaction')
+        parser.add_argument('--force', action='store_true',
+                            help='Also re-extract documents whose text is up to date')
+
+    def handle(self, *args, **options):
+        documents = (
+            CourseDocument.objects.filter(document_type__in=extraction.EXTRACTABLE_TYPES)
+            .exclude(file='')
+        )
+        if not options['force']:
+            documents = documents.filter(
+                Q(extracted_text__isnull=True) | ~Q(extracted_text__content_hash=F('content_hash'))
+            )
+        rows = documents.order_by('pk').values_list('pk', 'file', 'document_type', 'content_hash')
+
+        storage = CourseDocument._meta.get_field('file').storage
+        limit = settings.EXTRACTION_MAX_CHARS
+        processes = options['processes'] or extraction.processes() or 1
+        batch_size = options['batch_size']
+        extracted = failed = 0
+
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            batch = []
+            for pk, name, document_type, content_hash in rows.iterator(chunk_size=batch_size):
+                batch.append(((pk, storage.path(name), document_type, limit), content_hash))
+                if len(batch) >= batch_size * processes:
+                    done, errors = self.process(pool, batch)
+                    extracted, failed = extracted + done, failed + errors
+                    batch = []
+            if batch:
+                done, errors = self.process(pool, batch)
+                extracted, failed = extracted + done, failed + errors
+
+        self.stdout.write(self.style.SUCCESS(f'Extracted text from {extracted} documents'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} documents could not be read'))
+
+    def process(self, pool, batch):
+        hashes = {job[0]: content_hash for job, content_hash in batch}
+        jobs = [job for job, _ in batch]
+        now = timezone.now()
+        texts = []
+        failed = 0
+        for pk, text, segments, error in pool.map(extraction.extract_safely, jobs, chunksize=4):
+            failed += bool(error)
+            texts.append(DocumentText(document_id=pk, text=text, segments=segments,
+                                      content_hash=hashes[pk], error=error, extracted_at=now))
+
+        with transaction.atomic():
+            DocumentText.objects.filter(document_id__in=hashes).delete()
+            DocumentText.objects.bulk_create(texts)
+            for document in CourseDocument.objects.select_related('extracted_text').filter(pk__in=hashes):
+                search.index_instance(document)
+        return len(texts) - failed, failed
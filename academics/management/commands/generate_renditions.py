@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from academics.models import CourseDocument, Department
+from uniSchooling import renditions
+
+
+class Command(BaseCommand):
+    help = 'Renders missing thumbnails for department logos, image documents and profile photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Re-record renditions even where they look current')
+
+    def handle(self, *args, **options):
+        sources = (
+            (Department, 'logo', None),
+            (CourseDocument, 'file', 'content_hash'),
+            (get_user_model(), 'profile_photo', None),
+        )
+        for model, field_name, digest_field in sources:
+            total = 0
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for instance in queryset.order_by('pk').iterator(chunk_size=500):
+                if not options['force'] and not renditions.needs_renditions(instance, field_name):
+                    continue
+                digest = getattr(instance, digest_field) if digest_field else None
+                if renditions.generate(instance._meta.label, instance.pk, field_name, digest or None):
+                    total += 1
+            self.stdout.write(self.style.SUCCESS(f'Rendered {total} {model._meta.verbose_name_plural}'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from academics import search
+from academics.models import CourseDocument, CourseNote, SearchDocument, SearchPosting
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index for course notes and documents in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of notes/documents indexed per batch')
+        parser.add_argument('--kind', choices=['note', 'document'],
+                            help='Only rebuild one kind of entry')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        sources = {'note': CourseNote, 'document': CourseDocument}
+        if options['kind']:
+            sources = {options['kind']: sources[options['kind']]}
+
+        for kind, model in sources.items():
+            with transaction.atomic():
+                SearchDocument.objects.filter(kind=kind).delete()
+                total = 0
+                batch = []
+                instances = model.objects.order_by('pk')
+                if model is CourseDocument:
+                    instances = instances.select_related('extracted_text')
+                for instance in instances.iterator(chunk_size=batch_size):
+                    batch.append(instance)
+                    if len(batch) >= batch_size:
+                        total += self.index_batch(kind, batch)
+                        batch = []
+                if batch:
+                    total += self.index_batch(kind, batch)
+            self.stdout.write(self.style.SUCCESS(f'Indexed {total} {kind}s'))
+
+    def index_batch(self, kind, instances):
+        entries = [search.build_entry(instance) for instance in instances]
+        SearchDocument.objects.bulk_create(SearchDocument(**fields) for fields, _ in entries)
+
+        # Not every backend returns primary keys from bulk_create, so look them up
+        ids = dict(
+            SearchDocument.objects.filter(kind=kind, object_id__in=[i.pk for i in instances])
+            .values_list('object_id', 'id')
+        )
+        SearchPosting.objects.bulk_create(
+            (
+                SearchPosting(term=term, document_id=ids[fields['object_id']], frequency=frequency)
+                for fields, terms in entries
+                for term, frequency in terms.items()
+            ),
+            batch_size=5000,
+        )
+        return len(instances)
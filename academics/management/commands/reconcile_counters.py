@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from academics import counters
+from academics.models import Course, Department
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized course and department counters set-wise'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', action='append', dest='courses', metavar='MODULE_CODE',
+                            help='Only reconcile these courses (repeatable)')
+
+    def handle(self, *args, **options):
+        course_ids = None
+        if options['courses']:
+            course_ids = set(
+                Course.objects.filter(module_code__in=options['courses']).values_list('id', flat=True)
+            )
+
+        fields = ('id',) + counters.COURSE_COUNTERS
+        before = {row[0]: row[1:] for row in Course.objects.values_list(*fields)}
+        with transaction.atomic():
+            counters.refresh_courses(course_ids)
+        after = {row[0]: row[1:] for row in Course.objects.values_list(*fields)}
+
+        drifted = sum(1 for course_id, values in after.items() if before.get(course_id) != values)
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled counters for {len(course_ids) if course_ids is not None else len(after)} courses '
+            f'and {Department.objects.count()} departments ({drifted} courses had drifted)'
+        ))
@@ -0,0 +1,108 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time as day_start
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from academics import counters, seeding
+
+
+def count(value):
+    """Row counts such as 2000, 1e6 or 200_000"""
+    try:
+        number = float(value.replace('_', ''))
+    except ValueError:
+        raise ValueError(f'{value} is not a number')
+    if number < 0 or number != int(number):
+        raise ValueError(f'{value} is not a whole number of rows')
+    return int(number)
+
+
+class Command(BaseCommand):
+    help = ('Generates a production-sized synthetic dataset (Zipf-skewed enrollments, log-normal note '
+            'lengths) with bulk inserts, deterministically from --seed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--departments', type=count, default=20)
+        parser.add_argument('--courses', type=count, default=400)
+        parser.add_argument('--staff', type=count, default=None,
+                            help='Staff who author notes and documents (default: one per 10 courses)')
+        parser.add_argument('--students', type=count, default=10_000)
+        parser.add_argument('--enrollments-per-student', type=int, default=5,
+                            help='Median courses per student')
+        parser.add_argument('--notes', type=count, default=20_000)
+        parser.add_argument('--documents', type=count, default=5_000)
+        parser.add_argument('--messages', type=count, default=50_000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--processes', type=int, default=0,
+                            help='Write chunks from this many processes (default: in this process)')
+        parser.add_argument('--password', default='password',
+                            help='Password of every seeded user (hashed once)')
+        parser.add_argument('--index', action='store_true',
+                            help='Rebuild the search index afterwards')
+
+    def handle(self, *args, **options):
+        if seeding.is_seeded():
+            raise CommandError('Seeded data already exists; seed_scale expects a database without it')
+        sizes = {
+            key: options[key]
+            for key in ('departments', 'courses', 'students', 'enrollments_per_student',
+                        'notes', 'documents', 'messages')
+        }
+        if sizes['courses'] and not sizes['departments']:
+            raise CommandError('Courses need at least one department')
+        sizes['staff'] = options['staff'] if options['staff'] is not None else max(1, sizes['courses'] // 10)
+        # Midnight, so message dates match between runs on the same day
+        now = timezone.make_aware(datetime.combine(timezone.localdate(), day_start()))
+        context = seeding.Context(options['seed'], sizes, make_password(options['password']), now)
+
+        started = time.monotonic()
+        with transaction.atomic():
+            self.report('departments and courses', seeding.seed_departments(context), started)
+
+        for table, writer, chunks in seeding.TABLES:
+            context.load_keys()
+            if table == 'enrollments' and not context.course_ids:
+                continue
+            if table == 'messages' and not context.sender_ids:
+                continue
+            started = time.monotonic()
+            written = self.write(writer, list(chunks(sizes)), context, options['processes'])
+            self.report(table, written, started)
+
+        started = time.monotonic()
+        with transaction.atomic():
+            counters.refresh_courses()
+        self.report('counters', None, started)
+
+        if options['index']:
+            call_command('rebuild_search_index', stdout=self.stdout)
+
+    def write(self, writer, chunks, context, processes):
+        if not processes:
+            seeding.init_worker(context)
+            return sum(writer(chunk) for chunk in chunks)
+        # Forked children inherit the loaded app registry. Closing the
+        # connections first makes each child open its own instead of sharing
+        # this process's socket.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=seeding.init_worker,
+            initargs=(context,),
+        ) as pool:
+            return sum(pool.map(writer, chunks))
+
+    def report(self, what, rows, started):
+        elapsed = time.monotonic() - started
+        if rows is None:
+            self.stdout.write(f'Refreshed {what} in {elapsed:.1f}s')
+        else:
+            rate = rows / elapsed if elapsed else rows
+            self.stdout.write(self.style.SUCCESS(f'Wrote {rows} {what} in {elapsed:.1f}s ({rate:,.0f} rows/s)'))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0003_coursenote'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coursedocument',
+            index=models.Index(fields=['course', '-uploaded_at', 'id'], name='academics_c_course__590c7b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coursenote',
+            index=models.Index(fields=['order', '-created_at', 'id'], name='academics_c_order_b19e5b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentcourseenrollment',
+            index=models.Index(fields=['student', '-enrolled_at', 'id'], name='academics_s_student_6fe432_idx'),
+        ),
+    ]
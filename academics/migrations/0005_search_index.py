@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('note', 'Course Note'), ('document', 'Course Document')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('category', models.CharField(blank=True, default='', max_length=20)),
+                ('difficulty_level', models.CharField(blank=True, default='', max_length=15)),
+                ('is_active', models.BooleanField(default=True)),
+                ('length', models.PositiveIntegerField(default=0, help_text='Weighted number of indexed terms')),
+                ('indexed_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='academics.course')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('frequency', models.PositiveIntegerField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='academics.searchdocument')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=models.Index(fields=['course', 'category'], name='academics_s_course__bbc48e_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchdocument',
+            unique_together={('kind', 'object_id')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchposting',
+            unique_together={('term', 'document')},
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:55
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField, Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def _aggregate(queryset, group_by, expression):
+    return Coalesce(
+        Subquery(queryset.order_by().values(group_by).annotate(total=expression).values('total')),
+        Value(0),
+        output_field=BigIntegerField(),
+    )
+
+
+def populate_counters(apps, schema_editor):
+    Department = apps.get_model('academics', 'Department')
+    Course = apps.get_model('academics', 'Course')
+    CourseDocument = apps.get_model('academics', 'CourseDocument')
+    CourseNote = apps.get_model('academics', 'CourseNote')
+    StudentCourseEnrollment = apps.get_model('academics', 'StudentCourseEnrollment')
+
+    def active(model):
+        return model.objects.filter(course=OuterRef('pk'), is_active=True)
+
+    Course.objects.update(
+        active_document_count=_aggregate(active(CourseDocument), 'course', Count('pk')),
+        active_note_count=_aggregate(active(CourseNote), 'course', Count('pk')),
+        active_enrollment_count=_aggregate(active(StudentCourseEnrollment), 'course', Count('pk')),
+        total_file_size=_aggregate(active(CourseDocument), 'course', Sum('file_size')),
+    )
+    courses = Course.objects.filter(department=OuterRef('pk'))
+    Department.objects.update(
+        course_count=_aggregate(courses, 'department', Count('pk')),
+        active_document_count=_aggregate(courses, 'department', Sum('active_document_count')),
+        active_note_count=_aggregate(courses, 'department', Sum('active_note_count')),
+        active_enrollment_count=_aggregate(courses, 'department', Sum('active_enrollment_count')),
+        total_file_size=_aggregate(courses, 'department', Sum('total_file_size')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0006_catalogsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='active_document_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='active_enrollment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='active_note_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='total_file_size',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Bytes of active documents'),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='active_document_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='active_enrollment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='active_note_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='course_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Number of Courses'),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='total_file_size',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Bytes of active documents'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-17 19:01
+
+import academics.models
+import academics.storage
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0008_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(help_text='Storage name of the blob', max_length=255)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='coursedocument',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='SHA-256 of the file, empty for files outside the blob store', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='coursedocument',
+            name='file',
+            field=models.FileField(help_text='Supported formats: PDF, Word, Excel, PowerPoint, Text, CSV, ZIP, RAR, Images', storage=academics.storage.document_storage, upload_to=academics.models.get_upload_path, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'txt', 'csv', 'zip', 'rar', 'jpg', 'jpeg', 'png', 'gif'])]),
+        ),
+    ]
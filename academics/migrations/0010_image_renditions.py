@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0009_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursedocument',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Thumbnail names by size for image documents'),
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Thumbnail names by size, see uniSchooling.renditions'),
+        ),
+    ]
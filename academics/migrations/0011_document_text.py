@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-17 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('academics', '0010_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(blank=True)),
+                ('segments', models.JSONField(blank=True, default=list, help_text="[{'label': 'Slide 2', 'start': <offset>}, ...]")),
+                ('content_hash', models.CharField(blank=True, default='', help_text='Hash of the file the text was extracted from', max_length=64)),
+                ('error', models.TextField(blank=True, default='')),
+                ('extracted_at', models.DateTimeField()),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='extracted_text', to='academics.coursedocument')),
+            ],
+        ),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import FileExtensionValidator
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 import os
+import uuid
+
+from .storage import digest_of, document_storage
 
 
 User = get_user_model()
@@ -17,6 +20,62 @@ def get_upload_path(instance, filename):
     return os.path.join('course_documents', instance.course.department.code, instance.course.module_code, filename)
 
 
+class CounterQuerySet(models.QuerySet):
+    """
+    QuerySet for rows that feed the ``Course``/``Department`` counters.
+    Bulk operations skip the per-row signal handlers, so they recompute the
+    affected courses set-wise afterwards.
+    """
+
+    def _affected_course_ids(self):
+        return set(self.order_by().values_list('course_id', flat=True).distinct())
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from . import counters
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            counters.refresh_courses({obj.course_id for obj in objs})
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from . import counters
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            course_ids = set(
+                self.model.objects.filter(pk__in=[obj.pk for obj in objs])
+                .values_list('course_id', flat=True)
+            ) | {obj.course_id for obj in objs}
+            updated = super().bulk_update(objs, fields, *args, **kwargs)
+            counters.refresh_courses(course_ids)
+        return updated
+
+    def update(self, **kwargs):
+        from . import counters
+        with transaction.atomic(using=self.db):
+            course_ids = self._affected_course_ids()
+            new_course = kwargs.get('course_id', kwargs.get('course'))
+            if new_course is not None:
+                course_ids.add(getattr(new_course, 'pk', new_course))
+            updated = super().update(**kwargs)
+            counters.refresh_courses(course_ids)
+        return updated
+
+    update.alters_data = True
+
+    def delete(self):
+        from . import counters
+        with transaction.atomic(using=self.db):
+            course_ids = self._affected_course_ids()
+            with counters.suspended():
+                deleted = super().delete()
+            counters.refresh_courses(course_ids)
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class Department(models.Model):
     """
     Department model to represent university departments such as Engineering, Business, Technology, etc.
@@ -25,9 +84,19 @@ class Department(models.Model):
     code = models.CharField(max_length=10, unique=True)
     description = models.TextField(blank=True, null=True)
     logo = models.ImageField(upload_to='department_logos/', blank=True, null=True)
+    renditions = models.JSONField(default=dict, blank=True, editable=False,
+                                  help_text="Thumbnail names by size, see uniSchooling.renditions")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized counters, maintained by academics.counters
+    course_count = models.IntegerField(default=0, editable=False, verbose_name='Number of Courses')
+    active_document_count = models.IntegerField(default=0, editable=False)
+    active_note_count = models.IntegerField(default=0, editable=False)
+    active_enrollment_count = models.IntegerField(default=0, editable=False)
+    total_file_size = models.BigIntegerField(default=0, editable=False,
+                                                     help_text="Bytes of active documents")
+
     def __str__(self):
         return f"{self.name} ({self.code})"
 
@@ -50,6 +119,13 @@ class Course(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized counters, maintained by academics.counters
+    active_document_count = models.IntegerField(default=0, editable=False)
+    active_note_count = models.IntegerField(default=0, editable=False)
+    active_enrollment_count = models.IntegerField(default=0, editable=False)
+    total_file_size = models.BigIntegerField(default=0, editable=False,
+                                                     help_text="Bytes of active documents")
+
     def __str__(self):
         return f"{self.title} ({self.module_code})"
 
@@ -85,6 +161,7 @@ class CourseDocument(models.Model):
     document_type = models.CharField(max_length=10, choices=DOCUMENT_TYPES)
     file = models.FileField(
         upload_to=get_upload_path,
+        storage=document_storage,
         validators=[
             FileExtensionValidator(
                 allowed_extensions=[
@@ -100,8 +177,15 @@ class CourseDocument(models.Model):
     uploaded_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     file_size = models.PositiveIntegerField(null=True, blank=True, help_text="File size in bytes")
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True, editable=False,
+                                    help_text="SHA-256 of the file, empty for files outside the blob store")
+    renditions = models.JSONField(default=dict, blank=True, editable=False,
+                                  help_text="Thumbnail names by size for image documents")
     is_active = models.BooleanField(default=True, help_text="Uncheck to hide this document from students")
 
+    objects = CounterQuerySet.as_manager()
+
+    @transaction.atomic
     def save(self, *args, **kwargs):
         # Auto-detect document type based on file extension
         if self.file:
@@ -129,7 +213,13 @@ class CourseDocument(models.Model):
             # Set file size
             if hasattr(self.file, 'size'):
                 self.file_size = self.file.size
-        
+
+            # Store new uploads now rather than in pre_save so the blob's
+            # hash is known before the row is written
+            if not self.file._committed:
+                self.file.save(self.file.name, self.file.file, save=False)
+        self.content_hash = digest_of(self.file.name) or ''
+
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -146,6 +236,10 @@ class CourseDocument(models.Model):
         ordering = ['-uploaded_at']
         verbose_name = "Course Document"
         verbose_name_plural = "Course Documents"
+        indexes = [
+            # Keyset pagination of a course's documents
+            models.Index(fields=['course', '-uploaded_at', 'id']),
+        ]
 
 
 class CourseNote(models.Model):
@@ -194,6 +288,8 @@ class CourseNote(models.Model):
     estimated_read_time = models.PositiveIntegerField(blank=True, null=True,
                                                      help_text="Estimated reading time in minutes")
 
+    objects = CounterQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.title} - {self.course.title}"
     
@@ -211,6 +307,7 @@ class CourseNote(models.Model):
             return [tag.strip() for tag in self.tags.split(',')]
         return []
     
+    @transaction.atomic
     def save(self, *args, **kwargs):
         # Auto-calculate estimated read time if not provided (average 200 words per minute)
         if not self.estimated_read_time and self.content:
@@ -227,6 +324,7 @@ class CourseNote(models.Model):
             models.Index(fields=['course', 'category']),
             models.Index(fields=['course', 'is_featured']),
             models.Index(fields=['course', 'order']),
+            models.Index(fields=['order', '-created_at', 'id']),
         ]
 
 
@@ -239,9 +337,155 @@ class StudentCourseEnrollment(models.Model):
     enrolled_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
+    objects = CounterQuerySet.as_manager()
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+
     class Meta:
         unique_together = ['student', 'course']
         ordering = ['-enrolled_at']
+        indexes = [
+            models.Index(fields=['student', '-enrolled_at', 'id']),
+        ]
 
     def __str__(self):
-        return f"{self.student.username} enrolled in {self.course.title}"
\ No newline at end of file
+        return f"{self.student.username} enrolled in {self.course.title}"
+
+class UploadSession(models.Model):
+    """
+    A resumable, chunked upload of a course document. Chunks are appended to
+    a temporary file until ``received_bytes`` reaches ``total_size``, then the
+    session is finalized into a ``CourseDocument``.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'In Progress'),
+        ('complete', 'Complete'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='upload_sessions')
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+    filename = models.CharField(max_length=255, help_text="Original file name, used for the extension")
+    total_size = models.PositiveBigIntegerField(help_text="Expected file size in bytes")
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    expected_sha256 = models.CharField(max_length=64, blank=True, default='',
+                                       help_text="Optional checksum the client expects")
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    document = models.OneToOneField(CourseDocument, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='upload_session')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.received_bytes}/{self.total_size} bytes)"
+
+    @property
+    def is_complete(self):
+        return self.received_bytes >= self.total_size
+
+
+class DocumentText(models.Model):
+    """
+    Plain text extracted from a course document for the search index, with
+    the character offsets where each page, slide or sheet starts.
+    """
+    document = models.OneToOneField(CourseDocument, on_delete=models.CASCADE, related_name='extracted_text')
+    text = models.TextField(blank=True)
+    segments = models.JSONField(default=list, blank=True,
+                                help_text="[{'label': 'Slide 2', 'start': <offset>}, ...]")
+    content_hash = models.CharField(max_length=64, blank=True, default='',
+                                    help_text="Hash of the file the text was extracted from")
+    error = models.TextField(blank=True, default='')
+    extracted_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Text of {self.document_id} ({len(self.text)} characters)"
+
+
+class StoredBlob(models.Model):
+    """
+    One file in the content-addressed document store, with the number of
+    course documents that reference it. The file is deleted when the last
+    reference goes away.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, help_text="Storage name of the blob")
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
+
+
+class SearchDocument(models.Model):
+    """
+    One indexed course note or course document in the search index, holding
+    the values search results are filtered on and the document length used
+    for BM25 normalisation.
+    """
+    KIND_CHOICES = (
+        ('note', 'Course Note'),
+        ('document', 'Course Document'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    # Note category or document type
+    category = models.CharField(max_length=20, blank=True, default='')
+    difficulty_level = models.CharField(max_length=15, blank=True, default='')
+    is_active = models.BooleanField(default=True)
+    length = models.PositiveIntegerField(default=0, help_text="Weighted number of indexed terms")
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}"
+
+    class Meta:
+        unique_together = ['kind', 'object_id']
+        indexes = [
+            models.Index(fields=['course', 'category']),
+        ]
+
+
+class SearchPosting(models.Model):
+    """
+    Inverted index entry: how often a stemmed term occurs in a search document
+    """
+    term = models.CharField(max_length=64)
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='postings')
+    frequency = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.term} -> {self.document}"
+
+    class Meta:
+        # Also serves term lookups, which always filter on ``term`` first
+        unique_together = ['term', 'document']
+
+
+class CatalogSnapshot(models.Model):
+    """
+    Pre-serialized Department -> Course catalog. A new row is written every
+    time a department or course changes; the primary key is the version.
+    """
+    payload = models.TextField(help_text="Serialized JSON catalog")
+    etag = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def version(self):
+        return self.pk
+
+    def __str__(self):
+        return f"Catalog v{self.pk}"
+
+    class Meta:
+        ordering = ['-id']
@@ -0,0 +1,391 @@
+"""
+Inverted-index full-text search over course notes and course documents.
+
+Text is tokenized, stop words are dropped and the remaining words are
+reduced with the Porter stemmer. Each note/document becomes a
+``SearchDocument`` with one ``SearchPosting`` per distinct term, kept in sync
+by the model signals in ``academics.signals``. Queries are ranked with BM25
+using only indexed lookups on ``term``, so no ``LIKE '%term%'`` scans are
+needed and it runs the same on MySQL and SQLite.
+"""
+import bisect
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+
+from django.db import transaction
+from django.db.models import Avg, Case, Count, FloatField, IntegerField, Sum, Value, When
+from django.db.models.functions import Cast
+from rest_framework import filters
+
+from .models import CourseDocument, CourseNote, SearchDocument, SearchPosting
+
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+MAX_TERM_LENGTH = 64
+
+# Title and tag matches count for more than body matches
+NOTE_FIELD_WEIGHTS = (('title', 3), ('tags', 2), ('chapter', 2), ('content', 1))
+DOCUMENT_FIELD_WEIGHTS = (('title', 3), ('description', 1))
+# Text extracted from the file itself (see ``academics.extraction``)
+EXTRACTED_TEXT_WEIGHT = 1
+
+SNIPPET_CHARS = 160
+
+STOP_WORDS = frozenset("""
+    a about above after again against all am an and any are as at be because been
+    before being below between both but by can did do does doing down during each
+    few for from further had has have having he her here hers herself him himself
+    his how i if in into is it its itself just me more most my myself no nor not
+    now of off on once only or other our ours ourselves out over own same she
+    should so some such than that the their theirs them themselves then there
+    these they this those through to too under until up very was we were what
+    when where which while who whom why will with you your yours yourself
+""".split())
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# Porter stemmer -------------------------------------------------------------
+
+def _is_consonant(word, i):
+    char = word[i]
+    if char in 'aeiou':
+        return False
+    if char == 'y':
+        return i == 0 or not _is_consonant(word, i - 1)
+    return True
+
+
+def _measure(stem):
+    """Number of vowel-consonant sequences, the ``m`` in [C](VC)^m[V]"""
+    form = ''.join('c' if _is_consonant(stem, i) else 'v' for i in range(len(stem)))
+    return len(re.findall('v+c+', form))
+
+
+def _has_vowel(stem):
+    return any(not _is_consonant(stem, i) for i in range(len(stem)))
+
+
+def _ends_double_consonant(word):
+    return len(word) >= 2 and word[-1] == word[-2] and _is_consonant(word, len(word) - 1)
+
+
+def _ends_cvc(word):
+    return (
+        len(word) >= 3
+        and _is_consonant(word, len(word) - 3)
+        and not _is_consonant(word, len(word) - 2)
+        and _is_consonant(word, len(word) - 1)
+        and word[-1] not in 'wxy'
+    )
+
+
+def _replace_suffix(word, rules, min_measure):
+    """Apply the first rule whose suffix matches, if the stem is long enough"""
+    for suffix, replacement in rules:
+        if word.endswith(suffix):
+            stem = word[:-len(suffix)]
+            if _measure(stem) > min_measure:
+                return stem + replacement
+            return word
+    return word
+
+
+_STEP2_RULES = (
+    ('ational', 'ate'), ('tional', 'tion'), ('enci', 'ence'), ('anci', 'ance'),
+    ('izer', 'ize'), ('bli', 'ble'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'),
+    ('ousli', 'ous'), ('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate'),
+    ('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'), ('ousness', 'ous'),
+    ('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble'), ('logi', 'log'),
+)
+
+_STEP3_RULES = (
+    ('icate', 'ic'), ('ative', ''), ('alize', 'al'), ('iciti', 'ic'),
+    ('ical', 'ic'), ('ful', ''), ('ness', ''),
+)
+
+_STEP4_SUFFIXES = (
+    'al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment',
+    'ent', 'ion', 'ou', 'ism', 'ate', 'iti', 'ous', 'ive', 'ize',
+)
+
+
+def stem(word):
+    """Reduce an English word to its Porter stem, e.g. ``'connections'`` -> ``'connect'``"""
+    if len(word) <= 2 or not word.isalpha():
+        return word
+
+    # Step 1a: plurals
+    if word.endswith('sses'):
+        word = word[:-2]
+    elif word.endswith('ies'):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+
+    # Step 1b: -eed, -ed, -ing
+    if word.endswith('eed'):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    else:
+        for suffix in ('ed', 'ing'):
+            if word.endswith(suffix) and _has_vowel(word[:-len(suffix)]):
+                word = word[:-len(suffix)]
+                if word.endswith(('at', 'bl', 'iz')):
+                    word += 'e'
+                elif _ends_double_consonant(word) and word[-1] not in 'lsz':
+                    word = word[:-1]
+                elif _measure(word) == 1 and _ends_cvc(word):
+                    word += 'e'
+                break
+
+    # Step 1c: terminal y
+    if word.endswith('y') and _has_vowel(word[:-1]):
+        word = word[:-1] + 'i'
+
+    word = _replace_suffix(word, _STEP2_RULES, 0)
+    word = _replace_suffix(word, _STEP3_RULES, 0)
+
+    # Step 4: strip suffixes from long stems
+    for suffix in _STEP4_SUFFIXES:
+        if word.endswith(suffix):
+            stem_ = word[:-len(suffix)]
+            if _measure(stem_) > 1 and (suffix != 'ion' or stem_.endswith(('s', 't'))):
+                word = stem_
+            break
+
+    # Step 5: tidy up a final -e and double -ll
+    if word.endswith('e'):
+        stem_ = word[:-1]
+        measure = _measure(stem_)
+        if measure > 1 or (measure == 1 and not _ends_cvc(stem_)):
+            word = stem_
+    if word.endswith('ll') and _measure(word) > 1:
+        word = word[:-1]
+
+    return word
+
+
+# Analysis -------------------------------------------------------------------
+
+def tokenize(text):
+    """Lower-cased word tokens with stop words removed"""
+    if not text:
+        return []
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if token not in STOP_WORDS and len(token) <= MAX_TERM_LENGTH
+    ]
+
+
+def analyze(text):
+    """Tokens of ``text`` reduced to their stems"""
+    return [stem(token) for token in tokenize(text)]
+
+
+def _weighted_terms(instance, field_weights):
+    terms = Counter()
+    for field, weight in field_weights:
+        for term in analyze(getattr(instance, field, None)):
+            terms[term] += weight
+    return terms
+
+
+def build_entry(instance):
+    """
+    Return ``(SearchDocument fields, term frequencies)`` for a note or
+    course document. ``SearchDocument.length`` is the weighted term count.
+    """
+    if isinstance(instance, CourseNote):
+        terms = _weighted_terms(instance, NOTE_FIELD_WEIGHTS)
+        fields = {
+            'kind': 'note',
+            'category': instance.category or '',
+            'difficulty_level': instance.difficulty_level or '',
+        }
+    else:
+        terms = _weighted_terms(instance, DOCUMENT_FIELD_WEIGHTS)
+        extracted = getattr(instance, 'extracted_text', None)
+        if extracted is not None:
+            for term in analyze(extracted.text):
+                terms[term] += EXTRACTED_TEXT_WEIGHT
+        fields = {
+            'kind': 'document',
+            'category': instance.document_type or '',
+            'difficulty_level': '',
+        }
+    fields.update(
+        object_id=instance.pk,
+        course_id=instance.course_id,
+        is_active=instance.is_active,
+        length=sum(terms.values()),
+    )
+    return fields, terms
+
+
+def kind_of(instance):
+    return 'note' if isinstance(instance, CourseNote) else 'document'
+
+
+# Indexing -------------------------------------------------------------------
+
+@transaction.atomic
+def index_instance(instance):
+    """(Re)index a single note or course document"""
+    fields, terms = build_entry(instance)
+    document, _ = SearchDocument.objects.update_or_create(
+        kind=fields.pop('kind'),
+        object_id=fields.pop('object_id'),
+        defaults=fields,
+    )
+    document.postings.all().delete()
+    SearchPosting.objects.bulk_create(
+        SearchPosting(term=term, document=document, frequency=frequency)
+        for term, frequency in terms.items()
+    )
+    return document
+
+
+def remove_instance(instance):
+    SearchDocument.objects.filter(kind=kind_of(instance), object_id=instance.pk).delete()
+
+
+# Querying -------------------------------------------------------------------
+
+def search(query, *, kind=None, course=None, category=None, difficulty=None,
+           active_only=True, limit=50):
+    """
+    Rank indexed notes/documents against ``query`` with BM25.
+
+    Returns a list of ``(kind, object_id, score)`` tuples, best first. With
+    ``limit=None`` every match is returned. Scores are summed per document
+    in the database, so only the returned rows leave it, however many
+    postings a common term has.
+    """
+    terms = set(analyze(query))
+    if not terms:
+        return []
+
+    candidates = SearchDocument.objects.all()
+    if kind:
+        candidates = candidates.filter(kind=kind)
+    if course:
+        candidates = candidates.filter(course_id=course)
+    if category:
+        candidates = candidates.filter(category=category)
+    if difficulty:
+        candidates = candidates.filter(difficulty_level=difficulty)
+    if active_only:
+        candidates = candidates.filter(is_active=True)
+
+    # Corpus statistics are global so scores don't shift with the filters
+    corpus = SearchDocument.objects.aggregate(total=Count('id'), average_length=Avg('length'))
+    total = corpus['total'] or 0
+    average_length = corpus['average_length'] or 1
+    document_frequency = dict(
+        SearchPosting.objects.filter(term__in=terms)
+        .values_list('term')
+        .annotate(frequency=Count('id'))
+    )
+
+    idf = Case(
+        *[
+            When(term=term, then=Value(math.log(1 + (total - df + 0.5) / (df + 0.5))))
+            for term, df in ((term, document_frequency.get(term, 0)) for term in sorted(terms))
+        ],
+        output_field=FloatField(),
+    )
+    # Cast, or integer columns would divide as integers
+    frequency = Cast('frequency', FloatField())
+    length = Cast('document__length', FloatField())
+    norm = frequency + Value(K1 * (1 - B)) + Value(K1 * B / average_length) * length
+    ranked = (
+        SearchPosting.objects.filter(term__in=terms, document__in=candidates)
+        .values('document__kind', 'document__object_id')
+        .annotate(score=Sum(idf * frequency * Value(K1 + 1) / norm))
+        .order_by('-score', 'document__kind', 'document__object_id')
+        .values_list('document__kind', 'document__object_id', 'score')
+    )
+    if limit is not None:
+        ranked = ranked[:limit]
+    return list(ranked)
+
+
+_cached_stem = lru_cache(maxsize=65536)(stem)
+
+
+def locate(text, segments, query):
+    """
+    Where ``query`` matches best inside extracted ``text``: the segment
+    (page, slide or sheet) with the most matching terms, as
+    ``{'label', 'offset', 'snippet'}``, or ``None`` without a match.
+    """
+    terms = set(analyze(query))
+    if not text or not terms:
+        return None
+    starts = [segment['start'] for segment in segments]
+    hits = Counter()
+    first_hit = {}
+    for match in TOKEN_RE.finditer(text):
+        token = match.group().lower()
+        if len(token) > MAX_TERM_LENGTH or token in STOP_WORDS or _cached_stem(token) not in terms:
+            continue
+        index = bisect.bisect_right(starts, match.start()) - 1
+        hits[index] += 1
+        first_hit.setdefault(index, match.start())
+    if not hits:
+        return None
+
+    index = max(hits, key=lambda i: (hits[i], -i))
+    offset = first_hit[index]
+    start = max(offset - SNIPPET_CHARS // 4, 0)
+    snippet = ' '.join(text[start:start + SNIPPET_CHARS].split())
+    return {
+        'label': segments[index]['label'] if index >= 0 else None,
+        'offset': offset,
+        'snippet': snippet,
+    }
+
+
+class IndexedSearchFilter(filters.SearchFilter):
+    """
+    ``SearchFilter`` replacement that answers ``?search=`` from the inverted
+    index instead of ``LIKE`` scans over ``search_fields``. Only the best
+    ``max_hits`` matches are returned, best first: ``KeysetPagination``
+    pages through them by ``rank_field`` unless the client asks for another
+    ordering.
+    """
+    search_kind = 'document'
+    # Bounds the IN list and the CASE built from the hits
+    max_hits = 200
+    rank_field = 'search_rank'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        hits = search(
+            query,
+            kind=getattr(view, 'search_kind', self.search_kind),
+            course=request.query_params.get('course'),
+            active_only=False,
+            limit=self.max_hits,
+        )
+        if not hits:
+            return queryset.none()
+        ids = [object_id for _, object_id, _ in hits]
+        rank = Case(
+            *[When(pk=object_id, then=Value(position)) for position, object_id in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=ids).annotate(**{self.rank_field: rank}).order_by(self.rank_field, 'id')
+
+    def get_keyset_ordering(self, request, queryset, view):
+        if self.rank_field in queryset.query.annotations:
+            return (self.rank_field, 'id')
+        return None
@@ -0,0 +1,349 @@
+"""
+Synthetic data at production scale, for ``manage.py seed_scale``.
+
+Sizes follow the shapes real data has: course popularity, note authorship
+and message senders are Zipf-skewed, note and message lengths are
+log-normal, and words and tags are drawn Zipf-wise from fixed vocabularies
+so the search index sees realistic term frequencies.
+
+Rows are generated in fixed-size chunks and every chunk draws from its own
+random generator seeded with ``(seed, table, chunk)``. The output therefore
+depends only on the seed and the sizes, not on how many processes wrote
+it or in which order. Chunks are written with ``bulk_create`` through the
+models' base managers, skipping the counter refresh that
+``CounterQuerySet.bulk_create`` does per call; ``seed_scale`` recomputes
+all counters once at the end instead.
+"""
+import math
+import random
+from bisect import bisect
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from users.models import Message, StudentProfile
+
+from .models import Course, CourseDocument, CourseNote, Department, StudentCourseEnrollment
+
+
+User = get_user_model()
+
+EMAIL_DOMAIN = 'seed.example.com'
+DEPARTMENT_PREFIX = 'SD'
+CHUNK_SIZE = 5000
+
+FIELDS = [
+    'Engineering', 'Business', 'Technology', 'Transportation', 'Medicine', 'Law', 'Education',
+    'Agriculture', 'Architecture', 'Economics', 'Mathematics', 'Physics', 'Chemistry', 'Biology',
+    'History', 'Languages', 'Music', 'Nursing', 'Maritime Studies', 'Environmental Science',
+]
+FIRST_NAMES = [
+    'Amina', 'Baraka', 'Neema', 'Juma', 'Rehema', 'Daudi', 'Zawadi', 'Hamisi', 'Upendo', 'Salim',
+    'Grace', 'John', 'Mary', 'Peter', 'Esther', 'James', 'Fatma', 'Ali', 'Halima', 'Joseph',
+]
+LAST_NAMES = [
+    'Mollel', 'Mushi', 'Kimaro', 'Mwakyusa', 'Massawe', 'Njau', 'Shirima', 'Lyimo', 'Mrema', 'Swai',
+    'Mwita', 'Kessy', 'Temba', 'Urassa', 'Minja', 'Lema', 'Ngowi', 'Mbwana', 'Chande', 'Salum',
+]
+ICONS = ['computer_outlined', 'business_center', 'people_alt_outlined', 'sailing_outlined', 'train_outlined',
+         'science_outlined', 'menu_book_outlined', 'calculate_outlined', 'gavel_outlined', 'eco_outlined']
+COLORS = ['#1E88E5', '#43A047', '#8E24AA', '#E53935', '#FB8C00', '#00897B', '#3949AB', '#6D4C41']
+SYLLABLES = ['ka', 'to', 'ri', 'mo', 'sa', 'ne', 'lu', 'pi', 'da', 've', 'zo', 'gra', 'phy', 'tion',
+             'al', 'en', 'or', 'is', 'um', 'ex', 'con', 'dy', 'mi', 'cal', 'ter', 'ba', 'so', 'li']
+
+# Share of rows per choice, roughly as in production
+NOTE_CATEGORIES = {'lecture': 40, 'concept': 20, 'tutorial': 15, 'assignment': 8, 'exam_prep': 8,
+                   'reference': 5, 'announcement': 3, 'other': 1}
+DIFFICULTIES = {'beginner': 50, 'intermediate': 35, 'advanced': 15}
+DOCUMENT_TYPES = {'pdf': 40, 'pptx': 20, 'docx': 15, 'xlsx': 5, 'txt': 4, 'csv': 2, 'png': 5,
+                  'jpg': 5, 'zip': 3, 'doc': 1}
+
+_context = None
+
+
+class Zipf:
+    """Draws ranks ``0..n-1`` with probability proportional to ``1 / (rank + 1) ** s``"""
+
+    def __init__(self, n, s=1.1):
+        self.n = n
+        self.cumulative = list(accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+    def sample(self, rng):
+        return min(bisect(self.cumulative, rng.random() * self.cumulative[-1]), self.n - 1)
+
+    def sample_many(self, rng, k):
+        return rng.choices(range(self.n), cum_weights=self.cumulative, k=k)
+
+
+class Weighted:
+    def __init__(self, weights):
+        self.choices = list(weights)
+        self.cumulative = list(accumulate(weights.values()))
+
+    def sample(self, rng):
+        return rng.choices(self.choices, cum_weights=self.cumulative)[0]
+
+
+def chunk_rng(seed, table, chunk):
+    return random.Random(f'{seed}:{table}:{chunk}')
+
+
+def lognormal(rng, median, sigma, low, high):
+    return max(low, min(high, int(rng.lognormvariate(math.log(median), sigma))))
+
+
+def make_vocabulary(seed, size):
+    rng = random.Random(f'{seed}:vocabulary')
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    # Sorted before shuffling so set ordering can't leak into the result
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def department_code(index):
+    return f'{DEPARTMENT_PREFIX}{index:04d}'
+
+
+def student_email(index):
+    return f's{index:07d}@{EMAIL_DOMAIN}'
+
+
+def staff_email(index):
+    return f'staff{index:05d}@{EMAIL_DOMAIN}'
+
+
+class Context:
+    """
+    What chunk writers share: the sizes, the vocabularies and the primary
+    keys of rows written by earlier phases, in a seed-determined order.
+    """
+
+    def __init__(self, seed, sizes, password, now):
+        self.seed = seed
+        self.sizes = sizes
+        self.password = password
+        self.now = now
+        self.words = make_vocabulary(seed, 5000)
+        self.word_ranks = Zipf(len(self.words), s=1.05)
+        self.tags = self.words[:300]
+        self.tag_ranks = Zipf(len(self.tags), s=1.2)
+        self.categories = Weighted(NOTE_CATEGORIES)
+        self.difficulties = Weighted(DIFFICULTIES)
+        self.document_types = Weighted(DOCUMENT_TYPES)
+        self.course_ids = []
+        self.course_codes = {}
+        self.staff_ids = []
+        self.student_ids = []
+
+    def load_keys(self):
+        """Read back the keys of seeded courses and users, popularity order shuffled by seed"""
+        courses = list(
+            Course.objects.filter(department__code__startswith=DEPARTMENT_PREFIX)
+            .order_by('module_code').values_list('pk', 'module_code')
+        )
+        rng = random.Random(f'{self.seed}:popularity')
+        rng.shuffle(courses)
+        self.course_ids = [pk for pk, _ in courses]
+        self.course_codes = dict(courses)
+        self.course_ranks = Zipf(len(courses)) if courses else None
+        seeded = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').order_by('email')
+        self.staff_ids = list(seeded.filter(is_staff=True).values_list('pk', flat=True))
+        self.staff_ranks = Zipf(len(self.staff_ids)) if self.staff_ids else None
+        self.student_ids = list(seeded.filter(is_staff=False).values_list('pk', flat=True))
+        self.sender_ids = self.staff_ids + self.student_ids
+        self.sender_ranks = Zipf(len(self.sender_ids)) if self.sender_ids else None
+
+    def text(self, rng, words):
+        return ' '.join(self.words[rank] for rank in self.word_ranks.sample_many(rng, words))
+
+    def title(self, rng, low=2, high=7):
+        return self.text(rng, rng.randint(low, high)).capitalize()
+
+
+def init_worker(context):
+    """Process pool initializer; also used directly when writing in-process"""
+    global _context
+    _context = context
+
+
+def seed_departments(context):
+    rng = chunk_rng(context.seed, 'departments', 0)
+    count = context.sizes['departments']
+    Department._base_manager.bulk_create([
+        Department(
+            name=f'{FIELDS[i % len(FIELDS)]} {i // len(FIELDS) + 1}' if count > len(FIELDS) else FIELDS[i],
+            code=department_code(i),
+            description=context.text(rng, rng.randint(10, 40)),
+        )
+        for i in range(count)
+    ], batch_size=CHUNK_SIZE)
+
+    departments = list(
+        Department.objects.filter(code__startswith=DEPARTMENT_PREFIX).order_by('code').values_list('pk', 'code')
+    )
+    # Some departments run far more courses than others
+    sizes = Zipf(len(departments), s=0.8)
+    courses = []
+    numbers = {}
+    for i in range(context.sizes['courses']):
+        department_id, code = departments[sizes.sample(rng)]
+        numbers[code] = numbers.get(code, 100) + 1
+        courses.append(Course(
+            title=context.title(rng, 2, 5),
+            module_code=f'{code}-{numbers[code]}',
+            department_id=department_id,
+            description=context.text(rng, rng.randint(20, 80)),
+            icon_name=rng.choice(ICONS),
+            color_code=rng.choice(COLORS),
+        ))
+    Course._base_manager.bulk_create(courses, batch_size=CHUNK_SIZE)
+    return len(departments) + len(courses)
+
+
+def write_users(chunk):
+    """Students ``chunk * CHUNK_SIZE`` onwards and their profiles; staff are chunk -1"""
+    context = _context
+    rng = chunk_rng(context.seed, 'users', chunk)
+    if chunk < 0:
+        emails = [staff_email(i) for i in range(context.sizes['staff'])]
+    else:
+        start = chunk * CHUNK_SIZE
+        emails = [student_email(i) for i in range(start, min(start + CHUNK_SIZE, context.sizes['students']))]
+
+    users = []
+    for email in emails:
+        users.append(User(
+            email=email,
+            username=email.split('@')[0],
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            password=context.password,
+            is_staff=chunk < 0,
+            is_student=chunk >= 0,
+        ))
+    with transaction.atomic():
+        User._base_manager.bulk_create(users)
+        if chunk >= 0:
+            # Not every backend returns primary keys from bulk_create
+            ids = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+            year = context.now.year
+            StudentProfile._base_manager.bulk_create([
+                StudentProfile(
+                    user_id=ids[email],
+                    student_id=f'SEED{email[1:8]}',
+                    enrollment_year=year - min(int(rng.expovariate(0.6)), 6),
+                    major=rng.choice(FIELDS),
+                )
+                for email in emails
+            ])
+    return len(users)
+
+
+def write_enrollments(chunk):
+    """Enrollments of the students in one chunk, 1 to ~10 courses each, Zipf over courses"""
+    context = _context
+    rng = chunk_rng(context.seed, 'enrollments', chunk)
+    per_student = context.sizes['enrollments_per_student']
+    limit = min(len(context.course_ids), per_student * 4)
+    enrollments = []
+    for student_id in context.student_ids[chunk * CHUNK_SIZE:(chunk + 1) * CHUNK_SIZE]:
+        wanted = min(limit, lognormal(rng, per_student, 0.4, 1, limit))
+        courses = set()
+        while len(courses) < wanted:
+            courses.add(context.course_ids[context.course_ranks.sample(rng)])
+        for course_id in sorted(courses):
+            enrollments.append(StudentCourseEnrollment(
+                student_id=student_id, course_id=course_id, is_active=rng.random() > 0.05,
+            ))
+    StudentCourseEnrollment._base_manager.bulk_create(enrollments, batch_size=CHUNK_SIZE)
+    return len(enrollments)
+
+
+def write_notes(chunk):
+    context = _context
+    rng = chunk_rng(context.seed, 'notes', chunk)
+    start = chunk * CHUNK_SIZE
+    notes = []
+    for i in range(start, min(start + CHUNK_SIZE, context.sizes['notes'])):
+        words = lognormal(rng, 250, 0.8, 20, 5000)
+        tags = {context.tags[rank] for rank in context.tag_ranks.sample_many(rng, rng.randint(0, 5))}
+        notes.append(CourseNote(
+            title=context.title(rng),
+            course_id=context.course_ids[context.course_ranks.sample(rng)],
+            category=context.categories.sample(rng),
+            difficulty_level=context.difficulties.sample(rng),
+            content=context.text(rng, words),
+            tags=', '.join(sorted(tags))[:200] or None,
+            is_featured=rng.random() < 0.02,
+            order=rng.randint(0, 50),
+            created_by_id=context.staff_ids[context.staff_ranks.sample(rng)] if context.staff_ids else None,
+            is_active=rng.random() > 0.03,
+            chapter=f'Chapter {rng.randint(1, 20)}' if rng.random() < 0.6 else None,
+            estimated_read_time=max(1, words // 200),
+        ))
+    CourseNote._base_manager.bulk_create(notes)
+    return len(notes)
+
+
+def write_documents(chunk):
+    """Document rows only; their files don't exist, so downloads of them 404"""
+    context = _context
+    rng = chunk_rng(context.seed, 'documents', chunk)
+    start = chunk * CHUNK_SIZE
+    documents = []
+    for i in range(start, min(start + CHUNK_SIZE, context.sizes['documents'])):
+        course_id = context.course_ids[context.course_ranks.sample(rng)]
+        document_type = context.document_types.sample(rng)
+        code = context.course_codes[course_id]
+        documents.append(CourseDocument(
+            title=context.title(rng),
+            course_id=course_id,
+            document_type=document_type,
+            file=f'seed/{code}/{i}.{document_type}',
+            description=context.text(rng, rng.randint(5, 30)) if rng.random() < 0.5 else None,
+            uploaded_by_id=context.staff_ids[context.staff_ranks.sample(rng)] if context.staff_ids else None,
+            file_size=lognormal(rng, 800 * 1024, 1.2, 1024, 50 * 1024 * 1024),
+            is_active=rng.random() > 0.03,
+        ))
+    CourseDocument._base_manager.bulk_create(documents)
+    return len(documents)
+
+
+def write_messages(chunk):
+    context = _context
+    rng = chunk_rng(context.seed, 'messages', chunk)
+    start = chunk * CHUNK_SIZE
+    messages = []
+    for _ in range(start, min(start + CHUNK_SIZE, context.sizes['messages'])):
+        messages.append(Message(
+            sender_id=context.sender_ids[context.sender_ranks.sample(rng)],
+            subject=context.title(rng, 3, 8),
+            body=context.text(rng, lognormal(rng, 40, 0.9, 3, 2000)),
+            # Spread over the past year
+            sent_at=context.now - timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+        ))
+    Message._base_manager.bulk_create(messages)
+    return len(messages)
+
+
+def chunks(count):
+    return range(math.ceil(count / CHUNK_SIZE))
+
+
+# Phase order matters: later tables point at rows written by earlier ones
+TABLES = [
+    ('users', write_users, lambda sizes: [-1] + list(chunks(sizes['students']))),
+    ('enrollments', write_enrollments, lambda sizes: chunks(sizes['students'])),
+    ('notes', write_notes, lambda sizes: chunks(sizes['notes'])),
+    ('documents', write_documents, lambda sizes: chunks(sizes['documents'])),
+    ('messages', write_messages, lambda sizes: chunks(sizes['messages'])),
+]
+
+
+def is_seeded():
+    return Department.objects.filter(code__startswith=DEPARTMENT_PREFIX).exists()
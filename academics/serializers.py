@@ -1,42 +1,87 @@
+import os
+
 from rest_framework import serializers
-from .models import CourseNote, Department, Course, CourseDocument, StudentCourseEnrollment
+from .models import CourseNote, Department, Course, CourseDocument, StudentCourseEnrollment, UploadSession
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from uniSchooling.renditions import ThumbnailsField
 
 User = get_user_model()
 
+
+class ExpandableFieldsMixin:
+    """
+    Drops nested relations the view did not ask for.
+
+    The view passes the requested paths (e.g. ``{'courses', 'courses.documents'}``)
+    as ``context['expand']``. Without an ``expand`` context every field is kept.
+    """
+    expandable_fields = ()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = self.context.get('expand')
+        if expand is None:
+            return fields
+
+        prefix = self.expand_prefix()
+        for name in self.expandable_fields:
+            if prefix + name not in expand:
+                fields.pop(name, None)
+        return fields
+
+    def expand_prefix(self):
+        """Dotted path of this serializer from the root, e.g. ``'courses.'``"""
+        parts = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                parts.append(node.field_name)
+            node = node.parent
+        return ''.join(f'{part}.' for part in reversed(parts))
+
+
 class UserSerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailsField()
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'first_name', 'last_name', 'email']
+        fields = ['id', 'username', 'first_name', 'last_name', 'email', 'thumbnails']
 
 
 class CourseDocumentSerializer(serializers.ModelSerializer):
     uploaded_by = UserSerializer(read_only=True)
+    thumbnails = ThumbnailsField()
     
     class Meta:
         model = CourseDocument
-        fields = ['id', 'title', 'document_type', 'file', 'description', 
+        fields = ['id', 'title', 'document_type', 'file', 'thumbnails', 'description', 
                   'uploaded_by', 'uploaded_at', 'updated_at']
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     documents = CourseDocumentSerializer(many=True, read_only=True)
     department_name = serializers.CharField(source='department.name', read_only=True)
-    
+    expandable_fields = ('documents',)
+
     class Meta:
         model = Course
         fields = ['id', 'title', 'module_code', 'department', 'department_name',
                   'description', 'icon_name', 'color_code', 'documents',
-                  'created_at', 'updated_at']
+                  'active_document_count', 'active_note_count', 'active_enrollment_count',
+                  'total_file_size', 'created_at', 'updated_at']
 
 
-class DepartmentSerializer(serializers.ModelSerializer):
+class DepartmentSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     courses = CourseSerializer(many=True, read_only=True)
-    
+    thumbnails = ThumbnailsField()
+    expandable_fields = ('courses',)
+
     class Meta:
         model = Department
-        fields = ['id', 'name', 'code', 'description', 'logo', 
-                  'courses', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'code', 'description', 'logo', 'thumbnails',
+                  'courses', 'course_count', 'active_document_count', 'active_note_count',
+                  'active_enrollment_count', 'total_file_size', 'created_at', 'updated_at']
         
 class CourseNoteSerializer(serializers.ModelSerializer):
     course_title = serializers.CharField(source='course.title', read_only=True)
@@ -54,10 +99,107 @@ class CourseNoteSerializer(serializers.ModelSerializer):
 
 
 
+class DocumentSummarySerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailsField()
+
+    class Meta:
+        model = CourseDocument
+        fields = ['id', 'title', 'document_type', 'file', 'thumbnails', 'uploaded_at']
+
+
+class NoteSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CourseNote
+        fields = ['id', 'title', 'category', 'difficulty_level', 'created_at']
+
+
+class DepartmentSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Department
+        fields = ['id', 'name', 'code']
+
+
+class DashboardCourseSerializer(serializers.ModelSerializer):
+    """
+    One enrolled course on the student dashboard. Expects ``enrolled_at``,
+    ``latest_document`` and ``latest_note`` to be attached by the view.
+    """
+    department = DepartmentSummarySerializer(read_only=True)
+    enrolled_at = serializers.DateTimeField(read_only=True)
+    latest_document = DocumentSummarySerializer(read_only=True, allow_null=True)
+    latest_note = NoteSummarySerializer(read_only=True, allow_null=True)
+
+    class Meta:
+        model = Course
+        fields = ['id', 'title', 'module_code', 'icon_name', 'color_code', 'department',
+                  'active_document_count', 'active_note_count', 'active_enrollment_count',
+                  'enrolled_at', 'latest_document', 'latest_note']
+
+
 class StudentCourseEnrollmentSerializer(serializers.ModelSerializer):
     student = UserSerializer(read_only=True)
     course = CourseSerializer(read_only=True)
     
     class Meta:
         model = StudentCourseEnrollment
-        fields = ['id', 'student', 'course', 'enrolled_at', 'is_active']
\ No newline at end of file
+        fields = ['id', 'student', 'course', 'enrolled_at', 'is_active']
+
+class IdentifierField(serializers.Field):
+    """A numeric id or a non-empty string such as an email or module code"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not isinstance(data, (int, str)):
+            raise serializers.ValidationError("Expected an id or a string identifier")
+        if isinstance(data, str):
+            data = data.strip()
+            if not data:
+                raise serializers.ValidationError("Identifiers may not be blank")
+        return data
+
+    def to_representation(self, value):
+        return value
+
+
+class BulkEnrollmentSerializer(serializers.Serializer):
+    """Every student (user id, email or student id) in every course (id or module code)"""
+    students = serializers.ListField(child=IdentifierField(), allow_empty=False)
+    courses = serializers.ListField(child=IdentifierField(), allow_empty=False)
+
+    def validate(self, attrs):
+        pairs = len(set(attrs['students'])) * len(set(attrs['courses']))
+        if pairs > settings.BULK_ENROLLMENT_MAX_PAIRS:
+            raise serializers.ValidationError(
+                f"At most {settings.BULK_ENROLLMENT_MAX_PAIRS} enrollments per request, got {pairs}"
+            )
+        return attrs
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'course', 'title', 'description', 'filename', 'total_size',
+                  'received_bytes', 'expected_sha256', 'sha256', 'status', 'document',
+                  'created_at', 'expires_at']
+        read_only_fields = ['received_bytes', 'sha256', 'status', 'document',
+                            'created_at', 'expires_at']
+
+    def validate_filename(self, value):
+        name = os.path.basename(value)
+        extension = os.path.splitext(name)[1].lstrip('.').lower()
+        if extension not in settings.ALLOWED_DOCUMENT_EXTENSIONS:
+            raise serializers.ValidationError(f"Files of type '{extension}' are not allowed")
+        return name
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("File must not be empty")
+        if value > settings.MAX_DOCUMENT_SIZE:
+            raise serializers.ValidationError(
+                f"Files may be at most {settings.MAX_DOCUMENT_SIZE} bytes"
+            )
+        return value
+
+    def validate_expected_sha256(self, value):
+        value = value.lower()
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value)):
+            raise serializers.ValidationError("Expected a hex encoded SHA-256 digest")
+        return value
@@ -0,0 +1,167 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from uniSchooling import renditions
+
+from . import blobs, cache, catalog, counters, extraction, search
+from .models import Course, CourseDocument, CourseNote, Department, StudentCourseEnrollment
+
+
+@receiver(post_save, sender=CourseNote)
+@receiver(post_save, sender=CourseDocument)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    """Keep the search index in step with note/document edits"""
+    if raw:
+        return
+    search.index_instance(instance)
+
+
+@receiver(post_delete, sender=CourseNote)
+@receiver(post_delete, sender=CourseDocument)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_instance(instance)
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=Course)
+def rebuild_catalog_snapshot(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    catalog.schedule_rebuild()
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=CourseDocument)
+@receiver(post_delete, sender=Department)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=CourseDocument)
+def invalidate_catalog_responses(sender, raw=False, **kwargs):
+    if raw:
+        return
+    # Notes embed their course title
+    namespaces = (cache.CATALOG, cache.NOTES) if sender is Course else (cache.CATALOG,)
+    transaction.on_commit(lambda: cache.invalidate(*namespaces))
+
+
+@receiver(post_save, sender=CourseNote)
+@receiver(post_delete, sender=CourseNote)
+def invalidate_note_responses(sender, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(lambda: cache.invalidate(cache.NOTES))
+
+
+@receiver(pre_save, sender=CourseDocument)
+@receiver(pre_save, sender=CourseNote)
+@receiver(pre_save, sender=StudentCourseEnrollment)
+def remember_counter_contribution(sender, instance, raw=False, **kwargs):
+    """Capture what the stored row contributed before it is overwritten"""
+    instance._counter_previous = None
+    if raw or counters.is_suspended() or instance.pk is None:
+        return
+    previous = sender.objects.filter(pk=instance.pk).first()
+    if previous is not None:
+        instance._counter_previous = (previous.course_id, counters.contribution(previous))
+
+
+@receiver(post_save, sender=CourseDocument)
+@receiver(post_save, sender=CourseNote)
+@receiver(post_save, sender=StudentCourseEnrollment)
+def update_course_counters(sender, instance, raw=False, **kwargs):
+    if raw or counters.is_suspended():
+        return
+    previous_course_id, previous = getattr(instance, '_counter_previous', None) or (None, {})
+    counters.apply_change(
+        instance.course_id,
+        previous,
+        counters.contribution(instance),
+        old_course_id=previous_course_id,
+    )
+
+
+@receiver(post_delete, sender=CourseDocument)
+@receiver(post_delete, sender=CourseNote)
+@receiver(post_delete, sender=StudentCourseEnrollment)
+def remove_course_counters(sender, instance, **kwargs):
+    if counters.is_suspended():
+        return
+    counters.apply_delta(instance.course_id, counters.contribution(instance), sign=-1)
+
+
+@receiver(pre_save, sender=Course)
+def remember_course_department(sender, instance, raw=False, **kwargs):
+    instance._previous_department_id = None
+    if not raw and instance.pk is not None:
+        instance._previous_department_id = (
+            Course.objects.filter(pk=instance.pk).values_list('department_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Course)
+def update_department_counters(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_department_id', None)
+    if created or previous != instance.department_id:
+        counters.refresh_departments({instance.department_id, previous} - {None})
+
+
+@receiver(post_delete, sender=Course)
+def remove_department_course(sender, instance, **kwargs):
+    # Documents, notes and enrollments were already removed by the cascade
+    counters.refresh_departments([instance.department_id])
+
+
+@receiver(pre_save, sender=CourseDocument)
+def remember_document_blob(sender, instance, raw=False, **kwargs):
+    instance._previous_content_hash = None
+    if not raw and instance.pk is not None:
+        instance._previous_content_hash = (
+            CourseDocument.objects.filter(pk=instance.pk).values_list('content_hash', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=CourseDocument)
+def update_blob_references(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_content_hash', None)
+    if instance.content_hash != previous:
+        blobs.acquire(instance.content_hash, instance.file.name, instance.file_size)
+        blobs.release(previous)
+
+
+@receiver(post_delete, sender=CourseDocument)
+def release_blob_reference(sender, instance, **kwargs):
+    blobs.release(instance.content_hash)
+
+
+@receiver(post_save, sender=Department)
+def schedule_logo_renditions(sender, instance, raw=False, **kwargs):
+    if not raw and renditions.needs_renditions(instance, 'logo'):
+        renditions.schedule(instance, 'logo')
+
+
+@receiver(post_save, sender=CourseDocument)
+def schedule_document_renditions(sender, instance, raw=False, **kwargs):
+    if not raw and renditions.needs_renditions(instance, 'file'):
+        renditions.schedule(instance, 'file', digest=instance.content_hash or None)
+
+
+@receiver(post_save, sender=CourseDocument)
+def schedule_text_extraction(sender, instance, raw=False, **kwargs):
+    if not raw and extraction.needs_extraction(instance):
+        extraction.extract_document.enqueue(instance.pk)
+
+
+@receiver(renditions.renditions_ready, sender=Department)
+@receiver(renditions.renditions_ready, sender=CourseDocument)
+def publish_renditions(sender, **kwargs):
+    # Renditions are recorded with a queryset update, which sends no post_save
+    if sender is Department:
+        catalog.schedule_rebuild()
+    transaction.on_commit(lambda: cache.invalidate(cache.CATALOG))
@@ -0,0 +1,108 @@
+"""
+Content-addressed storage for course documents.
+
+Files are stored once under their SHA-256, sharded by hash prefix
+(``blobs/ab/cd/abcd....pdf``), so the same syllabus uploaded to several
+courses takes disk space once. Saving content that already exists links to
+the stored blob instead of writing it again, under the blob's row lock so
+its last reference can't be dropped and the file unlinked in between. Reference counts live in
+``StoredBlob`` and are maintained by ``academics.blobs``.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+
+BLOB_PREFIX = 'blobs'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+BLOB_NAME_RE = re.compile(rf'^{BLOB_PREFIX}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/(?P<digest>[0-9a-f]{{64}})(\.\w+)?$')
+
+
+def hash_content(content):
+    """SHA-256 hex digest of a Django ``File``, read in chunks"""
+    hasher = hashlib.sha256()
+    for chunk in content.chunks(HASH_BLOCK_SIZE):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def hash_path(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(HASH_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def blob_name(digest, filename=''):
+    """Storage name for content with ``digest``, keeping ``filename``'s extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def digest_of(name):
+    """The SHA-256 encoded in a blob name, or ``None`` for other names"""
+    match = BLOB_NAME_RE.match(name or '')
+    return match.group('digest') if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    ``FileSystemStorage`` that ignores the requested name and stores content
+    under its hash. Writes go through a temporary file and an atomic rename,
+    so concurrent uploads of the same content are harmless.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from the content, there's nothing to make unique
+        return name
+
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        # Callers that already hashed the content (e.g. chunked uploads) say so
+        digest = getattr(content, 'sha256', None) or hash_content(content)
+        name = blob_name(digest, name)
+        with transaction.atomic():
+            # Holding the blob's row lock keeps academics.blobs from unlinking
+            # the file until the caller's transaction, which takes the
+            # reference, commits. CourseDocument.save() stores the file and
+            # acquires it in one transaction.
+            StoredBlob.objects.select_for_update().filter(sha256=digest).first()
+            if not self.exists(name):
+                self._write_blob(name, content)
+        return name
+
+    def _write_blob(self, name, content):
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True, mode=self.directory_permissions_mode or 0o777)
+
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(content.temporary_file_path(), path, allow_overwrite=True)
+        else:
+            descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.incoming-')
+            try:
+                with os.fdopen(descriptor, 'wb') as target:
+                    for chunk in content.chunks():
+                        target.write(chunk)
+                os.replace(temporary, path)
+            except BaseException:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+
+
+def document_storage():
+    return ContentAddressedStorage()
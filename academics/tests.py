@@ -1,8 +1,33 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from io import BytesIO, StringIO
+import hashlib
+import json
+import os
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Department, Course, CourseDocument, StudentCourseEnrollment
+from .models import Department, Course, CourseDocument, CourseNote, StudentCourseEnrollment, SearchDocument, CatalogSnapshot, UploadSession, StoredBlob, DocumentText
+from . import catalog, enrollments, extraction, search, seeding, uploads
+from .cache import response_cache
+from .serializers import CourseNoteSerializer, DepartmentSerializer
+from uniSchooling import metrics, nplusone, renditions
+from uniSchooling.cache import TieredCache
+from uniSchooling.pagination import encode_cursor
+from users.models import Message, StudentProfile
+from users.tokens import RefreshToken
+from asgiref.sync import iscoroutinefunction
+from django.urls import resolve
 import tempfile
 from PIL import Image
 
@@ -172,4 +197,1306 @@ class APITests(TestCase):
         response = self.client.get('/api/enrollments/my_courses/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['title'], self.course.title)
\ No newline at end of file
+        self.assertEqual(response.data[0]['title'], self.course.title)
+
+class CatalogExpansionTests(TestCase):
+    def setUp(self):
+        uploader = get_user_model().objects.create_user(
+            email="lecturer@example.com",
+            password="testpassword"
+        )
+        for d in range(3):
+            department = Department.objects.create(name=f"Department {d}", code=f"D{d}")
+            for c in range(3):
+                course = Course.objects.create(
+                    title=f"Course {d}-{c}",
+                    module_code=f"D{d}-{c}",
+                    department=department
+                )
+                for n in range(2):
+                    CourseDocument.objects.create(
+                        title=f"Document {n}",
+                        course=course,
+                        document_type="pdf",
+                        uploaded_by=uploader
+                    )
+        cache.clear()
+        self.client = APIClient()
+
+    def test_default_departments_skip_documents(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/academics/departments/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data[0]['courses']), 3)
+        self.assertNotIn('documents', response.data[0]['courses'][0])
+
+    def test_full_tree_uses_constant_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/academics/departments/?depth=2')
+        course = response.data[0]['courses'][0]
+        self.assertEqual(len(course['documents']), 2)
+        self.assertEqual(course['documents'][0]['uploaded_by']['email'], "lecturer@example.com")
+
+    def test_expand_implies_parents(self):
+        response = self.client.get('/api/academics/departments/?expand=courses.documents')
+        self.assertIn('documents', response.data[0]['courses'][0])
+
+    def test_departments_depth_zero(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/academics/departments/?depth=0')
+        self.assertNotIn('courses', response.data[0])
+
+    def test_courses_shallow_by_default(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/academics/courses/')
+        self.assertEqual(len(response.data), 9)
+        self.assertNotIn('documents', response.data[0])
+        self.assertEqual(response.data[0]['department_name'], "Department 0")
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/academics/courses/?expand=documents')
+        self.assertEqual(len(response.data[0]['documents']), 2)
+
+    def test_unknown_expansion_rejected(self):
+        response = self.client.get('/api/academics/courses/?expand=notes')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="student@example.com",
+            password="testpassword"
+        )
+        department = Department.objects.create(name="Test Department", code="TEST")
+        self.course = Course.objects.create(title="Test Course", module_code="TST-101", department=department)
+        # Many notes share the same ``order`` so the cursor has to break ties
+        for i in range(7):
+            CourseNote.objects.create(
+                title=f"Note {i}",
+                course=self.course,
+                content="content",
+                order=i % 2,
+                is_featured=True
+            )
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def collect(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(note['id'] for note in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    def test_pages_cover_every_row_once_in_order(self):
+        expected = list(
+            CourseNote.objects.order_by('order', '-created_at', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(self.collect('/api/academics/notes/?page_size=3'), expected)
+        self.assertEqual(self.collect('/api/academics/notes/featured/?page_size=2'), expected)
+
+    def test_previous_link_returns_to_prior_page(self):
+        first = self.client.get('/api/academics/notes/?page_size=3')
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [note['id'] for note in back.data['results']],
+            [note['id'] for note in first.data['results']]
+        )
+        self.assertIsNone(first.data['previous'])
+
+    def test_page_size_is_capped(self):
+        with self.settings(API_MAX_PAGE_SIZE=4):
+            response = self.client.get('/api/academics/notes/?page_size=1000')
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_no_count_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/academics/notes/?page_size=3')
+        self.assertFalse([q for q in queries.captured_queries if 'COUNT(' in q['sql'].upper()])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/academics/notes/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_wrongly_typed_values(self):
+        for position in (["garbage", timezone.now().isoformat(), 1], [{"a": 1}, "yesterday", 1]):
+            response = self.client.get(f'/api/academics/notes/?cursor={encode_cursor(position)}')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(
+            f'/api/academics/documents/?course={self.course.pk}&cursor={encode_cursor(["garbage", 1])}'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="student@example.com",
+            password="testpassword"
+        )
+        department = Department.objects.create(name="Technology", code="TECH")
+        self.course = Course.objects.create(title="Information Technology", module_code="IT-301", department=department)
+        self.other_course = Course.objects.create(title="Computer Science", module_code="CS-301", department=department)
+        self.loops = CourseNote.objects.create(
+            title="Python loops",
+            course=self.course,
+            content="Loops repeat code. A for loop iterates over a sequence.",
+            tags="python, loops",
+            difficulty_level="beginner"
+        )
+        self.sorting = CourseNote.objects.create(
+            title="Sorting algorithms",
+            course=self.other_course,
+            content="Quick sort and merge sort are divide and conquer algorithms. Sorting loops are nested.",
+            difficulty_level="advanced"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_stemmed_matches_ranked(self):
+        response = self.client.get('/api/academics/search/?q=looping')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [result['item']['id'] for result in response.data['results']]
+        self.assertEqual(ids, [self.loops.id, self.sorting.id])
+
+    def test_scores_are_summed_and_cut_off_in_the_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            hits = search.search("looping", limit=1)
+        self.assertEqual([hit[1] for hit in hits], [self.loops.id])
+        self.assertGreater(hits[0][2], 0)
+        self.assertIn('LIMIT 1', queries.captured_queries[-1]['sql'])
+
+    def test_filters(self):
+        response = self.client.get(f'/api/academics/search/?q=loops&course={self.other_course.id}')
+        self.assertEqual([r['item']['id'] for r in response.data['results']], [self.sorting.id])
+        response = self.client.get('/api/academics/search/?q=loops&difficulty=beginner')
+        self.assertEqual([r['item']['id'] for r in response.data['results']], [self.loops.id])
+
+    def test_document_search_is_ranked_and_paged(self):
+        for title in ("Routing and routing protocols", "Routing tables", "Exam timetable"):
+            CourseDocument.objects.create(title=title, course=self.course, document_type="pdf")
+        url = f'/api/academics/documents/?course={self.course.id}&search=routing&page_size=1'
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            titles += [document['title'] for document in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(titles, ["Routing and routing protocols", "Routing tables"])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.loops.content = "While statements"
+        self.loops.title = "While"
+        self.loops.tags = ""
+        self.loops.save()
+        self.assertEqual([hit[1] for hit in search.search("loops")], [self.sorting.id])
+
+        self.sorting.is_active = False
+        self.sorting.save()
+        self.assertEqual(search.search("loops"), [])
+        self.assertEqual(len(search.search("loops", active_only=False)), 1)
+
+        self.sorting.delete()
+        self.assertFalse(SearchDocument.objects.filter(kind='note', object_id=self.sorting.id).exists())
+
+    def test_rebuild_command(self):
+        SearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(search.search("sorting")), 1)
+
+    def test_stemmer(self):
+        self.assertEqual(search.stem("connections"), "connect")
+        self.assertEqual(search.stem("relational"), "relat")
+        self.assertEqual(search.analyze("The Running dogs"), ["run", "dog"])
+
+
+class CatalogSnapshotTests(TransactionTestCase):
+    def setUp(self):
+        catalog._current = None
+        cache.clear()
+        with transaction.atomic():
+            department = Department.objects.create(name="Technology", code="TECH")
+            Course.objects.create(
+                title="Computer Science",
+                module_code="CS-301",
+                department=department,
+                icon_name="code_outlined",
+                color_code="#3949AB"
+            )
+        self.department = department
+        self.client = APIClient()
+
+    def test_single_rebuild_per_transaction(self):
+        self.assertEqual(CatalogSnapshot.objects.count(), 1)
+
+    def test_snapshot_served_without_queries(self):
+        self.client.get('/api/academics/catalog/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/academics/catalog/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = json.loads(response.content)
+        course = body['departments'][0]['courses'][0]
+        self.assertEqual(course['icon_name'], "code_outlined")
+        self.assertEqual(course['color_code'], "#3949AB")
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/academics/catalog/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_changes_bump_version(self):
+        first = self.client.get('/api/academics/catalog/')
+        Course.objects.create(title="Information Technology", module_code="IT-301", department=self.department)
+        second = self.client.get('/api/academics/catalog/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertGreater(int(second['X-Catalog-Version']), int(first['X-Catalog-Version']))
+        self.assertEqual(len(json.loads(second.content)['departments'][0]['courses']), 2)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="student@example.com",
+            password="testpassword"
+        )
+        department = Department.objects.create(name="Technology", code="TECH")
+        self.course = Course.objects.create(title="Computer Science", module_code="CS-301", department=department)
+        self.note = CourseNote.objects.create(title="Big O", course=self.course, content="complexity", is_featured=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_repeat_reads_skip_the_database(self):
+        first = self.client.get('/api/academics/courses/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/academics/courses/')
+        self.assertEqual(first.data, second.data)
+
+        # Different query params are cached separately
+        with self.assertNumQueries(1):
+            self.client.get('/api/academics/courses/?department_code=TECH')
+
+    def test_role_is_part_of_the_key(self):
+        self.client.get('/api/academics/departments/')
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(2):
+            self.client.get('/api/academics/departments/')
+
+    def test_model_changes_invalidate(self):
+        self.client.get('/api/academics/notes/featured/')
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseNote.objects.create(title="Recursion", course=self.course, content="calls", is_featured=True)
+        response = self.client.get('/api/academics/notes/featured/')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_errors_are_not_cached(self):
+        cached_entries = len(response_cache.local)
+        response = self.client.get('/api/academics/notes/by_course/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response_cache.local), cached_entries)
+
+    def test_concurrent_misses_compute_once(self):
+        tiered = TieredCache(prefix='test-single-flight')
+        calls = []
+        started = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(tiered.get_or_set('key', compute)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 8)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="student@example.com",
+            password="testpassword"
+        )
+        self.department = Department.objects.create(name="Technology", code="TECH")
+        self.course = Course.objects.create(title="Computer Science", module_code="CS-301", department=self.department)
+        self.other = Course.objects.create(title="Information Technology", module_code="IT-301", department=self.department)
+
+    def assertCounters(self, obj, **expected):
+        obj.refresh_from_db()
+        for field, value in expected.items():
+            self.assertEqual(getattr(obj, field), value, field)
+
+    def test_single_row_changes(self):
+        document = CourseDocument.objects.create(title="Syllabus", course=self.course, document_type="pdf")
+        document.file_size = 2048
+        document.save()
+        CourseNote.objects.create(title="Intro", course=self.course, content="text")
+        enrollment = StudentCourseEnrollment.objects.create(student=self.user, course=self.course)
+        self.assertCounters(self.course, active_document_count=1, active_note_count=1,
+                            active_enrollment_count=1, total_file_size=2048)
+        self.assertCounters(self.department, course_count=2, active_document_count=1, total_file_size=2048)
+
+        enrollment.is_active = False
+        enrollment.save()
+        document.course = self.other
+        document.save()
+        self.assertCounters(self.course, active_enrollment_count=0, active_document_count=0, total_file_size=0)
+        self.assertCounters(self.other, active_document_count=1, total_file_size=2048)
+
+        document.delete()
+        self.assertCounters(self.other, active_document_count=0, total_file_size=0)
+        self.assertCounters(self.department, active_document_count=0, active_note_count=1)
+
+    def test_bulk_operations(self):
+        CourseNote.objects.bulk_create([
+            CourseNote(title=f"Note {i}", course=self.course, content="text") for i in range(5)
+        ])
+        self.assertCounters(self.course, active_note_count=5)
+
+        CourseNote.objects.filter(title__in=["Note 0", "Note 1"]).update(is_active=False)
+        self.assertCounters(self.course, active_note_count=3)
+        self.assertCounters(self.department, active_note_count=3)
+
+        CourseNote.objects.filter(is_active=True).delete()
+        self.assertCounters(self.course, active_note_count=0)
+
+    def test_course_deletion_updates_department(self):
+        CourseNote.objects.create(title="Intro", course=self.course, content="text")
+        self.course.delete()
+        self.assertCounters(self.department, course_count=1, active_note_count=0)
+
+    def test_reconcile_command(self):
+        CourseNote.objects.create(title="Intro", course=self.course, content="text")
+        Course.objects.filter(pk=self.course.pk).update(active_note_count=40)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertCounters(self.course, active_note_count=1)
+        self.assertIn("1 courses had drifted", out.getvalue())
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="student@example.com",
+            password="testpassword"
+        )
+        self.department = Department.objects.create(name="Technology", code="TECH")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def enroll_in(self, count):
+        for i in range(count):
+            course = Course.objects.create(
+                title=f"Course {i}",
+                module_code=f"C-{self.department.courses.count()}",
+                department=self.department
+            )
+            CourseDocument.objects.create(title="Old slides", course=course, document_type="pdf")
+            CourseDocument.objects.create(title="New slides", course=course, document_type="pdf")
+            CourseNote.objects.create(title="Week 1", course=course, content="text")
+            StudentCourseEnrollment.objects.create(student=self.user, course=course)
+
+    def test_constant_queries(self):
+        self.enroll_in(2)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/academics/enrollments/dashboard/')
+        self.assertEqual(len(response.data), 2)
+
+        self.enroll_in(6)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/academics/enrollments/dashboard/')
+        self.assertEqual(len(response.data), 8)
+
+        course = response.data[0]
+        self.assertEqual(course['department']['code'], "TECH")
+        self.assertEqual(course['active_document_count'], 2)
+        self.assertEqual(course['latest_document']['title'], "New slides")
+        self.assertEqual(course['latest_note']['title'], "Week 1")
+
+    def test_my_courses_constant_queries(self):
+        self.enroll_in(4)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/academics/enrollments/my_courses/')
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(len(response.data[0]['documents']), 2)
+
+
+class UploadSessionTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmp.name, 'media'),
+            CHUNKED_UPLOAD_DIR=os.path.join(self.tmp.name, 'sessions'),
+            CHUNKED_UPLOAD_MAX_CHUNK_SIZE=1024,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = get_user_model().objects.create_user(
+            email="uploader@example.com",
+            password="testpassword"
+        )
+        department = Department.objects.create(name="Technology", code="TECH")
+        self.course = Course.objects.create(title="Networks", module_code="NET101", department=department)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.content = os.urandom(2500)
+
+    def start(self, **extra):
+        data = {
+            'course': self.course.pk,
+            'title': "Lecture recording notes",
+            'filename': "notes.pdf",
+            'total_size': len(self.content),
+        }
+        data.update(extra)
+        response = self.client.post('/api/academics/uploads/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return response.data['id']
+
+    def put(self, session_id, offset, chunk):
+        return self.client.put(
+            f'/api/academics/uploads/{session_id}/', chunk,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def send_all(self, session_id, start=0):
+        for offset in range(start, len(self.content), 1000):
+            response = self.put(session_id, offset, self.content[offset:offset + 1000])
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return response
+
+    def test_chunked_upload_creates_document(self):
+        session_id = self.start(expected_sha256=hashlib.sha256(self.content).hexdigest())
+        response = self.send_all(session_id)
+        self.assertEqual(response['Upload-Offset'], str(len(self.content)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/academics/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        document = CourseDocument.objects.get(pk=response.data['id'])
+        self.assertEqual(document.document_type, 'pdf')
+        self.assertEqual(document.file_size, len(self.content))
+        self.assertEqual(document.uploaded_by, self.user)
+        with document.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertFalse(os.listdir(os.path.join(self.tmp.name, 'sessions')))
+
+        # Finalizing twice is harmless
+        response = self.client.post(f'/api/academics/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(CourseDocument.objects.count(), 1)
+
+    def test_resume_after_interruption(self):
+        session_id = self.start()
+        self.put(session_id, 0, self.content[:1000])
+
+        # A retry of an old chunk is rejected with the offset to resume from
+        response = self.put(session_id, 0, self.content[:1000])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Upload-Offset'], '1000')
+
+        # The hasher state is lost, e.g. the next chunk lands on another worker
+        uploads._hashers.clear()
+        response = self.client.get(f'/api/academics/uploads/{session_id}/')
+        self.send_all(session_id, start=response.data['received_bytes'])
+
+        response = self.client.post(f'/api/academics/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        session = UploadSession.objects.get(pk=session_id)
+        self.assertEqual(session.sha256, hashlib.sha256(self.content).hexdigest())
+
+    def test_finalize_rolled_back_can_be_retried(self):
+        session_id = self.start()
+        self.send_all(session_id)
+
+        class Abort(Exception):
+            pass
+
+        with self.assertRaises(Abort), transaction.atomic():
+            uploads.finalize(session_id, self.user)
+            raise Abort
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, 'pending')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/academics/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with CourseDocument.objects.get().file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertFalse(os.listdir(os.path.join(self.tmp.name, 'sessions')))
+
+    def test_rejects_bad_uploads(self):
+        response = self.client.post('/api/academics/uploads/', {
+            'course': self.course.pk, 'title': "Virus", 'filename': "setup.exe", 'total_size': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        session_id = self.start()
+        response = self.put(session_id, 0, self.content[:2000])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(f'/api/academics/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        session_id = self.start(expected_sha256='0' * 64)
+        self.send_all(session_id)
+        response = self.client.post(f'/api/academics/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CourseDocument.objects.exists())
+
+    def test_sessions_are_private_and_expire(self):
+        session_id = self.start()
+        other = get_user_model().objects.create_user(email="other@example.com", password="testpassword")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/academics/uploads/{session_id}/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(self.user)
+        self.put(session_id, 0, self.content[:1000])
+        UploadSession.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('cleanup_upload_sessions', stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.listdir(os.path.join(self.tmp.name, 'sessions')))
+
+
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(MEDIA_ROOT=self.tmp.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.department = Department.objects.create(name="Technology", code="TECH")
+        self.first = Course.objects.create(title="Networks", module_code="NET101", department=self.department)
+        self.second = Course.objects.create(title="Security", module_code="SEC101", department=self.department)
+
+    def upload(self, course, content=b"%PDF-1.4 the syllabus"):
+        document = CourseDocument(title="Syllabus", course=course)
+        document.file.save("syllabus.pdf", ContentFile(content), save=False)
+        document.save()
+        return document
+
+    def stored_files(self):
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(self.tmp.name) for name in names
+        ]
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload(self.first)
+        second = self.upload(self.second)
+
+        digest = hashlib.sha256(b"%PDF-1.4 the syllabus").hexdigest()
+        self.assertEqual(first.content_hash, digest)
+        self.assertEqual(first.file.name, f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.pdf")
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(first.document_type, 'pdf')
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(StoredBlob.objects.get(sha256=digest).refcount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(StoredBlob.objects.get(sha256=digest).refcount, 1)
+        self.assertEqual(len(self.stored_files()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_uploading_again_before_the_unlink_keeps_the_file(self):
+        first = self.upload(self.first)
+        with self.captureOnCommitCallbacks() as unlinks:
+            first.delete()
+        # The same content arrives before the deleting transaction's unlink runs
+        second = self.upload(self.second)
+        for unlink in unlinks:
+            unlink()
+        self.assertEqual(StoredBlob.objects.get(sha256=second.content_hash).refcount, 1)
+        self.assertTrue(second.file.storage.exists(second.file.name))
+
+    def test_replacing_the_file_moves_the_reference(self):
+        document = self.upload(self.first)
+        old_hash = document.content_hash
+
+        with self.captureOnCommitCallbacks(execute=True):
+            document.file.save("syllabus-v2.pdf", ContentFile(b"%PDF-1.4 revised"), save=False)
+            document.save()
+        self.assertNotEqual(document.content_hash, old_hash)
+        self.assertFalse(StoredBlob.objects.filter(sha256=old_hash).exists())
+        self.assertEqual(StoredBlob.objects.get(sha256=document.content_hash).refcount, 1)
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_dedupe_command_migrates_existing_files(self):
+        legacy = []
+        for course in (self.first, self.second):
+            name = f"course_documents/TECH/{course.module_code}/{course.module_code}_syllabus.pdf"
+            os.makedirs(os.path.join(self.tmp.name, os.path.dirname(name)))
+            with open(os.path.join(self.tmp.name, name), "wb") as handle:
+                handle.write(b"%PDF-1.4 the syllabus")
+            legacy.append(CourseDocument(title="Syllabus", course=course, document_type="pdf", file=name))
+        CourseDocument.objects.bulk_create(legacy)
+
+        out = StringIO()
+        call_command('dedupe_documents', '--workers', '2', '--dry-run', stdout=out)
+        self.assertIn("saving 21 bytes", out.getvalue())
+        self.assertEqual(len(self.stored_files()), 2)
+
+        call_command('dedupe_documents', '--workers', '2', '--batch-size', '1', stdout=StringIO())
+        digest = hashlib.sha256(b"%PDF-1.4 the syllabus").hexdigest()
+        names = set(CourseDocument.objects.values_list('file', flat=True))
+        self.assertEqual(names, {f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.pdf"})
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(StoredBlob.objects.get(sha256=digest).refcount, 2)
+
+
+class DocumentDownloadTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(MEDIA_ROOT=self.tmp.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        department = Department.objects.create(name="Technology", code="TECH")
+        self.course = Course.objects.create(title="Networks", module_code="NET101", department=department)
+        self.content = bytes(range(256)) * 40
+        self.document = CourseDocument(title="Lecture Slides", course=self.course)
+        self.document.file.save("slides.pdf", ContentFile(self.content), save=False)
+        self.document.save()
+
+        self.student = get_user_model().objects.create_user(email="student@example.com", password="testpassword")
+        StudentCourseEnrollment.objects.create(student=self.student, course=self.course)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        self.url = f'/api/academics/documents/{self.document.pk}/download/'
+
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response['ETag'], f'"{self.document.content_hash}"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('lecture-slides.pdf', response['Content-Disposition'])
+        self.assertIn('Last-Modified', response)
+
+    def test_missing_file(self):
+        self.document.file.storage.delete(self.document.file.name)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-1999')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(self.content)}')
+        self.assertEqual(b"".join(response.streaming_content), self.content[1000:2000])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-100')
+        self.assertEqual(b"".join(response.streaming_content), self.content[-100:])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=9000-',
+                                   HTTP_IF_RANGE=f'"{self.document.content_hash}"')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b"".join(response.streaming_content), self.content[9000:])
+
+        # The file changed since the client's partial copy: send it all again
+        response = self.client.get(self.url, HTTP_RANGE='bytes=9000-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response.close()
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.document.content_hash}"')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(DOCUMENT_DOWNLOAD_BACKEND='nginx')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.document.file.name}')
+        self.assertEqual(response.content, b"")
+
+    def test_access(self):
+        outsider = get_user_model().objects.create_user(email="outsider@example.com", password="testpassword")
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(self.student)
+        CourseDocument.objects.filter(pk=self.document.pk).update(is_active=False)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(None)
+        self.assertIn(self.client.get(self.url).status_code,
+                      (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+
+@override_settings(JOBS_EAGER=True)
+class RenditionTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(MEDIA_ROOT=self.tmp.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.department = Department.objects.create(name="Technology", code="TECH")
+        self.course = Course.objects.create(title="Networks", module_code="NET101", department=self.department)
+
+    def photo(self, size=(1600, 1200)):
+        image = Image.new("RGB", size, (200, 30, 30))
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        buffer = BytesIO()
+        image.save(buffer, "JPEG", exif=exif)
+        return buffer.getvalue()
+
+    def test_render_buckets_and_strips_exif(self):
+        rendered = renditions.render(self.photo())
+        self.assertEqual(set(rendered), {'small', 'medium'})
+        with Image.open(BytesIO(rendered['small'])) as small:
+            self.assertEqual(small.format, "WEBP")
+            self.assertEqual(small.size, (160, 120))
+            self.assertFalse(small.getexif())
+        with Image.open(BytesIO(rendered['medium'])) as medium:
+            self.assertEqual(medium.size, (480, 360))
+
+        # Small images are not scaled up
+        with Image.open(BytesIO(renditions.render(self.photo((100, 50)))['medium'])) as tiny:
+            self.assertEqual(tiny.size, (100, 50))
+
+    def test_image_document_gets_thumbnails(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = CourseDocument(title="Diagram", course=self.course)
+            document.file.save("diagram.jpg", ContentFile(self.photo()), save=False)
+            document.save()
+        document.refresh_from_db()
+        self.assertEqual(document.renditions['sha256'], document.content_hash)
+
+        user = get_user_model().objects.create_user(email="student@example.com", password="testpassword")
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(f'/api/academics/documents/?course={self.course.pk}')
+        thumbnails = response.data['results'][0]['thumbnails']
+        self.assertTrue(thumbnails['small'].endswith(f"{document.content_hash}/small.webp"))
+        self.assertIn('medium', thumbnails)
+
+        # Same image on another document: cached by hash, nothing rendered again
+        with self.captureOnCommitCallbacks(execute=True):
+            copy = CourseDocument(title="Diagram copy", course=self.course)
+            copy.file.save("diagram.jpg", ContentFile(self.photo()), save=False)
+            copy.save()
+        copy.refresh_from_db()
+        self.assertEqual(copy.renditions['small'], document.renditions['small'])
+
+    def test_non_images_have_no_thumbnails(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = CourseDocument(title="Notes", course=self.course)
+            document.file.save("notes.pdf", ContentFile(b"%PDF-1.4"), save=False)
+            document.save()
+        document.refresh_from_db()
+        self.assertEqual(document.renditions, {})
+
+    def test_decompression_bombs_are_skipped(self):
+        document = CourseDocument(title="Huge", course=self.course)
+        document.file.save("huge.jpg", ContentFile(self.photo()), save=False)
+        document.save()
+        limit = Image.MAX_IMAGE_PIXELS
+        self.addCleanup(setattr, Image, 'MAX_IMAGE_PIXELS', limit)
+        # Twice the limit is an error rather than a warning
+        Image.MAX_IMAGE_PIXELS = 1600 * 1200 // 3
+        self.assertIsNone(renditions.generate('academics.CourseDocument', document.pk, 'file'))
+        document.refresh_from_db()
+        self.assertEqual(document.renditions, {})
+
+    def test_department_logo_and_replacement(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.department.logo.save("logo.png", ContentFile(self.photo((300, 300))))
+        self.department.refresh_from_db()
+        first = self.department.renditions['sha256']
+        self.assertEqual(DepartmentSerializer(self.department).data['thumbnails']['small'],
+                         f"/media/renditions/{first[:2]}/{first}/small.webp")
+
+        # A new logo drops the old thumbnails straight away
+        self.department.logo.save("logo2.png", ContentFile(self.photo((400, 100))))
+        self.department.refresh_from_db()
+        self.assertEqual(self.department.renditions, {})
+
+
+def ooxml(parts):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in parts.items():
+            archive.writestr(name, xml)
+    return buffer.getvalue()
+
+
+WORD = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+DRAWING = 'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+SHEET = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+
+
+def slide(text):
+    return f'<p:sld {DRAWING} xmlns:p="p"><a:p><a:r><a:t>{text}</a:t></a:r></a:p></p:sld>'
+
+
+@override_settings(JOBS_EAGER=True, EXTRACTION_PROCESSES=0)
+class TextExtractionTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(MEDIA_ROOT=self.tmp.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        department = Department.objects.create(name="Technology", code="TECH")
+        self.course = Course.objects.create(title="Networks", module_code="NET101", department=department)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as handle:
+            handle.write(content)
+        return path
+
+    def upload(self, title, filename, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = CourseDocument(title=title, course=self.course)
+            document.file.save(filename, ContentFile(content), save=False)
+            document.save()
+        return document
+
+    def test_docx_pages(self):
+        path = self.write("a.docx", ooxml({"word/document.xml": (
+            f'<w:document {WORD}><w:body>'
+            '<w:p><w:r><w:t>Routing tables</w:t></w:r></w:p>'
+            '<w:p><w:r><w:br w:type="page"/><w:t>Subnet</w:t><w:tab/><w:t>masks</w:t></w:r></w:p>'
+            '</w:body></w:document>'
+        )}))
+        text, segments = extraction.extract(path, "docx")
+        self.assertEqual(text, "Routing tables\nSubnet\tmasks\n")
+        self.assertEqual(segments, [{"label": "Page 1", "start": 0}, {"label": "Page 2", "start": 15}])
+
+    def test_pptx_slides_in_order(self):
+        parts = {f"ppt/slides/slide{n}.xml": slide(f"Topic {n}") for n in (1, 2, 10)}
+        text, segments = extraction.extract(self.write("a.pptx", ooxml(parts)), "pptx")
+        self.assertEqual([s["label"] for s in segments], ["Slide 1", "Slide 2", "Slide 3"])
+        self.assertTrue(text[segments[2]["start"]:].startswith("Topic 10"))
+
+    def test_xlsx_shared_and_inline_strings(self):
+        path = self.write("a.xlsx", ooxml({
+            "xl/sharedStrings.xml": f'<sst {SHEET}><si><t>Latency</t></si><si><t>Jitter</t></si></sst>',
+            "xl/worksheets/sheet1.xml": (
+                f'<worksheet {SHEET}><sheetData>'
+                '<row><c t="s"><v>0</v></c><c><v>42</v></c><c t="s"><v>1</v></c></row>'
+                '<row><c t="inlineStr"><is><t>Throughput</t></is></c></row>'
+                '</sheetData></worksheet>'
+            ),
+        }))
+        text, segments = extraction.extract(path, "xlsx")
+        self.assertEqual(text, "Latency Jitter\nThroughput\n")
+        self.assertEqual(segments, [{"label": "Sheet 1", "start": 0}])
+
+    def test_text_limit_and_form_feeds(self):
+        path = self.write("a.txt", "first page\fsecond page".encode() * 1000)
+        text, segments = extraction.extract(path, "txt", limit=100)
+        self.assertEqual(len(text), 100)
+        self.assertEqual(segments[1], {"label": "Page 2", "start": 11})
+
+    def test_upload_is_extracted_and_searchable(self):
+        document = self.upload("Week 3", "week3.pptx", ooxml({
+            "ppt/slides/slide1.xml": slide("Introduction"),
+            "ppt/slides/slide2.xml": slide("Dijkstra shortest paths"),
+        }))
+        self.assertEqual(DocumentText.objects.get(document=document).content_hash, document.content_hash)
+        hits = search.search("dijkstra")
+        self.assertEqual(hits[0][:2], ("document", document.pk))
+
+        user = get_user_model().objects.create_user(email="student@example.com", password="testpassword")
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/academics/search/', {'q': 'shortest path'})
+        location = response.data['results'][0]['location']
+        self.assertEqual(location['label'], "Slide 2")
+        self.assertIn("Dijkstra shortest paths", location['snippet'])
+
+    def test_unreadable_file_records_error(self):
+        document = self.upload("Broken", "broken.docx", b"not a zip")
+        self.assertIn("BadZipFile", DocumentText.objects.get(document=document).error)
+
+    def test_encrypted_file_records_error(self):
+        content = bytearray(ooxml({"word/document.xml": f'<w:document {WORD}><w:body/></w:document>'}))
+        start = content.find(b"PK\x01\x02")
+        while start != -1:
+            # The encrypted flag of each central directory entry
+            content[start + 8] |= 1
+            start = content.find(b"PK\x01\x02", start + 1)
+        _, text, segments, error = extraction.extract_safely((1, self.write("locked.docx", bytes(content)), "docx", None))
+        self.assertEqual((text, segments), ('', []))
+        self.assertIn("RuntimeError", error)
+
+    def test_backfill_command(self):
+        documents = []
+        for i in range(3):
+            name = f"legacy{i}.csv"
+            self.write(name, f"topic,notes\nqueueing{i},theory".encode())
+            documents.append(CourseDocument(title=f"Sheet {i}", course=self.course, document_type="csv", file=name))
+        CourseDocument.objects.bulk_create(documents)
+
+        out = StringIO()
+        call_command('extract_document_text', '--processes', '2', '--batch-size', '1', stdout=out)
+        self.assertIn("Extracted text from 3 documents", out.getvalue())
+        self.assertEqual(DocumentText.objects.count(), 3)
+        self.assertEqual(len(search.search("queueing1")), 1)
+
+        out = StringIO()
+        call_command('extract_document_text', stdout=out)
+        self.assertIn("Extracted text from 0 documents", out.getvalue())
+
+
+class BulkEnrollmentTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.staff = User.objects.create_user(email="registrar@example.com", password="testpassword", is_staff=True)
+        self.alice = User.objects.create_user(email="alice@example.com", password="testpassword")
+        self.bob = User.objects.create_user(email="bob@example.com", password="testpassword")
+        StudentProfile.objects.create(user=self.bob, student_id="S1002", enrollment_year=2024, major="CS")
+        department = Department.objects.create(name="Technology", code="TECH")
+        self.course = Course.objects.create(title="Algorithms", module_code="CS-201", department=department)
+        self.other_course = Course.objects.create(title="Networks", module_code="CS-202", department=department)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_bulk_enroll_reports_every_pair(self):
+        StudentCourseEnrollment.objects.create(student=self.alice, course=self.course)
+        StudentCourseEnrollment.objects.create(student=self.bob, course=self.course, is_active=False)
+
+        # Resolving, reading existing rows, reactivating and inserting are
+        # set-wise, so this stays the same however many pairs are sent
+        with self.assertNumQueries(21):
+            response = self.client.post('/api/academics/enrollments/bulk/', {
+                'students': ["alice@Example.COM", "S1002", "nobody@example.com"],
+                'courses': ["CS-201", self.other_course.pk, "XX-999"],
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statuses = {(row['student'], row['course']): row['status'] for row in response.data['results']}
+        self.assertEqual(statuses[("alice@Example.COM", "CS-201")], enrollments.ALREADY_ENROLLED)
+        self.assertEqual(statuses[("S1002", "CS-201")], enrollments.REACTIVATED)
+        self.assertEqual(statuses[("S1002", self.other_course.pk)], enrollments.CREATED)
+        self.assertEqual(statuses[("nobody@example.com", "CS-201")], enrollments.UNKNOWN_STUDENT)
+        self.assertEqual(statuses[("alice@Example.COM", "XX-999")], enrollments.UNKNOWN_COURSE)
+        self.assertEqual(response.data['summary'][enrollments.CREATED], 2)
+
+        self.assertEqual(StudentCourseEnrollment.objects.filter(is_active=True).count(), 4)
+        self.course.refresh_from_db()
+        self.other_course.refresh_from_db()
+        self.assertEqual(self.course.active_enrollment_count, 2)
+        self.assertEqual(self.other_course.active_enrollment_count, 2)
+
+    def test_pairs_inserted_concurrently_report_their_real_state(self):
+        inserted_at = timezone.now()
+        theirs = StudentCourseEnrollment.objects.create(student=self.alice, course=self.course, is_active=False)
+        pairs = {(self.alice.pk, self.course.pk)}
+        statuses = {}
+        inactive = enrollments._record(enrollments._rows(pairs), pairs, statuses, inserted_at)
+        self.assertEqual(statuses, {(self.alice.pk, self.course.pk): enrollments.REACTIVATED})
+        self.assertEqual(inactive, [theirs.pk])
+
+    def test_bulk_enroll_is_staff_only_and_bounded(self):
+        self.client.force_authenticate(self.alice)
+        response = self.client.post('/api/academics/enrollments/bulk/', {
+            'students': [self.alice.pk], 'courses': ["CS-201"],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(self.staff)
+        with self.settings(BULK_ENROLLMENT_MAX_PAIRS=1):
+            response = self.client.post('/api/academics/enrollments/bulk/', {
+                'students': [self.alice.pk, self.bob.pk], 'courses': ["CS-201"],
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_enroll_twice_and_reactivate(self):
+        self.client.force_authenticate(self.alice)
+        url = f'/api/academics/courses/{self.course.pk}/enroll/'
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+        StudentCourseEnrollment.objects.filter(student=self.alice).update(is_active=False)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['is_active'])
+        self.assertEqual(StudentCourseEnrollment.objects.filter(student=self.alice).count(), 1)
+
+
+class SeedScaleTests(TestCase):
+    sizes = ['--departments', '3', '--courses', '12', '--students', '60', '--notes', '1e2',
+             '--documents', '20', '--messages', '50', '--seed', '7']
+
+    def seed(self):
+        call_command('seed_scale', *self.sizes, '--password', 'seeded', stdout=StringIO())
+        return (
+            list(StudentCourseEnrollment.objects.order_by('student__email', 'course__module_code')
+                 .values_list('student__email', 'course__module_code', 'is_active')),
+            list(CourseNote.objects.order_by('course__module_code', 'title')
+                 .values_list('course__module_code', 'title', 'tags', 'content')),
+        )
+
+    def test_seeds_deterministic_skewed_data(self):
+        enrollments, notes = self.seed()
+        self.assertEqual(Department.objects.count(), 3)
+        self.assertEqual(Course.objects.count(), 12)
+        self.assertEqual(len(notes), 100)
+        self.assertEqual(CourseDocument.objects.count(), 20)
+        self.assertEqual(get_user_model().objects.filter(is_student=True).count(), 60)
+        self.assertEqual(StudentProfile.objects.count(), 60)
+        self.assertTrue(get_user_model().objects.get(email=seeding.student_email(0)).check_password('seeded'))
+
+        # Counters were refreshed once at the end, and popularity is skewed
+        course_counts = sorted(Course.objects.values_list('active_enrollment_count', flat=True))
+        active = sum(1 for _, _, is_active in enrollments if is_active)
+        self.assertEqual(sum(course_counts), active)
+        self.assertGreater(course_counts[-1], 2 * course_counts[len(course_counts) // 2])
+
+        with self.assertRaises(CommandError):
+            call_command('seed_scale', *self.sizes, stdout=StringIO())
+
+        Department.objects.all().delete()
+        get_user_model().objects.filter(email__endswith=seeding.EMAIL_DOMAIN).delete()
+        self.assertEqual(self.seed(), (enrollments, notes))
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        call_command('seed_scale', '--departments', '2', '--courses', '6', '--students', '20', '--notes', '30',
+                     '--documents', '10', '--messages', '20', '--password', 'benchmark', stdout=StringIO())
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def run_benchmark(self, *args):
+        out = StringIO()
+        call_command('benchmark', '--iterations', '3', '--warmup', '1', '--password', 'benchmark',
+                     '--route', 'course-list', '--route', 'studentcourseenrollment-dashboard',
+                     '--route', 'coursedocument-detail', *args, stdout=out)
+        return out.getvalue()
+
+    def test_saves_baseline_and_flags_regressions(self):
+        baseline = os.path.join(self.tmp.name, "baseline.json")
+        output = self.run_benchmark('--cold', '--save', baseline)
+        self.assertIn("Benchmarked 3 routes, no regressions", output)
+        with open(baseline) as handle:
+            results = {result['name']: result for result in json.load(handle)['results']}
+        self.assertEqual(set(results), {'course-list', 'studentcourseenrollment-dashboard', 'coursedocument-detail'})
+        dashboard = results['studentcourseenrollment-dashboard']
+        self.assertEqual(dashboard['requests'], 3)
+        self.assertEqual(dashboard['statuses'], [200])
+        self.assertLessEqual(dashboard['p50_ms'], dashboard['p99_ms'])
+        self.assertEqual(dashboard['queries'], 3)
+        self.assertGreater(dashboard['peak_memory_kb'], 0)
+
+        # Fewer queries in the baseline than now is a regression
+        with open(baseline) as handle:
+            saved = json.load(handle)
+        for result in saved['results']:
+            result['queries'] = 0
+            # Only the query counts; timings this short are too noisy to compare
+            result['p95_ms'] = result['peak_memory_kb'] = None
+        with open(baseline, 'w') as handle:
+            json.dump(saved, handle)
+        with self.assertRaisesMessage(CommandError, "3 performance regressions"):
+            self.run_benchmark('--cold', '--baseline', baseline)
+
+        budgets = os.path.join(self.tmp.name, "budgets.json")
+        with open(budgets, 'w') as handle:
+            json.dump({'routes': {'course-list': {'queries': 0}}}, handle)
+        with self.assertRaisesMessage(CommandError, "1 performance regressions"):
+            self.run_benchmark('--cold', '--budgets', budgets)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.staff = get_user_model().objects.create_user(
+            email="ops@example.com", password="testpassword", is_staff=True
+        )
+        department = Department.objects.create(name="Technology", code="TECH")
+        self.course = Course.objects.create(title="Computer Science", module_code="CS-301", department=department)
+        CourseNote.objects.create(title="Big O", course=self.course, content="complexity", is_featured=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_records_per_route_metrics(self):
+        cache.clear()
+        response_cache.local.clear()
+        for _ in range(2):
+            self.client.get('/api/academics/notes/featured/')
+        self.client.get('/api/academics/notes/by_course/')
+        self.client.get('/no/such/page/')
+
+        text = self.scrape()
+        self.assertIn('http_requests_total{route="coursenote-featured",method="GET",status="200"} 2', text)
+        self.assertIn('http_requests_total{route="coursenote-by-course",method="GET",status="400"} 1', text)
+        self.assertIn('http_requests_total{route="unmatched",method="GET",status="404"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{route="coursenote-featured",method="GET"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{route="coursenote-featured",method="GET",le="+Inf"} 2', text)
+        self.assertIn('http_response_size_bytes_count{route="coursenote-featured",method="GET"} 2', text)
+        # The first request ran queries, the cached second one didn't
+        self.assertIn('http_request_db_queries_bucket{route="coursenote-featured",method="GET",le="0"} 1', text)
+        self.assertIn('http_request_db_duration_seconds_total{route="coursenote-featured",method="GET"}', text)
+
+    def test_staff_or_token_only(self):
+        student = get_user_model().objects.create_user(email="student@example.com", password="testpassword")
+        self.client.force_authenticate(student)
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(None)
+        with self.settings(METRICS_TOKEN="scrape-secret"):
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION="Bearer scrape-secret")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_aggregates_worker_processes(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with self.settings(METRICS_DIR=tmp.name):
+            self.client.get(f'/api/academics/courses/{self.course.pk}/')
+            metrics.registry.flush()
+            # Another worker's aggregates, as it would have flushed them
+            with open(os.path.join(tmp.name, "4242-other.json"), "w") as handle:
+                json.dump(metrics.registry.snapshot(), handle)
+            stale = os.path.join(tmp.name, "1-stopped.json")
+            with open(stale, "w") as handle:
+                json.dump(metrics.registry.snapshot(), handle)
+            os.utime(stale, (0, 0))
+
+            text = self.scrape()
+        self.assertIn('http_requests_total{route="course-detail",method="GET",status="200"} 2', text)
+        self.assertFalse(os.path.exists(stale))
+
+
+class NPlusOneTests(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        cache.clear()
+        response_cache.local.clear()
+        self.user = get_user_model().objects.create_user(email="student@example.com", password="testpassword")
+        department = Department.objects.create(name="Technology", code="TECH")
+        for index in range(6):
+            course = Course.objects.create(title=f"Course {index}", module_code=f"CS-{index}", department=department)
+            CourseNote.objects.create(title=f"Note {index}", course=course, content="text", is_featured=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_fingerprint_collapses_literals(self):
+        self.assertEqual(
+            nplusone.fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'x''y' AND k IN (%s, %s, %s)"),
+            nplusone.fingerprint("SELECT * FROM t WHERE id = 7 AND name = 'z' AND k IN (%s)"),
+        )
+
+    def test_names_the_serializer_field(self):
+        notes = CourseNote.objects.all()
+        with self.assertRaisesMessage(nplusone.NPlusOneError, "CourseNoteSerializer.course_title"):
+            with nplusone.detecting():
+                CourseNoteSerializer(notes, many=True).data
+
+        with nplusone.detecting() as detector:
+            CourseNoteSerializer(notes.select_related('course', 'created_by'), many=True).data
+        self.assertEqual(detector.reports, [])
+
+    @override_settings(NPLUSONE_SAMPLE_RATE=1, NPLUSONE_RAISE=True)
+    def test_api_routes_have_no_n_plus_one(self):
+        StudentCourseEnrollment.objects.bulk_create([
+            StudentCourseEnrollment(student=self.user, course=course) for course in Course.objects.all()
+        ])
+        for url in ('/api/academics/notes/', '/api/academics/notes/featured/',
+                    '/api/academics/enrollments/', '/api/academics/enrollments/my_courses/'):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK, url)
+
+    def test_logs_and_counts_in_production(self):
+        notes = CourseNote.objects.all()
+        with self.assertLogs('uniSchooling.nplusone', 'WARNING') as logs:
+            with nplusone.detecting(raise_errors=False) as detector:
+                CourseNoteSerializer(notes, many=True).data
+        self.assertIn("academics/tests.py", logs.output[0])
+        self.assertEqual(len(detector.reports), 1)
+        self.assertIn(
+            'http_request_n_plus_one_total{route="",field="CourseNoteSerializer.course_title"} 1',
+            metrics.render(metrics.registry.collect()),
+        )
+
+
+class AsyncReadPathTests(TestCase):
+    """The hot read endpoints served natively through the ASGI handler"""
+
+    def setUp(self):
+        metrics.registry.clear()
+        cache.clear()
+        response_cache.local.clear()
+        self.user = get_user_model().objects.create_user(email="student@example.com", password="testpassword")
+        self.auth = {'Authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        department = Department.objects.create(name="Technology", code="TECH")
+        self.course = Course.objects.create(title="Computer Science", module_code="CS-301", department=department)
+        CourseNote.objects.create(title="Big O", course=self.course, content="complexity", is_featured=True)
+        StudentCourseEnrollment.objects.create(student=self.user, course=self.course)
+        Message.objects.create(sender=self.user, subject="Hello", body="body")
+
+    def test_views_are_async(self):
+        for path in ('/api/academics/courses/', '/api/academics/notes/featured/', '/api/auth/messages/'):
+            self.assertTrue(iscoroutinefunction(resolve(path).func), path)
+
+    async def test_catalog_and_notes(self):
+        response = await self.async_client.get('/api/academics/departments/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['courses'][0]['module_code'], "CS-301")
+
+        response = await self.async_client.get('/api/academics/courses/', {'department_code': 'TECH'})
+        self.assertEqual([course['title'] for course in response.data], ["Computer Science"])
+
+        response = await self.async_client.get('/api/academics/notes/featured/', headers=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['course_title'], "Computer Science")
+
+        response = await self.async_client.get('/api/academics/notes/by_course/', headers=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await self.async_client.get(
+            '/api/academics/notes/by_course/', {'course_id': self.course.pk}, headers=self.auth
+        )
+        self.assertEqual(len(response.data['results']), 1)
+
+    async def test_authenticated_reads(self):
+        response = await self.async_client.get('/api/academics/enrollments/my_courses/', headers=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['title'], "Computer Science")
+
+        response = await self.async_client.get('/api/auth/messages/', headers=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data'][0]['sender_email'], "student@example.com")
+
+        response = await self.async_client.get('/api/auth/messages/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_sync_actions_still_work(self):
+        response = await self.async_client.get(f'/api/academics/courses/{self.course.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['module_code'], "CS-301")
+
+    async def test_queries_are_measured(self):
+        await self.async_client.get('/api/auth/messages/', headers=self.auth)
+        text = metrics.render(metrics.registry.collect())
+        self.assertIn('http_request_db_queries_bucket{route="message-list",method="GET",le="0"} 0', text)
+        self.assertIn('http_request_db_queries_count{route="message-list",method="GET"} 1', text)
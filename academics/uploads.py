@@ -0,0 +1,211 @@
+"""
+Resumable chunked uploads for course documents.
+
+A client creates an ``UploadSession``, PUTs chunks at increasing offsets and
+finally asks for the session to be finalized. Chunks are streamed straight
+to a temporary file while a SHA-256 is updated incrementally, so worker
+memory stays flat however large the document is, and a dropped connection
+only costs the chunk that was in flight.
+"""
+import hashlib
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from uniSchooling.cache import LRUCache
+
+from .models import CourseDocument, UploadSession
+
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A chunk or finalize request that doesn't fit the session's state"""
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadConflict(UploadError):
+    """The chunk doesn't start where the session currently ends"""
+
+
+class SessionFile(File):
+    """
+    A finished upload on local disk, with its digest so storage doesn't hash
+    it again. It is copied rather than moved into place, so the session can
+    still be finalized again if the transaction rolls back.
+    """
+
+    def __init__(self, file, sha256):
+        super().__init__(file)
+        self.sha256 = sha256
+
+
+# Hash state per session, so each chunk only hashes its own bytes. A session
+# resumed in another process, or evicted from here, falls back to rehashing
+# what is on disk. Bounded, since abandoned sessions never come back for theirs.
+_hashers = LRUCache(
+    settings.CHUNKED_UPLOAD_HASHER_CACHE_SIZE, settings.CHUNKED_UPLOAD_EXPIRY.total_seconds()
+)
+
+
+def upload_dir():
+    path = Path(settings.CHUNKED_UPLOAD_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def temp_path(session):
+    return upload_dir() / f'{session.id}.part'
+
+
+def expiry_from_now():
+    return timezone.now() + settings.CHUNKED_UPLOAD_EXPIRY
+
+
+def _hasher_for(session, path):
+    # Taken out while in use: a chunk that fails halfway leaves it half updated.
+    # The session's row lock keeps anyone else from taking it meanwhile.
+    offset, hasher = _hashers.get(session.id, (None, None))
+    _hashers.delete(session.id)
+    if offset == session.received_bytes:
+        return hasher
+
+    hasher = hashlib.sha256()
+    remaining = session.received_bytes
+    if remaining:
+        with open(path, 'rb') as existing:
+            while remaining:
+                block = existing.read(min(READ_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+    return hasher
+
+
+def _remember_hasher(session, hasher):
+    _hashers.set(session.id, (session.received_bytes, hasher))
+
+
+def _forget_hasher(session):
+    _hashers.delete(session.id)
+
+
+def write_chunk(session_id, user, offset, stream, length):
+    """
+    Append ``length`` bytes read from ``stream`` at ``offset``. Returns the
+    updated session. Raises ``UploadConflict`` when ``offset`` isn't the
+    current end of the upload.
+    """
+    max_chunk = settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE
+    if length <= 0:
+        raise UploadError('Chunk must not be empty')
+    if length > max_chunk:
+        raise UploadError(f'Chunks may be at most {max_chunk} bytes')
+
+    with transaction.atomic():
+        # The row lock serializes concurrent PUTs for the same session
+        session = UploadSession.objects.select_for_update().get(
+            pk=session_id, uploaded_by=user, status='pending'
+        )
+        if session.expires_at < timezone.now():
+            _forget_hasher(session)
+            raise UploadError('Upload session has expired')
+        if offset != session.received_bytes:
+            raise UploadConflict('Chunk offset does not match the upload', offset=session.received_bytes)
+        if offset + length > session.total_size:
+            raise UploadError('Chunk runs past the declared file size', offset=session.received_bytes)
+
+        path = temp_path(session)
+        hasher = _hasher_for(session, path)
+        written = 0
+        with open(path, 'r+b' if path.exists() else 'wb') as target:
+            # Drop anything left over from a chunk that never completed
+            target.truncate(offset)
+            target.seek(offset)
+            while written < length:
+                block = stream.read(min(READ_BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                target.write(block)
+                hasher.update(block)
+                written += len(block)
+
+        if written != length:
+            _forget_hasher(session)
+            raise UploadError('Chunk ended early', offset=session.received_bytes)
+
+        session.received_bytes += written
+        session.expires_at = expiry_from_now()
+        session.save(update_fields=['received_bytes', 'expires_at', 'updated_at'])
+        _remember_hasher(session, hasher)
+    return session
+
+
+def finalize(session_id, user):
+    """
+    Turn a fully received upload into a ``CourseDocument``. Finalizing an
+    already finalized session returns the same document.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().select_related(
+            'course__department'
+        ).get(pk=session_id, uploaded_by=user)
+        if session.status == 'complete':
+            return session.document, False
+        if not session.is_complete:
+            raise UploadError('Upload is not complete yet', offset=session.received_bytes)
+
+        path = temp_path(session)
+        digest = _hasher_for(session, path).hexdigest()
+        _forget_hasher(session)
+        if session.expected_sha256 and session.expected_sha256.lower() != digest:
+            raise UploadError('Checksum mismatch, upload the file again')
+
+        document = CourseDocument(
+            title=session.title,
+            course=session.course,
+            description=session.description,
+            uploaded_by=user,
+        )
+        # Copies the file into the blob store, or links to an identical blob
+        with open(path, 'rb') as handle:
+            document.file.save(session.filename, SessionFile(handle, digest), save=False)
+        document.save()
+        # Only once committed; on rollback the session is still pending and
+        # can be finalized again from the same file
+        transaction.on_commit(lambda: discard(session))
+
+        session.sha256 = digest
+        session.status = 'complete'
+        session.document = document
+        session.save(update_fields=['sha256', 'status', 'document', 'updated_at'])
+    return document, True
+
+
+def discard(session):
+    _forget_hasher(session)
+    try:
+        os.remove(temp_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def cleanup_expired(now=None):
+    """Delete expired sessions along with their temporary files"""
+    now = now or timezone.now()
+    removed = 0
+    stale = UploadSession.objects.filter(expires_at__lt=now)
+    for session in stale.iterator():
+        discard(session)
+        removed += 1
+    stale.delete()
+    return removed
@@ -9,8 +9,11 @@ router.register(r'courses', views.CourseViewSet)
 router.register(r'enrollments', views.EnrollmentViewSet)
 router.register(r'documents', views.CourseDocumentViewSet)
 router.register(r'notes', views.CourseNoteViewSet)
+router.register(r'uploads', views.UploadSessionViewSet)
 
 # The API URLs are now determined automatically by the router
 urlpatterns = [
+    path('catalog/', views.CatalogView.as_view(), name='catalog'),
+    path('search/', views.SearchView.as_view(), name='search'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,39 +1,139 @@
-from rest_framework import viewsets, permissions, filters, status
+from rest_framework import mixins, viewsets, permissions, filters, status
 from rest_framework.decorators import action
+from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.exceptions import ValidationError
-from django.db.models import Q
-from .models import CourseNote, Department, Course, CourseDocument, StudentCourseEnrollment
+from rest_framework.exceptions import NotFound, ValidationError
+from django.db.models import OuterRef, Q, Prefetch, Subquery
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from uniSchooling.asyncviews import AsyncAPIViewMixin
+from uniSchooling.pagination import KeysetPagination
+from . import catalog, downloads, enrollments, search, uploads
+from .cache import CATALOG, NOTES, cached_response
+from .models import CourseNote, Department, Course, CourseDocument, DocumentText, StudentCourseEnrollment, UploadSession
 from .serializers import (
+    BulkEnrollmentSerializer,
     CourseNoteSerializer,
     DepartmentSerializer, 
     CourseSerializer, 
     CourseDocumentSerializer, 
-    StudentCourseEnrollmentSerializer
+    DashboardCourseSerializer,
+    StudentCourseEnrollmentSerializer,
+    UploadSessionSerializer
 )
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+class ExpandableViewSetMixin:
     """
-    API endpoint for university departments
+    Lets read calls choose how much of the nested catalog comes back, either
+    with ``?expand=courses,courses.documents`` or ``?depth=2``, and builds the
+    matching prefetch plan so every expanded level costs a single query.
+    """
+    # Expandable paths, shallowest first; ``?depth=N`` takes the first N.
+    expand_levels = ()
+    default_depth = 0
+    # Path -> lookups passed to prefetch_related() when that path is expanded.
+    expand_prefetches = {}
+
+    def get_expand(self):
+        if getattr(self, '_expand', None) is not None:
+            return self._expand
+
+        params = self.request.query_params if self.request else {}
+        if params.get('expand') is not None:
+            requested = {path.strip() for path in params['expand'].split(',') if path.strip()}
+            unknown = requested - set(self.expand_levels)
+            if unknown:
+                raise ValidationError({"expand": f"Unknown expansion: {', '.join(sorted(unknown))}"})
+            expand = set()
+            for path in requested:
+                # Expanding a nested path implies expanding its parents
+                parts = path.split('.')
+                expand.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+        else:
+            depth = params.get('depth', self.default_depth)
+            try:
+                depth = int(depth)
+            except (TypeError, ValueError):
+                raise ValidationError({"depth": "depth must be an integer"})
+            depth = max(0, min(depth, len(self.expand_levels)))
+            expand = set(self.expand_levels[:depth])
+
+        self._expand = expand
+        return expand
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        expand = self.get_expand()
+        for path in self.expand_levels:
+            if path in expand:
+                queryset = queryset.prefetch_related(*self.expand_prefetches.get(path, ()))
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        return context
+
+
+def document_prefetch(lookup):
+    """Prefetch documents together with their uploader in one query"""
+    return Prefetch(lookup, queryset=CourseDocument.objects.select_related('uploaded_by'))
+
+
+class DepartmentViewSet(AsyncAPIViewMixin, ExpandableViewSetMixin, viewsets.ModelViewSet):
+    """
+    API endpoint for university departments.
+
+    Courses are included by default; pass ``?depth=2`` (or
+    ``?expand=courses.documents``) for their documents as well, or
+    ``?depth=0`` for the departments alone.
     """
     queryset = Department.objects.all().order_by('name')
     serializer_class = DepartmentSerializer
+    expand_levels = ('courses', 'courses.documents')
+    default_depth = 1
+    expand_prefetches = {
+        'courses': ('courses',),
+        'courses.documents': (document_prefetch('courses__documents'),),
+    }
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'code']
     ordering_fields = ['name', 'code', 'created_at']
 
+    @cached_response(CATALOG)
+    async def list(self, request, *args, **kwargs):
+        return await self.alist(request)
+
+    @cached_response(CATALOG)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(AsyncAPIViewMixin, ExpandableViewSetMixin, viewsets.ModelViewSet):
     """
-    API endpoint for university courses
+    API endpoint for university courses.
+
+    Documents are only included with ``?depth=1`` or ``?expand=documents``.
     """
-    queryset = Course.objects.all().order_by('title')
+    queryset = Course.objects.select_related('department').order_by('title')
     serializer_class = CourseSerializer
+    expand_levels = ('documents',)
+    expand_prefetches = {
+        'documents': (document_prefetch('documents'),),
+    }
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'module_code', 'department__name']
     ordering_fields = ['title', 'module_code', 'department__name', 'created_at']
+
+    @cached_response(CATALOG)
+    async def list(self, request, *args, **kwargs):
+        return await self.alist(request)
+
+    @cached_response(CATALOG)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -59,18 +159,21 @@ class CourseViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_401_UNAUTHORIZED
             )
             
-        # Check if already enrolled
-        if StudentCourseEnrollment.objects.filter(student=user, course=course).exists():
-            return Response(
-                {"error": "Already enrolled in this course"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-            
-        enrollment = StudentCourseEnrollment.objects.create(
+        # get_or_create falls back to a lookup when a concurrent request wins
+        # the insert, so a double-click can't surface an IntegrityError
+        enrollment, created = StudentCourseEnrollment.objects.get_or_create(
             student=user,
             course=course
         )
-        
+        if not created:
+            if enrollment.is_active:
+                return Response(
+                    {"error": "Already enrolled in this course"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            enrollment.is_active = True
+            enrollment.save(update_fields=['is_active'])
+            
         serializer = StudentCourseEnrollmentSerializer(enrollment)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -79,15 +182,19 @@ class CourseDocumentViewSet(viewsets.ModelViewSet):
     """
     API endpoint for course documents (PDF, Word, Excel, etc.)
     """
-    queryset = CourseDocument.objects.all().order_by('-uploaded_at')
+    queryset = CourseDocument.objects.select_related('uploaded_by').order_by('-uploaded_at')
     serializer_class = CourseDocumentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'description', 'document_type', 'course__title']
+    filter_backends = [search.IndexedSearchFilter, filters.OrderingFilter]
+    search_kind = 'document'
     ordering_fields = ['title', 'document_type', 'uploaded_at']
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-uploaded_at', 'id')
     
    
     def get_queryset(self):
+        if self.action == 'download':
+            return super().get_queryset()
         course_id = self.request.query_params.get('course')
         if not course_id:
             # Only allow searching when course is specified
@@ -102,14 +209,91 @@ class CourseDocumentViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(uploaded_by=self.request.user)
 
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def download(self, request, pk=None):
+        """
+        Download the document's file, honouring ``Range`` and conditional
+        requests. Inactive documents are only visible to staff and the uploader.
+        """
+        document = self.get_object()
+        if not downloads.can_download(request.user, document):
+            raise NotFound()
+        return downloads.serve(request, document)
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads of course documents.
+
+    ``POST`` opens a session, ``PUT`` appends the raw request body at the
+    ``Upload-Offset`` header, ``GET`` reports how far the upload got (so an
+    interrupted client knows where to resume) and ``POST .../finalize/``
+    turns the finished upload into a course document.
+    """
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return super().get_queryset().filter(uploaded_by=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(uploaded_by=self.request.user, expires_at=uploads.expiry_from_now())
+
+    def perform_destroy(self, instance):
+        uploads.discard(instance)
+        instance.delete()
+
+    def update(self, request, *args, **kwargs):
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({'error': 'Upload-Offset header required'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session = uploads.write_chunk(session.pk, request.user, offset, request.stream, length)
+        except UploadSession.DoesNotExist:
+            return Response({'error': 'Upload session is already complete'},
+                          status=status.HTTP_409_CONFLICT)
+        except uploads.UploadError as error:
+            code = status.HTTP_409_CONFLICT if isinstance(error, uploads.UploadConflict) else status.HTTP_400_BAD_REQUEST
+            response = Response({'error': str(error), 'received_bytes': error.offset}, status=code)
+            if error.offset is not None:
+                response['Upload-Offset'] = str(error.offset)
+            return response
+
+        response = Response(self.get_serializer(session).data)
+        response['Upload-Offset'] = str(session.received_bytes)
+        return response
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        try:
+            document, created = uploads.finalize(session.pk, request.user)
+        except uploads.UploadError as error:
+            return Response({'error': str(error), 'received_bytes': error.offset},
+                          status=status.HTTP_400_BAD_REQUEST)
+        serializer = CourseDocumentSerializer(document, context=self.get_serializer_context())
+        return Response(serializer.data,
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
 
-class CourseNoteViewSet(viewsets.ModelViewSet):
+class CourseNoteViewSet(AsyncAPIViewMixin, viewsets.ModelViewSet):
     queryset = CourseNote.objects.filter(is_active=True)
     serializer_class = CourseNoteSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('order', '-created_at', 'id')
 
     def get_queryset(self):
-        queryset = CourseNote.objects.filter(is_active=True)
+        queryset = CourseNote.objects.filter(is_active=True).select_related('course', 'created_by')
         course_id = self.request.query_params.get('course', None)
         category = self.request.query_params.get('category', None)
         difficulty = self.request.query_params.get('difficulty', None)
@@ -124,47 +308,205 @@ class CourseNoteViewSet(viewsets.ModelViewSet):
         return queryset.order_by('order', '-created_at')
 
     @action(detail=False, methods=['get'])
-    def featured(self, request):
+    @cached_response(NOTES)
+    async def featured(self, request):
         """Get featured notes across all courses"""
-        featured_notes = CourseNote.objects.filter(is_featured=True, is_active=True)
-        serializer = self.get_serializer(featured_notes, many=True)
-        return Response(serializer.data)
+        featured_notes = CourseNote.objects.filter(is_featured=True, is_active=True).select_related('course', 'created_by')
+        return await self.alist(request, featured_notes)
 
     @action(detail=False, methods=['get'])
-    def by_course(self, request):
+    @cached_response(NOTES)
+    async def by_course(self, request):
         """Get notes grouped by course"""
         course_id = request.query_params.get('course_id')
         if not course_id:
             return Response({'error': 'course_id parameter required'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        notes = CourseNote.objects.filter(course_id=course_id, is_active=True)
-        serializer = self.get_serializer(notes, many=True)
-        return Response(serializer.data)
+        notes = CourseNote.objects.filter(course_id=course_id, is_active=True).select_related('course', 'created_by')
+        return await self.alist(request, notes)
 
 
-class EnrollmentViewSet(viewsets.ModelViewSet):
+class EnrollmentViewSet(AsyncAPIViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for student enrollments
     """
     queryset = StudentCourseEnrollment.objects.all().order_by('-enrolled_at')
     serializer_class = StudentCourseEnrollmentSerializer
     permission_classes = [permissions.IsAuthenticated]
-    
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-enrolled_at', 'id')
+
     def get_queryset(self):
         user = self.request.user
+        queryset = StudentCourseEnrollment.objects.select_related('student', 'course__department').prefetch_related(
+            document_prefetch('course__documents')
+        )
         if user.is_staff:
-            return StudentCourseEnrollment.objects.all()
-        return StudentCourseEnrollment.objects.filter(student=user)
+            return queryset
+        return queryset.filter(student=user)
     
     @action(detail=False, methods=['get'])
-    def my_courses(self, request):
+    async def my_courses(self, request):
         """Get all courses the current user is enrolled in"""
         user = request.user
         enrollments = StudentCourseEnrollment.objects.filter(
             student=user,
             is_active=True
+        ).select_related('course__department').prefetch_related(
+            document_prefetch('course__documents')
+        )
+        courses = [enrollment.course async for enrollment in enrollments]
+        serializer = CourseSerializer(courses, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='bulk',
+            permission_classes=[permissions.IsAdminUser])
+    def bulk(self, request):
+        """
+        Enroll every listed student in every listed course. Students may be
+        given as user ids, emails or student ids and courses as ids or module
+        codes. Inactive enrollments are reactivated. The response has one
+        result per pair plus a count per status.
+        """
+        serializer = BulkEnrollmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results, summary = enrollments.bulk_enroll(
+            serializer.validated_data['students'],
+            serializer.validated_data['courses'],
+        )
+        return Response({'summary': summary, 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def dashboard(self, request):
+        """
+        The current user's enrolled courses with their department, counters,
+        latest document and latest note, in three queries however many
+        courses there are.
+        """
+        latest_document = CourseDocument.objects.filter(
+            course=OuterRef('course'), is_active=True
+        ).order_by('-uploaded_at', '-id').values('id')[:1]
+        latest_note = CourseNote.objects.filter(
+            course=OuterRef('course'), is_active=True
+        ).order_by('-created_at', '-id').values('id')[:1]
+
+        enrollments = list(
+            StudentCourseEnrollment.objects.filter(student=request.user, is_active=True)
+            .select_related('course__department')
+            .annotate(
+                latest_document_id=Subquery(latest_document),
+                latest_note_id=Subquery(latest_note),
+            )
+            .order_by('-enrolled_at', 'id')
+        )
+        documents = CourseDocument.objects.in_bulk(
+            [e.latest_document_id for e in enrollments if e.latest_document_id]
+        )
+        notes = CourseNote.objects.in_bulk(
+            [e.latest_note_id for e in enrollments if e.latest_note_id]
         )
-        courses = [enrollment.course for enrollment in enrollments]
-        serializer = CourseSerializer(courses, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+
+        courses = []
+        for enrollment in enrollments:
+            course = enrollment.course
+            course.enrolled_at = enrollment.enrolled_at
+            course.latest_document = documents.get(enrollment.latest_document_id)
+            course.latest_note = notes.get(enrollment.latest_note_id)
+            courses.append(course)
+
+        serializer = DashboardCourseSerializer(courses, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+
+class SearchView(APIView):
+    """
+    Full-text search across course notes and course documents, ranked with
+    BM25 from the inverted index.
+
+    Query params: ``q`` (required), ``course``, ``category`` (note category
+    or document type), ``difficulty``, ``type`` (``note``/``document``) and
+    ``limit``. Document hits whose file text matched also get a
+    ``location`` with the page/slide/sheet and a snippet.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_limit = 100
+    # Extracted texts can be large, so only the best document hits are located
+    max_located = 10
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q parameter required'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        kind = request.query_params.get('type')
+        if kind and kind not in ('note', 'document'):
+            return Response({'error': 'type must be "note" or "document"'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        hits = search.search(
+            query,
+            kind=kind,
+            course=request.query_params.get('course'),
+            category=request.query_params.get('category'),
+            difficulty=request.query_params.get('difficulty'),
+            limit=max(limit, 1),
+        )
+
+        note_ids = [object_id for hit_kind, object_id, _ in hits if hit_kind == 'note']
+        document_ids = [object_id for hit_kind, object_id, _ in hits if hit_kind == 'document']
+        notes = CourseNote.objects.select_related('course', 'created_by').in_bulk(note_ids)
+        documents = CourseDocument.objects.select_related('uploaded_by').in_bulk(document_ids)
+        texts = {
+            text.document_id: text
+            for text in DocumentText.objects.filter(document_id__in=document_ids[:self.max_located])
+            .only('document_id', 'text', 'segments')
+        }
+
+        context = self.get_serializer_context()
+        results = []
+        for hit_kind, object_id, score in hits:
+            result = {'type': hit_kind, 'score': round(score, 4)}
+            if hit_kind == 'note' and object_id in notes:
+                result['item'] = CourseNoteSerializer(notes[object_id], context=context).data
+            elif hit_kind == 'document' and object_id in documents:
+                result['item'] = CourseDocumentSerializer(documents[object_id], context=context).data
+                text = texts.get(object_id)
+                result['location'] = search.locate(text.text, text.segments, query) if text else None
+            else:
+                continue
+            results.append(result)
+
+        return Response({'query': query, 'results': results})
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
+
+class CatalogView(APIView):
+    """
+    The whole department -> course catalog as one pre-serialized snapshot.
+
+    Served from process memory with an ``ETag``; clients that send it back in
+    ``If-None-Match`` get a 304 without any database work.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        snapshot = catalog.get_snapshot()
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or snapshot.etag in parse_etags(if_none_match)):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(snapshot.body, content_type='application/json')
+        response['ETag'] = snapshot.etag
+        response['X-Catalog-Version'] = str(snapshot.version)
+        response['Cache-Control'] = 'no-cache'
+        return response
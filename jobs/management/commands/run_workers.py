@@ -0,0 +1,25 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Runs background jobs from the database-backed queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Number of jobs run at the same time')
+        parser.add_argument('--poll-interval', type=float,
+                            help='Seconds to wait between polls while the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no jobs are ready instead of waiting for more')
+
+    def handle(self, *args, **options):
+        worker = Worker(concurrency=max(options['concurrency'], 1), poll_interval=options['poll_interval'])
+        if not options['once']:
+            worker.install_signal_handlers()
+            self.stdout.write(f'Worker {os.getpid()} running {worker.concurrency} jobs at a time')
+        processed = worker.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
@@ -0,0 +1,221 @@
+"""
+A background job queue that uses the application database as its broker.
+
+Functions decorated with ``@task`` can be queued with ``enqueue``, which
+inserts a ``Job`` row in the caller's transaction. Workers (see
+``manage.py run_workers``) lease ready rows with ``SELECT ... FOR UPDATE
+SKIP LOCKED`` so several worker processes never pick the same job, run them
+and either mark them done or schedule a retry with exponential backoff.
+Workers renew the leases of the jobs they are running, so a job may run
+longer than ``JOBS_LEASE_SECONDS``. A worker that dies mid-job stops
+renewing, loses its lease when ``leased_until`` passes, and the job is
+picked up again, unless it has used up its attempts: a job that keeps
+killing its worker is marked failed.
+"""
+import logging
+import random
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+
+class TaskError(Exception):
+    """A job names something that isn't a registered task"""
+
+
+def task(func=None, *, priority=0, max_attempts=5):
+    """
+    Mark ``func`` as runnable by the workers and give it an ``enqueue``
+    shortcut. Arguments must be JSON serializable.
+    """
+    def decorate(func):
+        func.job_options = {'priority': priority, 'max_attempts': max_attempts}
+        func.enqueue = lambda *args, **kwargs: enqueue(func, *args, **kwargs)
+        return func
+    return decorate(func) if func is not None else decorate
+
+
+def task_path(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def resolve(path):
+    try:
+        func = import_string(path)
+    except ImportError as error:
+        raise TaskError(f'Unknown task {path}') from error
+    if not hasattr(func, 'job_options'):
+        raise TaskError(f'{path} is not a task')
+    return func
+
+
+def enqueue(func, *args, priority=None, delay=None, max_attempts=None, **kwargs):
+    """
+    Queue ``func(*args, **kwargs)``. The job becomes visible to workers when
+    the current transaction commits. With ``JOBS_EAGER`` it runs right after
+    the commit in this process instead, which is handy in tests.
+    """
+    path = func if isinstance(func, str) else task_path(func)
+    options = resolve(path).job_options
+    job = Job.objects.create(
+        task=path,
+        args=list(args),
+        kwargs=kwargs,
+        priority=options['priority'] if priority is None else priority,
+        max_attempts=options['max_attempts'] if max_attempts is None else max_attempts,
+        run_at=timezone.now() + (delay or timedelta()),
+    )
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: run_pending(ids=[job.pk]))
+    return job
+
+
+def _ready(now):
+    # Queued and due, or running under a lease that has run out with attempts left
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(
+        status=Job.RUNNING, leased_until__lt=now, attempts__lt=F('max_attempts')
+    )
+
+
+def fail_abandoned(now=None):
+    """Mark failed the jobs whose lease ran out on their last attempt"""
+    now = now or timezone.now()
+    return Job.objects.filter(
+        status=Job.RUNNING, leased_until__lt=now, attempts__gte=F('max_attempts')
+    ).update(
+        status=Job.FAILED,
+        last_error='The lease ran out on the last attempt; the worker died or hung',
+        finished_at=now,
+        leased_until=None,
+    )
+
+
+def lease(limit, lease_seconds=None, ids=None):
+    """
+    Claim up to ``limit`` ready jobs, highest priority first. Returns
+    ``(token, jobs)``; the token must be passed back when finishing them.
+    """
+    if limit <= 0:
+        return None, []
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    lease_seconds = lease_seconds or settings.JOBS_LEASE_SECONDS
+    fail_abandoned(now)
+    ready = Job.objects.filter(_ready(now))
+    if ids is not None:
+        ready = ready.filter(pk__in=ids)
+
+    with transaction.atomic():
+        candidates = list(
+            ready.select_for_update(skip_locked=True)
+            .order_by('-priority', 'run_at', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not candidates:
+            return token, []
+        # Re-checking readiness makes the claim safe on backends without
+        # row locks too: a row another worker claimed no longer matches
+        Job.objects.filter(_ready(now), pk__in=candidates).update(
+            status=Job.RUNNING,
+            lease_token=token,
+            leased_until=now + timedelta(seconds=lease_seconds),
+            attempts=F('attempts') + 1,
+        )
+    jobs = list(Job.objects.filter(lease_token=token).order_by('-priority', 'run_at', 'id'))
+    return token, jobs
+
+
+def renew(jobs, lease_seconds=None):
+    """Extend the leases of ``jobs``, which this worker is still running"""
+    if not jobs:
+        return 0
+    lease_seconds = lease_seconds or settings.JOBS_LEASE_SECONDS
+    return _record(
+        Job.objects.filter(status=Job.RUNNING, lease_token__in={job.lease_token for job in jobs}),
+        leased_until=timezone.now() + timedelta(seconds=lease_seconds),
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before the next attempt, doubling each time, with jitter"""
+    delay = min(settings.JOBS_RETRY_BACKOFF * 2 ** max(attempts - 1, 0), settings.JOBS_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _record(queryset, attempts=3, **fields):
+    """
+    Update a finished job, retrying briefly on lock timeouts/deadlocks so a
+    job that did its work isn't run again just because this write failed.
+    """
+    for attempt in range(attempts):
+        try:
+            return queryset.update(**fields)
+        except OperationalError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def run_job(job):
+    """Run a leased job and record the outcome. Returns ``True`` on success."""
+    mine = Job.objects.filter(pk=job.pk, lease_token=job.lease_token, status=Job.RUNNING)
+    try:
+        func = resolve(job.task)
+        func(*job.args, **job.kwargs)
+    except Exception as error:
+        error_text = traceback.format_exc()
+        now = timezone.now()
+        if isinstance(error, TaskError) or job.attempts >= job.max_attempts:
+            logger.error('Job %s (%s) failed permanently', job.pk, job.task, exc_info=True)
+            recorded = _record(mine, status=Job.FAILED, last_error=error_text, finished_at=now, leased_until=None)
+        else:
+            logger.warning('Job %s (%s) failed, will retry', job.pk, job.task, exc_info=True)
+            recorded = _record(
+                mine,
+                status=Job.QUEUED,
+                last_error=error_text,
+                run_at=now + timedelta(seconds=backoff(job.attempts)),
+                leased_until=None,
+            )
+        result = False
+    else:
+        recorded = _record(mine, status=Job.DONE, finished_at=timezone.now(), leased_until=None)
+        result = True
+
+    if not recorded:
+        logger.warning('Job %s (%s) lost its lease before finishing; its result was dropped', job.pk, job.task)
+    return result
+
+
+def run_pending(limit=None, ids=None):
+    """
+    Lease and run ready jobs one at a time in this thread, until none are
+    left (or ``limit`` ran). Returns the number of jobs run.
+    """
+    count = 0
+    while limit is None or count < limit:
+        _, jobs = lease(1, ids=ids)
+        if not jobs:
+            break
+        run_job(jobs[0])
+        count += 1
+    return count
+
+
+def prune(older_than=None):
+    """Delete finished jobs older than ``JOBS_KEEP_FINISHED``; failed ones are kept"""
+    cutoff = timezone.now() - (older_than or settings.JOBS_KEEP_FINISHED)
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,154 @@
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import queue
+from .models import Job
+
+
+calls = []
+
+
+@queue.task
+def record(value):
+    calls.append(value)
+
+
+@queue.task(priority=5)
+def urgent(value):
+    calls.append(('urgent', value))
+
+
+@queue.task(max_attempts=2)
+def explode():
+    raise RuntimeError("boom")
+
+
+@queue.task
+def slow(value):
+    time.sleep(0.5)
+    calls.append(value)
+
+
+def not_a_task():
+    pass
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_is_transactional(self):
+        try:
+            with transaction.atomic():
+                record.enqueue("rolled back")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Job.objects.exists())
+
+        job = record.enqueue("kept")
+        self.assertEqual(job.task, 'jobs.tests.record')
+        self.assertEqual(queue.run_pending(), 1)
+        self.assertEqual(calls, ["kept"])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 1)
+
+    def test_priority_and_run_at(self):
+        record.enqueue("normal")
+        urgent.enqueue("first")
+        record.enqueue("later", delay=timedelta(hours=1))
+        queue.run_pending()
+        self.assertEqual(calls, [('urgent', "first"), "normal"])
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+    def test_a_leased_job_is_not_leased_again(self):
+        record.enqueue("once")
+        _, first = queue.lease(10)
+        _, second = queue.lease(10)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(second, [])
+
+        # ...until its lease runs out, e.g. because the worker died
+        Job.objects.update(leased_until=timezone.now() - timedelta(seconds=1))
+        _, third = queue.lease(10)
+        self.assertEqual([job.pk for job in third], [first[0].pk])
+
+        # The first worker's late result no longer counts
+        queue.run_job(first[0])
+        self.assertEqual(Job.objects.get().status, Job.RUNNING)
+
+    def test_a_job_that_keeps_losing_its_lease_fails(self):
+        job = explode.enqueue()
+        Job.objects.update(
+            status=Job.RUNNING, attempts=2, leased_until=timezone.now() - timedelta(seconds=1)
+        )
+        _, jobs = queue.lease(10)
+        self.assertEqual(jobs, [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("lease ran out", job.last_error)
+
+    def test_renewing_keeps_the_lease(self):
+        record.enqueue("long")
+        _, jobs = queue.lease(10, lease_seconds=1)
+        Job.objects.update(leased_until=timezone.now() + timedelta(milliseconds=10))
+        queue.renew(jobs)
+        self.assertGreater(Job.objects.get().leased_until, timezone.now() + timedelta(seconds=60))
+        time.sleep(0.02)
+        self.assertEqual(queue.lease(10)[1], [])
+
+    def test_retries_with_backoff_then_fails(self):
+        job = explode.enqueue()
+        queue.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn("boom", job.last_error)
+
+        Job.objects.update(run_at=timezone.now())
+        queue.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_only_tasks_can_be_queued(self):
+        with self.assertRaises(queue.TaskError):
+            queue.enqueue(not_a_task)
+        with self.assertRaises(queue.TaskError):
+            queue.enqueue('jobs.tests.missing')
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_mode_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record.enqueue("eager")
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, ["eager"])
+
+
+class WorkerTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_run_workers_drains_the_queue(self):
+        for i in range(6):
+            record.enqueue(i)
+        out = StringIO()
+        call_command('run_workers', '--concurrency', '2', '--once', '--poll-interval', '0.01', stdout=out)
+        self.assertIn("Processed 6 jobs", out.getvalue())
+        self.assertEqual(sorted(calls), list(range(6)))
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 6)
+
+    @override_settings(JOBS_LEASE_SECONDS=0.2)
+    def test_long_jobs_keep_their_lease(self):
+        slow.enqueue("once")
+        call_command('run_workers', '--concurrency', '2', '--once', '--poll-interval', '0.01', stdout=StringIO())
+        self.assertEqual(calls, ["once"])
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
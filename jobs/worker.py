@@ -0,0 +1,96 @@
+"""
+The long-running worker behind ``manage.py run_workers``.
+
+One leasing loop feeds a thread pool: whenever threads are free it leases
+that many jobs, so a slow job never holds up the others. The same loop
+renews the leases of the running jobs every third of
+``JOBS_LEASE_SECONDS``, so a long job isn't leased again and run twice.
+Run several worker processes for CPU-bound work; ``SKIP LOCKED`` keeps
+them apart.
+"""
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import queue
+
+
+logger = logging.getLogger(__name__)
+
+PRUNE_INTERVAL = 3600
+
+
+class Worker:
+    def __init__(self, concurrency=4, poll_interval=None):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval or settings.JOBS_POLL_INTERVAL
+        self.stopping = threading.Event()
+        self.processed = 0
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def install_signal_handlers(self):
+        # Finish the jobs in flight, but lease nothing new
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def execute(self, job):
+        try:
+            queue.run_job(job)
+        except Exception:
+            # Only bookkeeping can fail here; the lease expiring retries the job
+            logger.exception('Could not record the result of job %s', job.pk)
+        finally:
+            close_old_connections()
+
+    def run(self, once=False):
+        """
+        Process jobs until stopped. With ``once`` return as soon as nothing
+        is ready and nothing is running.
+        """
+        # Future -> the job it runs
+        running = {}
+        last_prune = 0
+        renew_interval = settings.JOBS_LEASE_SECONDS / 3
+        last_renewal = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='jobs') as pool:
+            while not self.stopping.is_set():
+                done = [future for future in running if future.done()]
+                self.processed += len(done)
+                for future in done:
+                    del running[future]
+
+                if running and time.monotonic() - last_renewal > renew_interval:
+                    try:
+                        queue.renew(list(running.values()))
+                    except Exception:
+                        # Retried next round; the leases still have two thirds to go
+                        logger.exception('Could not renew job leases')
+                    last_renewal = time.monotonic()
+
+                _, jobs = queue.lease(self.concurrency - len(running))
+                for job in jobs:
+                    running[pool.submit(self.execute, job)] = job
+
+                if not jobs:
+                    if once and not running:
+                        break
+                    if running:
+                        wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    else:
+                        self.stopping.wait(self.poll_interval)
+
+                if time.monotonic() - last_prune > PRUNE_INTERVAL:
+                    queue.prune()
+                    last_prune = time.monotonic()
+
+            wait(running)
+            self.processed += len(running)
+        close_old_connections()
+        return self.processed
@@ -3,6 +3,14 @@ ASGI config for uniSchooling project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Deploy with an ASGI server, e.g. ``uvicorn uniSchooling.asgi:application
+--workers 4`` or ``gunicorn -k uvicorn.workers.UvicornWorker
+uniSchooling.asgi:application``. The Server-Sent Events message stream
+(``/api/auth/messages/stream/``) keeps a connection open per client, which
+only an event loop can afford; it is refused when served through
+``uniSchooling.wsgi``. Disable proxy buffering and raise read timeouts
+above ``MESSAGE_STREAM_HEARTBEAT`` for that path.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -0,0 +1,93 @@
+"""
+Native async handlers for DRF views.
+
+DRF only dispatches synchronously, so under ASGI every request holds a
+thread for its whole duration. ``AsyncAPIViewMixin`` makes a view's URL
+an async view: a handler (``get``, or a viewset action such as ``list``)
+written as ``async def`` runs on the event loop, with authentication
+through the authenticators' ``aauthenticate`` where they have one. Handlers
+that are still sync run as before, through ``sync_to_async``. Under WSGI
+Django runs the whole view through ``async_to_sync`` instead.
+
+Async handlers must fetch everything they serialize up front (async ORM,
+``select_related``/``prefetch_related``); a lazy query during serialization
+raises ``SynchronousOnlyOperation``.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from rest_framework import exceptions
+from rest_framework.response import Response
+
+
+class AsyncAPIViewMixin:
+    # Django would refuse a class mixing sync and async handlers; the
+    # dispatch below handles both, and as_view() marks the view itself
+    view_is_async = False
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        # The view returns the coroutine from dispatch()
+        return markcoroutinefunction(view)
+
+    def dispatch(self, request, *args, **kwargs):
+        return self.adispatch(request, *args, **kwargs)
+
+    def get_handler(self, request):
+        if request.method.lower() in self.http_method_names:
+            return getattr(self, request.method.lower(), self.http_method_not_allowed)
+        return self.http_method_not_allowed
+
+    async def adispatch(self, request, *args, **kwargs):
+        handler = self.get_handler(request)
+        if not iscoroutinefunction(handler):
+            return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+        # APIView.dispatch(), awaiting authentication and the handler
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+        request.version, request.versioning_scheme = self.determine_version(request, *args, **kwargs)
+        await self.aperform_authentication(request)
+        # Permission and throttle checks only look at request.user
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def aperform_authentication(self, request):
+        """``Request._authenticate()``, awaiting each authenticator"""
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, 'aauthenticate'):
+                    user_auth = await authenticator.aauthenticate(request)
+                else:
+                    user_auth = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth
+                return
+        request._not_authenticated()
+
+    async def alist(self, request, queryset=None):
+        """``ListModelMixin.list()`` for generic views, over ``queryset`` if given"""
+        if queryset is None:
+            queryset = self.filter_queryset(self.get_queryset())
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        objects = [obj async for obj in queryset]
+        return Response(self.get_serializer(objects, many=True).data)
@@ -0,0 +1,314 @@
+"""
+Endpoint benchmarks for ``manage.py benchmark``.
+
+Every route under ``/api/academics/`` and ``/api/auth/`` is discovered from
+the URL resolver. Routes that can be read with GET are requested as a
+typical student, using real primary keys picked from the database. Login is
+also benchmarked, since it's the one write every client does constantly. In
+process, each request runs through the test client with its SQL queries
+captured; one extra run under ``tracemalloc`` measures peak memory.
+Against a local server (``base_url``) only latency is measured.
+
+Results are plain dicts so they can be saved as JSON baselines and
+compared with ``compare``. A route regresses when it breaks an absolute
+budget, or when it is slower, issues more queries or uses more memory
+than its baseline by more than the tolerance.
+"""
+import json
+import math
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.test import APIClient
+
+
+PREFIXES = ('api/academics/', 'api/auth/')
+
+# Routes that need state a benchmark can't safely create, or that write
+SKIP = {
+    'uploadsession-detail': "needs a live upload session",
+    'message-stream': "endless event stream",
+}
+
+# Primary keys of detail routes, by router basename
+DETAIL_KEYS = {
+    'department': 'department',
+    'course': 'course',
+    'studentcourseenrollment': 'enrollment',
+    'coursedocument': 'document',
+    'coursenote': 'note',
+}
+
+# Query parameters the list/action routes need to do real work
+PARAMS = {
+    'search': lambda f: {'q': f['term']},
+    'coursedocument-list': lambda f: {'course': f['course']},
+    'coursedocument-detail': lambda f: {'course': f['course']},
+    'coursenote-list': lambda f: {'course': f['course']},
+    'coursenote-by-course': lambda f: {'course_id': f['course']},
+}
+
+# Differences this small are noise, whatever the percentage
+MIN_REGRESSION = {'p95_ms': 1.0, 'peak_memory_kb': 64}
+
+# Writes that are benchmarked anyway, with the request body to send
+POSTS = {
+    'login': lambda f: {'email': f['email'], 'password': f['password']},
+}
+
+
+class Scenario:
+    def __init__(self, name, method, path, params=None, data=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.params = params or {}
+        self.data = data
+
+    @property
+    def url(self):
+        return f'{self.path}?{urlencode(self.params)}' if self.params else self.path
+
+    def __repr__(self):
+        return f'<Scenario {self.name} {self.method} {self.url}>'
+
+
+def routes(prefixes=PREFIXES):
+    """``(name, route, methods)`` for each named API route, once per name"""
+    seen = set()
+
+    def walk(patterns, prefix):
+        for pattern in patterns:
+            route = prefix + str(pattern.pattern).lstrip('^').rstrip('$')
+            if isinstance(pattern, URLResolver):
+                yield from walk(pattern.url_patterns, route)
+            elif isinstance(pattern, URLPattern) and pattern.name and pattern.name not in seen:
+                if not route.startswith(prefixes) or 'format' in pattern.pattern.regex.groupindex:
+                    continue
+                seen.add(pattern.name)
+                yield pattern.name, route, allowed_methods(pattern.callback)
+
+    yield from walk(get_resolver().url_patterns, '')
+
+
+def allowed_methods(callback):
+    actions = getattr(callback, 'actions', None)
+    if actions is not None:
+        return {method.upper() for method in actions}
+    view_class = getattr(callback, 'view_class', None) or getattr(callback, 'cls', None)
+    if view_class is None:
+        return {'GET'}
+    return {method.upper() for method in view_class.http_method_names if hasattr(view_class, method)} - {'OPTIONS', 'HEAD'}
+
+
+def find_fixtures(password):
+    """
+    Objects to request: the student with the most active enrollments (the
+    heaviest dashboard), the most popular course and rows from it.
+    """
+    from django.contrib.auth import get_user_model
+    from academics.models import CourseDocument, CourseNote, StudentCourseEnrollment
+
+    busiest = (
+        StudentCourseEnrollment.objects.filter(is_active=True, student__is_staff=False)
+        .values('student').annotate(courses=Count('id')).order_by('-courses', 'student')[:1]
+    )
+    if not busiest:
+        raise ValueError('The database has no enrolled students; seed it first (manage.py seed_scale)')
+    student = get_user_model().objects.get(pk=busiest[0]['student'])
+    enrollment = (
+        StudentCourseEnrollment.objects.filter(student=student, is_active=True)
+        .select_related('course').order_by('-course__active_enrollment_count', 'pk').first()
+    )
+    course = enrollment.course
+    note = CourseNote.objects.filter(course=course, is_active=True).order_by('pk').first()
+    document = CourseDocument.objects.filter(course=course, is_active=True).order_by('pk').first()
+    term = (note.title.split() or ['course'])[0].lower() if note else course.title.split()[0].lower()
+    return {
+        'user': student,
+        'email': student.email,
+        'password': password,
+        'department': course.department_id,
+        'course': course.pk,
+        'enrollment': enrollment.pk,
+        'note': note.pk if note else None,
+        'document': document.pk if document else None,
+        'document_readable': bool(document and document.file and document.file.storage.exists(document.file.name)),
+        'term': term,
+    }
+
+
+def build_scenarios(fixtures, only=None):
+    """``(scenarios, skipped)`` where ``skipped`` maps route names to reasons"""
+    scenarios = []
+    skipped = {}
+    for name, route, methods in routes():
+        if only and name not in only:
+            continue
+        if name in SKIP:
+            skipped[name] = SKIP[name]
+            continue
+        if name == 'coursedocument-download' and not fixtures['document_readable']:
+            skipped[name] = "no readable document file"
+            continue
+
+        path = '/' + route
+        if '(?P<pk>' in route:
+            key = DETAIL_KEYS.get(name.rsplit('-', 1)[0])
+            if key is None or fixtures.get(key) is None:
+                skipped[name] = "no object to request"
+                continue
+            path = path.replace('(?P<pk>[^/.]+)', str(fixtures[key]))
+
+        if name in POSTS:
+            scenarios.append(Scenario(name, 'POST', path, data=POSTS[name](fixtures)))
+        elif 'GET' in methods:
+            params = PARAMS[name](fixtures) if name in PARAMS else None
+            scenarios.append(Scenario(name, 'GET', path, params=params))
+        else:
+            skipped[name] = "write-only route"
+    return scenarios, skipped
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(name, durations, statuses, queries=None, peak=None):
+    ordered = sorted(durations)
+    total = sum(ordered)
+    return {
+        'name': name,
+        'requests': len(ordered),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'throughput_rps': round(len(ordered) / total, 1) if total else None,
+        'queries': queries,
+        'peak_memory_kb': round(peak / 1024, 1) if peak is not None else None,
+        'statuses': sorted(set(statuses)),
+    }
+
+
+class InProcessRunner:
+    """Requests through the DRF test client, authenticated as ``user``"""
+
+    def __init__(self, user, before_request=None):
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.before_request = before_request
+
+    def request(self, scenario):
+        if self.before_request:
+            self.before_request()
+        if scenario.method == 'POST':
+            response = self.client.post(scenario.path, scenario.data, format='json')
+        else:
+            response = self.client.get(scenario.path, scenario.params)
+        # Streaming downloads only cost anything once they are read
+        if getattr(response, 'streaming', False):
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+    def run(self, scenario, iterations, warmup):
+        for _ in range(warmup):
+            self.request(scenario)
+        durations, statuses, query_counts = [], [], []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                statuses.append(self.request(scenario))
+                durations.append(time.perf_counter() - started)
+            query_counts.append(len(queries))
+
+        tracemalloc.start()
+        try:
+            self.request(scenario)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return summarize(scenario.name, durations, statuses, max(query_counts, default=0), peak)
+
+
+class HTTPRunner:
+    """Requests against a running server, authenticated with a fresh JWT"""
+
+    def __init__(self, base_url, user, timeout=30):
+        from users.tokens import RefreshToken
+        self.base_url = base_url.rstrip('/')
+        self.token = str(RefreshToken.for_user(user).access_token)
+        self.timeout = timeout
+
+    def request(self, scenario):
+        body = json.dumps(scenario.data).encode() if scenario.data is not None else None
+        request = urllib.request.Request(
+            self.base_url + scenario.url,
+            data=body,
+            method=scenario.method,
+            headers={'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def run(self, scenario, iterations, warmup):
+        for _ in range(warmup):
+            self.request(scenario)
+        durations, statuses = [], []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            statuses.append(self.request(scenario))
+            durations.append(time.perf_counter() - started)
+        return summarize(scenario.name, durations, statuses)
+
+
+def budget_for(budgets, name):
+    limits = dict(budgets.get('default', {}))
+    limits.update(budgets.get('routes', {}).get(name, {}))
+    return limits
+
+
+def compare(results, baseline=None, budgets=None, tolerance=0.25):
+    """
+    Human-readable problems: broken budgets, failed requests and
+    regressions against ``baseline`` (a previous run's results).
+    """
+    problems = []
+    previous = {result['name']: result for result in (baseline or {}).get('results', [])}
+    for result in results:
+        name = result['name']
+        failed = [status for status in result['statuses'] if status >= 400]
+        if failed:
+            problems.append(f'{name}: responded with {", ".join(map(str, failed))}')
+
+        for metric, limit in budget_for(budgets or {}, name).items():
+            value = result.get(metric)
+            if value is not None and value > limit:
+                problems.append(f'{name}: {metric} {value} is over its budget of {limit}')
+
+        before = previous.get(name)
+        if before is None:
+            continue
+        if result['queries'] is not None and before.get('queries') is not None \
+                and result['queries'] > before['queries']:
+            problems.append(f"{name}: {result['queries']} queries, up from {before['queries']}")
+        for metric in ('p95_ms', 'peak_memory_kb'):
+            value, old = result.get(metric), before.get(metric)
+            if value is not None and old and value > old * (1 + tolerance) \
+                    and value - old > MIN_REGRESSION[metric]:
+                problems.append(f'{name}: {metric} {value} is {value / old - 1:.0%} above the baseline {old}')
+    return problems
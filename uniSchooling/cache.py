@@ -0,0 +1,238 @@
+"""
+Two-tier caching helpers: a small per-process LRU in front of Django's cache
+framework, with single-flight protection so concurrent misses for the same
+key are computed once.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU with a per-entry time to live"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _MISSING
+        self.error = None
+
+
+class TieredCache:
+    """
+    Per-process ``LRUCache`` (L1) backed by a Django cache alias (L2).
+
+    ``get_or_set`` collapses concurrent misses: inside a process only one
+    thread computes a key while the others wait for its result, and across
+    processes a short ``cache.add`` lock makes the other processes wait for
+    the value to appear in L2 rather than computing it too.
+
+    Invalidation works through namespace generations that are part of every
+    key, so bumping a namespace orphans all of its entries in both tiers.
+
+    ``amake_key`` and ``aget_or_set`` are the same for async code; there,
+    concurrent misses are collapsed per event loop.
+    """
+
+    def __init__(self, alias='default', prefix='tiered', local_size=1024,
+                 local_ttl=60, timeout=300, lock_timeout=10, poll_interval=0.05):
+        self.alias = alias
+        self.prefix = prefix
+        self.local = LRUCache(local_size, local_ttl)
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        # (event loop id, key) -> future of the computation in flight
+        self._async_flights = {}
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    # Namespaces -------------------------------------------------------------
+
+    def _generation_key(self, namespace):
+        return f'{self.prefix}:gen:{namespace}'
+
+    def generation(self, namespace):
+        key = self._generation_key(namespace)
+        generation = self.shared.get(key)
+        if generation is None:
+            # Start from the clock rather than 1 so that, if the shared cache
+            # is flushed, stale L1 entries from the old generation can't match
+            self.shared.add(key, time.time_ns(), None)
+            generation = self.shared.get(key)
+        return generation
+
+    def invalidate(self, namespace):
+        key = self._generation_key(namespace)
+        try:
+            self.shared.incr(key)
+        except ValueError:
+            self.shared.set(key, time.time_ns(), None)
+
+    async def ageneration(self, namespace):
+        key = self._generation_key(namespace)
+        generation = await self.shared.aget(key)
+        if generation is None:
+            await self.shared.aadd(key, time.time_ns(), None)
+            generation = await self.shared.aget(key)
+        return generation
+
+    @staticmethod
+    def _digest(parts):
+        # Hash the variable parts so keys stay short and memcached-safe
+        return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def make_key(self, namespace, *parts):
+        return f'{self.prefix}:{namespace}:{self.generation(namespace)}:{self._digest(parts)}'
+
+    async def amake_key(self, namespace, *parts):
+        return f'{self.prefix}:{namespace}:{await self.ageneration(namespace)}:{self._digest(parts)}'
+
+    # Lookups ----------------------------------------------------------------
+
+    def get_or_set(self, key, compute, cacheable=lambda value: True):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = self.shared.get(key, _MISSING)
+        if value is not _MISSING:
+            self.local.set(key, value)
+            return value
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait(self.lock_timeout)
+            if flight.error is not None:
+                raise flight.error
+            if flight.value is not _MISSING:
+                return flight.value
+            # The leader took too long; compute rather than fail the request
+            return compute()
+
+        try:
+            flight.value = self._compute_once(key, compute, cacheable)
+            return flight.value
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    async def aget_or_set(self, key, compute, cacheable=lambda value: True):
+        """``get_or_set`` for a coroutine function ``compute``"""
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = await self.shared.aget(key, _MISSING)
+        if value is not _MISSING:
+            self.local.set(key, value)
+            return value
+
+        # Futures belong to one event loop, so flights are tracked per loop
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        flight = self._async_flights.get(flight_key)
+        if flight is not None:
+            return await asyncio.shield(flight)
+
+        flight = self._async_flights[flight_key] = loop.create_future()
+        try:
+            value = await compute()
+            if cacheable(value):
+                await self.shared.aset(key, value, self.timeout)
+                self.local.set(key, value)
+            flight.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as error:
+            flight.set_exception(error)
+            # Retrieve it, so a flight nobody waited for isn't logged
+            flight.exception()
+            raise
+        finally:
+            self._async_flights.pop(flight_key, None)
+
+    def _compute_once(self, key, compute, cacheable):
+        lock_key = f'{key}:lock'
+        if not self.shared.add(lock_key, 1, self.lock_timeout):
+            # Another process is computing this key; wait for it to land in L2
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                value = self.shared.get(key, _MISSING)
+                if value is not _MISSING:
+                    self.local.set(key, value)
+                    return value
+                if self.shared.get(lock_key) is None:
+                    # Finished without storing anything (not cacheable)
+                    break
+            return self._store(key, compute(), cacheable)
+
+        try:
+            return self._store(key, compute(), cacheable)
+        finally:
+            self.shared.delete(lock_key)
+
+    def _store(self, key, value, cacheable):
+        if cacheable(value):
+            self.shared.set(key, value, self.timeout)
+            self.local.set(key, value)
+        return value
@@ -0,0 +1,331 @@
+"""
+Per-route request metrics in Prometheus text format.
+
+``MetricsMiddleware`` records, for every request, the resolved route name
+(``coursenote-featured``, ``message-list``, ...), the method and status,
+the latency, the response size and the number and duration of the SQL
+queries it ran (through ``uniSchooling.querywatch``). It works for both
+sync and async requests.
+
+Each thread aggregates into its own shard, so recording never contends
+on a lock; shards are only merged when the metrics are read. With several
+worker processes, set ``METRICS_DIR`` to a directory they share: every
+process writes its aggregates there every ``METRICS_FLUSH_INTERVAL``
+seconds (and at exit), and ``/metrics`` sums the files of all processes.
+Files of processes that stopped long ago (``METRICS_RETENTION``) are
+removed, which Prometheus sees as an ordinary counter reset.
+"""
+import atexit
+import glob
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from rest_framework import authentication, permissions
+from rest_framework.views import APIView
+
+from .querywatch import watching
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by route, method and status', None),
+    'http_request_duration_seconds': ('histogram', 'Request latency by route', DURATION_BUCKETS),
+    'http_response_size_bytes': ('histogram', 'Response body size by route', SIZE_BUCKETS),
+    'http_request_db_queries': ('histogram', 'SQL queries per request by route', QUERY_BUCKETS),
+    'http_request_db_duration_seconds_total': ('counter', 'Time spent in SQL queries by route', None),
+    # Recorded by uniSchooling.nplusone for sampled requests
+    'http_request_n_plus_one_total': ('counter', 'Repeated per-row queries by route and serializer field', None),
+}
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Shard:
+    """One thread's aggregates; only that thread writes to it"""
+
+    def __init__(self):
+        self.counters = {}
+        # (name, labels) -> [count per bucket..., count above the last bucket, sum]
+        self.histograms = {}
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.process_id = f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels, value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        buckets = METRICS[name][2]
+        series = histograms.get(key)
+        if series is None:
+            series = histograms[key] = [0] * (len(buckets) + 1) + [0]
+        series[bisect_left(buckets, value)] += 1
+        series[-1] += value
+
+    def clear(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.counters.clear()
+                shard.histograms.clear()
+
+    def snapshot(self):
+        """This process's aggregates as JSON-serializable data"""
+        counters = {}
+        histograms = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # dict.copy() is atomic, so a writing thread can't break the merge
+            for key, value in shard.counters.copy().items():
+                counters[key] = counters.get(key, 0) + value
+            for key, series in shard.histograms.copy().items():
+                merged = histograms.setdefault(key, [0] * len(series))
+                for index, value in enumerate(list(series)):
+                    merged[index] += value
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), series] for (name, labels), series in histograms.items()],
+        }
+
+    # Sharing between processes ----------------------------------------------
+
+    def path(self, directory):
+        return os.path.join(directory, f'{self.process_id}.json')
+
+    def flush(self):
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        self._last_flush = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as handle:
+                json.dump(self.snapshot(), handle)
+            os.replace(temp, self.path(directory))
+        except BaseException:
+            if os.path.exists(temp):
+                os.unlink(temp)
+            raise
+
+    def maybe_flush(self):
+        if settings.METRICS_DIR and time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def collect(self):
+        """Snapshots of every process sharing ``METRICS_DIR``, this one live"""
+        snapshots = [self.snapshot()]
+        directory = settings.METRICS_DIR
+        if not directory:
+            return snapshots
+        own = self.path(directory)
+        cutoff = time.time() - settings.METRICS_RETENTION
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            if path == own:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    continue
+                with open(path) as handle:
+                    snapshots.append(json.load(handle))
+            except (OSError, ValueError):
+                # Removed or replaced while we were reading it
+                continue
+        return snapshots
+
+
+registry = Registry()
+atexit.register(lambda: registry.flush())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else str(int(value))
+    return str(value)
+
+
+def render(snapshots):
+    """Prometheus text exposition of the summed ``snapshots``"""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', []):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, series in snapshot.get('histograms', []):
+            if name not in METRICS or len(series) != len(METRICS[name][2]) + 2:
+                continue
+            merged = histograms.setdefault((name, tuple(map(tuple, labels))), [0] * len(series))
+            for index, value in enumerate(series):
+                merged[index] += value
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+            continue
+        for (metric, labels), series in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, [("le", _number(float(bound)))])} {cumulative}')
+            count = cumulative + series[len(buckets)]
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(series[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+    """``execute_wrapper`` that counts and times the queries of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    # Unresolved paths share one label so scanners can't explode the series
+    return match.view_name if match and match.view_name else 'unmatched'
+
+
+def response_size(response):
+    if getattr(response, 'streaming', False):
+        length = response.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        queries = QueryTimer()
+        with watching(queries):
+            started = time.perf_counter()
+            response = self.get_response(request)
+            elapsed = time.perf_counter() - started
+        self.record(request, response, elapsed, queries)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        queries = QueryTimer()
+        with watching(queries):
+            started = time.perf_counter()
+            response = await self.get_response(request)
+            elapsed = time.perf_counter() - started
+        self.record(request, response, elapsed, queries)
+        return response
+
+    def record(self, request, response, elapsed, queries):
+        route = route_name(request)
+        method = request.method if request.method in METHODS else 'other'
+        labels = (('route', route), ('method', method))
+        registry.inc('http_requests_total', labels + (('status', str(response.status_code)),))
+        registry.observe('http_request_duration_seconds', labels, elapsed)
+        registry.observe('http_request_db_queries', labels, queries.count)
+        registry.inc('http_request_db_duration_seconds_total', labels, queries.duration)
+        size = response_size(response)
+        if size is not None:
+            registry.observe('http_response_size_bytes', labels, size)
+        registry.maybe_flush()
+
+
+class MetricsTokenAuthentication(authentication.BaseAuthentication):
+    """Lets a scraper in with ``Authorization: Bearer <METRICS_TOKEN>``"""
+
+    def authenticate(self, request):
+        token = settings.METRICS_TOKEN
+        header = request.headers.get('Authorization', '')
+        if token and header.startswith('Bearer ') and hmac.compare_digest(header[7:].strip(), token):
+            return AnonymousUser(), 'metrics-token'
+        return None
+
+
+class IsStaffOrScraper(permissions.BasePermission):
+    def has_permission(self, request, view):
+        if request.auth == 'metrics-token':
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+class MetricsView(APIView):
+    """Staff-only Prometheus scrape endpoint, summed over all worker processes"""
+    authentication_classes = [MetricsTokenAuthentication, *APIView.authentication_classes]
+    permission_classes = [IsStaffOrScraper]
+
+    def get(self, request):
+        return HttpResponse(render(registry.collect()), content_type=CONTENT_TYPE)
@@ -0,0 +1,156 @@
+"""
+Sampling N+1 query detector.
+
+For a sample of requests (``NPLUSONE_SAMPLE_RATE``), every SQL statement
+goes through an execute wrapper (``uniSchooling.querywatch``). The detector normalizes it to
+a fingerprint (literals and ``IN`` lists collapsed) and notes the project
+code that ran it. When the same fingerprint comes from the same place
+``NPLUSONE_THRESHOLD`` times in one request, it's reported once. The
+report names the serializer field being rendered when the query ran, such
+as ``CourseNoteSerializer.course_title``, because that is usually the
+missing ``select_related``.
+
+Reports are logged to ``uniSchooling.nplusone`` and counted in the
+``http_request_n_plus_one_total`` metric. With ``NPLUSONE_RAISE`` (meant
+for tests) the offending query raises ``NPlusOneError`` instead, and
+``detecting()`` does the same around any block of code.
+"""
+import logging
+import os
+import random
+import re
+import sys
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from rest_framework.fields import Field
+
+from . import metrics, querywatch
+
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*%s\s*,)*\s*%s\s*\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+# Other execute_wrappers sit between the query and the code that ran it
+_WRAPPER_FILES = {os.path.abspath(path) for path in (__file__, metrics.__file__, querywatch.__file__)}
+_project_files = {}
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    """``sql`` with its literals and IN lists collapsed, so per-row variants match"""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _is_project_file(filename):
+    known = _project_files.get(filename)
+    if known is None:
+        path = os.path.abspath(filename)
+        known = _project_files[filename] = (
+            path.startswith(str(settings.BASE_DIR))
+            and f'{os.sep}site-packages{os.sep}' not in path
+            and path not in _WRAPPER_FILES
+        )
+    return known
+
+
+def origin(frame):
+    """``(location, serializer_field)`` of the code that ran a query"""
+    location = None
+    field = None
+    while frame is not None:
+        code = frame.f_code
+        if field is None and code.co_name in ('get_attribute', 'to_representation'):
+            owner = frame.f_locals.get('self')
+            if isinstance(owner, Field) and owner.field_name:
+                field = f'{type(owner.parent).__name__}.{owner.field_name}'
+        if location is None and _is_project_file(code.co_filename):
+            location = f'{os.path.relpath(code.co_filename, settings.BASE_DIR)}:{frame.f_lineno} in {code.co_name}'
+        if location is not None and field is not None:
+            break
+        frame = frame.f_back
+    return location or 'unknown', field
+
+
+class Detector:
+    """``execute_wrapper`` collecting repeated query shapes for one unit of work"""
+
+    def __init__(self, threshold=None, raise_errors=False, request=None):
+        self.threshold = threshold or settings.NPLUSONE_THRESHOLD
+        self.raise_errors = raise_errors
+        self.request = request
+        self.counts = {}
+        self.reports = []
+
+    def __call__(self, execute, sql, params, many, context):
+        location, field = origin(sys._getframe(1))
+        key = (fingerprint(sql), location)
+        count = self.counts[key] = self.counts.get(key, 0) + 1
+        if count == self.threshold:
+            self.report(key[0], location, field)
+        return execute(sql, params, many, context)
+
+    def report(self, sql, location, field):
+        # The URL is resolved before the view runs, so the route is known here
+        route = metrics.route_name(self.request) if self.request is not None else ''
+        report = {'sql': sql, 'location': location, 'field': field or '', 'route': route}
+        self.reports.append(report)
+        message = (
+            f"N+1 queries: {self.threshold}+ identical queries from {location}"
+            f"{f' rendering {field}' if field else ''}: {sql[:300]}"
+        )
+        if self.raise_errors:
+            raise NPlusOneError(message)
+        logger.warning(message)
+        metrics.registry.inc(
+            'http_request_n_plus_one_total',
+            (('route', report['route']), ('field', report['field'] or report['location'])),
+        )
+
+
+@contextmanager
+def detecting(threshold=None, raise_errors=True):
+    """Watch the queries run inside the block; fails on N+1 by default"""
+    detector = Detector(threshold, raise_errors)
+    with querywatch.watching(detector):
+        yield detector
+
+
+class NPlusOneMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        rate = settings.NPLUSONE_SAMPLE_RATE
+        return bool(rate) and random.random() < rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        with querywatch.watching(Detector(raise_errors=settings.NPLUSONE_RAISE, request=request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        with querywatch.watching(Detector(raise_errors=settings.NPLUSONE_RAISE, request=request)):
+            return await self.get_response(request)
@@ -0,0 +1,222 @@
+"""
+Keyset (cursor) pagination shared by the list endpoints of every app.
+
+Instead of ``OFFSET``/``COUNT(*)`` a page is fetched by filtering on the
+position of the last row that was returned, so page 10,000 costs the same as
+page one as long as the ordering is backed by an index. The position is sent
+to the client as an opaque base64 cursor.
+"""
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def reverse_ordering(ordering):
+    """Flip the direction of every field in an ordering tuple"""
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+def keyset_filter(ordering, position):
+    """
+    Build the lexicographic "comes after ``position``" condition for a
+    (possibly mixed-direction) ordering, e.g. for ``('-sent_at', 'id')``:
+    ``sent_at < x OR (sent_at = x AND id > y)``.
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for field, value in zip(ordering, position):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def _position_value(obj, field):
+    value = obj
+    for attr in field.lstrip('-').split('__'):
+        value = getattr(value, attr)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def get_position(obj, ordering):
+    """Values of the ordering fields for ``obj``, in ordering order"""
+    return [_position_value(obj, field) for field in ordering]
+
+
+def _ordering_field(queryset, field):
+    """The model field (or annotation's output field) ``field`` orders by"""
+    name = field.lstrip('-')
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    model = queryset.model
+    *relations, last = name.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    if last == 'pk':
+        return model._meta.pk
+    return model._meta.get_field(last)
+
+
+def clean_position(queryset, ordering, position):
+    """
+    ``position`` from a cursor converted to the ordering fields' types.
+    Raises ``ValueError`` for values that don't fit, since cursors come from
+    clients and may be forged.
+    """
+    try:
+        return [
+            _ordering_field(queryset, field).to_python(value)
+            for field, value in zip(ordering, position)
+        ]
+    except (ValidationError, TypeError, ValueError, FieldDoesNotExist) as error:
+        raise ValueError('Invalid cursor') from error
+
+
+def encode_cursor(position, reverse=False):
+    payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    """Return ``(position, reverse)`` or raise ``ValueError`` for a bad cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        position, reverse = payload['p'], bool(payload.get('r'))
+    except (TypeError, KeyError, UnicodeError, binascii.Error, json.JSONDecodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(position, list) or len(position) != len(ordering):
+        raise ValueError('Invalid cursor')
+    return position, reverse
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque-cursor pagination over a composite, unique ordering.
+
+    Views declare their natural ordering as ``keyset_ordering``; it must end
+    with a unique field (normally ``id``) and contain no nullable fields.
+    When the view uses ``OrderingFilter`` and the client asks for an
+    ordering, that ordering is used instead with ``id`` as tie-breaker.
+    Otherwise a filter backend with a ``get_keyset_ordering`` method may
+    supply one, e.g. search relevance.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views"""
+        return self.finish_page([obj async for obj in self.page_queryset(queryset, request, view)])
+
+    def page_queryset(self, queryset, request, view):
+        """The queryset of the requested page plus one row"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        self.position, self.reverse = None, False
+        if encoded:
+            try:
+                self.position, self.reverse = decode_cursor(encoded, self.ordering)
+                self.position = clean_position(queryset, self.ordering, self.position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+
+        ordering = reverse_ordering(self.ordering) if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(keyset_filter(ordering, self.position))
+
+        # One extra row tells us whether there is another page, no COUNT(*)
+        return queryset[:self.page_size + 1]
+
+    def finish_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = self.position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'API_PAGE_SIZE', 50)
+        maximum = getattr(settings, 'API_MAX_PAGE_SIZE', 200)
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return default
+        return max(1, min(size, maximum))
+
+    def get_ordering(self, request, queryset, view):
+        for backend in getattr(view, 'filter_backends', ()):
+            if issubclass(backend, OrderingFilter) and request.query_params.get(backend.ordering_param):
+                requested = backend().get_ordering(request, queryset, view)
+                if requested:
+                    requested = tuple(requested)
+                    if not {'id', '-id', 'pk', '-pk'} & set(requested):
+                        requested += ('id',)
+                    return requested
+        for backend in getattr(view, 'filter_backends', ()):
+            if hasattr(backend, 'get_keyset_ordering'):
+                ordering = backend().get_keyset_ordering(request, queryset, view)
+                if ordering:
+                    return tuple(ordering)
+        return tuple(getattr(view, 'keyset_ordering', self.ordering))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = encode_cursor(get_position(self.page[-1], self.ordering))
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        cursor = encode_cursor(get_position(self.page[0], self.ordering), reverse=True)
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
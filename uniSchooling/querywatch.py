@@ -0,0 +1,50 @@
+"""
+Per-request SQL ``execute_wrapper``s that also work for async views.
+
+``connection.execute_wrapper()`` only sees queries run on the calling
+thread's connection. Async views run their queries through
+``sync_to_async`` on another thread, so instead every connection gets one
+permanent dispatcher, and the wrappers of the current request live in a
+context variable, which ``sync_to_async`` carries over to that thread.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+_watchers = ContextVar('query_watchers', default=())
+
+
+def _dispatch(execute, sql, params, many, context):
+    watchers = _watchers.get()
+    # The first watcher is the outermost, as with nested execute_wrapper()s
+    for watcher in reversed(watchers):
+        execute = partial(watcher, execute)
+    return execute(sql, params, many, context)
+
+
+def install(connection):
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+@receiver(connection_created)
+def install_on_connect(sender, connection, **kwargs):
+    install(connection)
+
+
+@contextmanager
+def watching(*wrappers):
+    """Run ``wrappers`` around every query made in this context, on any thread"""
+    # Connections opened before this module was imported
+    for alias in connections:
+        install(connections[alias])
+    token = _watchers.set(_watchers.get() + wrappers)
+    try:
+        yield
+    finally:
+        _watchers.reset(token)
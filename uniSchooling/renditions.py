@@ -0,0 +1,156 @@
+"""
+Image renditions: small WebP thumbnails of uploaded images.
+
+After an image is saved, ``schedule`` queues a background job (see
+``jobs.queue``) in the same transaction. The job renders one WebP per bucket in
+``RENDITION_SIZES`` with EXIF and other metadata dropped, stores it under
+the source's SHA-256, and records the names in the model's ``renditions``
+JSON field. Renditions are cached by source hash, so re-uploading an image
+that was already processed, or the same image on another object, renders
+nothing.
+"""
+import hashlib
+import io
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.dispatch import Signal
+from jobs.queue import task
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'gif', 'webp')
+WEBP_QUALITY = 80
+
+# Sent with ``sender=<model>`` and ``instance_pk`` after new renditions are recorded
+renditions_ready = Signal()
+
+def sizes():
+    return settings.RENDITION_SIZES
+
+
+def is_image(name):
+    return bool(name) and name.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+
+def rendition_name(digest, size):
+    return f'renditions/{digest[:2]}/{digest}/{size}.webp'
+
+
+def render(data):
+    """
+    ``{size: webp bytes}`` for the image in ``data``, each fitting inside the
+    bucket's square and never upscaled. Raises ``OSError`` for undecodable
+    data and ``Image.DecompressionBombError`` for images too large to decode.
+    """
+    buckets = sizes()
+    with Image.open(io.BytesIO(data)) as image:
+        # Lets the JPEG decoder downscale while decoding instead of afterwards
+        largest = max(buckets.values())
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+        output = {}
+        for name, edge in sorted(buckets.items(), key=lambda item: -item[1]):
+            image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            # No exif/icc arguments: the variants carry no metadata
+            image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+            output[name] = buffer.getvalue()
+    return output
+
+
+@task(priority=-10, max_attempts=3)
+def generate(model_label, pk, field_name, digest=None):
+    """
+    Render and record renditions for ``field_name`` on one row. Runs as a
+    background job; the source may have changed or gone away meanwhile.
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    field_file = getattr(instance, field_name)
+    if not field_file or not is_image(field_file.name):
+        return None
+    source = field_file.name
+
+    names = {size: rendition_name(digest, size) for size in sizes()} if digest else None
+    if names is None or not all(default_storage.exists(name) for name in names.values()):
+        with field_file.open('rb') as handle:
+            data = handle.read()
+        digest = digest or hashlib.sha256(data).hexdigest()
+        names = {size: rendition_name(digest, size) for size in sizes()}
+        missing = [size for size, name in names.items() if not default_storage.exists(name)]
+        if missing:
+            try:
+                rendered = render(data)
+            except (OSError, ValueError, Image.DecompressionBombError):
+                # Retrying won't decode it either
+                logger.warning('Could not render %s %s (%s)', model_label, pk, source, exc_info=True)
+                return None
+            for size in missing:
+                default_storage.save(names[size], ContentFile(rendered[size]))
+
+    renditions = dict(names, source=source, sha256=digest)
+    # Only record them if the row still points at the image that was rendered
+    updated = model.objects.filter(pk=pk, **{field_name: source}).update(renditions=renditions)
+    if updated:
+        renditions_ready.send(sender=model, instance_pk=pk)
+    return renditions
+
+
+def needs_renditions(instance, field_name):
+    field_file = getattr(instance, field_name)
+    if not field_file or not is_image(field_file.name):
+        return bool(instance.renditions)
+    return instance.renditions.get('source') != field_file.name
+
+
+def schedule(instance, field_name, digest=None):
+    """
+    Queue rendition work for ``instance``; it runs once the current
+    transaction has committed.
+    """
+    field_file = getattr(instance, field_name)
+    if instance.renditions and instance.renditions.get('source') != field_file.name:
+        # Don't serve thumbnails of the previous image while new ones render
+        type(instance).objects.filter(pk=instance.pk).update(renditions={})
+        instance.renditions = {}
+    if not field_file or not is_image(field_file.name):
+        return
+
+    generate.enqueue(instance._meta.label, instance.pk, field_name, digest)
+
+
+def thumbnail_urls(renditions, request=None):
+    """``{'small': url, 'medium': url}`` from a ``renditions`` value, or ``None``"""
+    if not renditions:
+        return None
+    urls = {}
+    for size in sizes():
+        name = renditions.get(size)
+        if not name:
+            return None
+        url = default_storage.url(name)
+        urls[size] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+class ThumbnailsField(serializers.ReadOnlyField):
+    """Serializes a model's ``renditions`` as ``{small, medium}`` URLs"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'renditions')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return thumbnail_urls(value, self.context.get('request'))
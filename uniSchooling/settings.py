@@ -41,18 +41,21 @@ INSTALLED_APPS = [
     # all other installed apps
     'users',
     'academics',
+    'jobs',
     'rest_framework',
     'corsheaders',
 ]
 
 REST_FRAMEWORK = { 
 	'DEFAULT_AUTHENTICATION_CLASSES': [ 
-		'rest_framework_simplejwt.authentication.JWTAuthentication', 
+		'users.authentication.CachedJWTAuthentication', 
 	], 
 } 
 
 
 MIDDLEWARE = [
+    'uniSchooling.metrics.MetricsMiddleware',
+    'uniSchooling.nplusone.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -122,6 +125,9 @@ SIMPLE_JWT = {
 
 
 WSGI_APPLICATION = 'uniSchooling.wsgi.application'
+# The message stream (users.feed) needs an ASGI server, e.g.
+# ``uvicorn uniSchooling.asgi:application``; under WSGI it answers 501.
+ASGI_APPLICATION = 'uniSchooling.asgi.application'
 
 
 # Database
@@ -139,6 +145,51 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use a shared backend (Redis/Memcached/database) when running several
+# worker processes so cache invalidation reaches all of them.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Users resolved from JWTs (users.authentication): per-process LRU in
+# front of the shared cache
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_SIZE = 10_000
+AUTH_USER_CACHE_LOCAL_TTL = 30
+AUTH_USER_CACHE_TIMEOUT = 300
+
+# Revoked refresh tokens (users.revocation). Run purge_revoked_tokens
+# periodically (e.g. daily from cron) to drop rows of expired tokens.
+REVOCATION_CACHE_ALIAS = 'default'
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+REVOCATION_BLOOM_MIN_CAPACITY = 10_000
+REVOCATION_BLOOM_REBUILD_INTERVAL = 3600
+REVOKED_TOKEN_PURGE_CHUNK_SIZE = 5000
+
+# Server-Sent Events message feed (users.feed). Times are in seconds; the
+# buffer and backlog are numbers of messages per connection.
+MESSAGE_STREAM_HEARTBEAT = 15
+MESSAGE_STREAM_POLL_INTERVAL = 2
+MESSAGE_STREAM_BUFFER = 100
+MESSAGE_STREAM_BACKLOG = 100
+# How far back each poll looks for messages other workers committed late
+MESSAGE_STREAM_RESCAN_WINDOW = 30
+
+# Per-user message read state and unread counts (users.reads)
+MESSAGE_COUNT_CACHE_ALIAS = 'default'
+MESSAGE_COUNT_CACHE_TIMEOUT = 3600
+MESSAGE_TOTAL_CACHE_TIMEOUT = 60
+
+# Response cache for the catalog and note endpoints (academics.cache)
+RESPONSE_CACHE_LOCAL_SIZE = 512
+RESPONSE_CACHE_TIMEOUT = 300
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -181,9 +232,10 @@ AUTH_USER_MODEL = 'users.User'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# EmailOrUsernameModelBackend already covers ModelBackend's lookups (and
+# permissions); listing both would make every failed login hash twice.
 AUTHENTICATION_BACKENDS = [
     'users.backends.EmailOrUsernameModelBackend',
-    'django.contrib.auth.backends.ModelBackend',
 ]
 
 
@@ -209,4 +261,62 @@ ALLOWED_DOCUMENT_EXTENSIONS = [
 
 MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
 
+# Resumable chunked uploads (academics.uploads)
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'upload_sessions'
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+CHUNKED_UPLOAD_EXPIRY = timedelta(hours=24)
+# Sessions whose hash state each worker keeps between chunks
+CHUNKED_UPLOAD_HASHER_CACHE_SIZE = 256
+
+# Document downloads (academics.downloads). Set the backend to 'nginx'
+# (X-Accel-Redirect to an internal location aliased to MEDIA_ROOT) or 'apache'
+# (X-Sendfile via mod_xsendfile) to let the web server send the bytes.
+DOCUMENT_DOWNLOAD_BACKEND = None
+DOCUMENT_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Bulk enrollment (academics.enrollments), students x courses per request
+BULK_ENROLLMENT_MAX_PAIRS = 20_000
+
+# Student CSV import (users.imports); None hashes passwords on every core
+STUDENT_IMPORT_PROCESSES = None
+STUDENT_IMPORT_BATCH_SIZE = 1000
+# Uploaded CSVs waiting for their import job; keep it private, they hold passwords
+STUDENT_IMPORT_DIR = BASE_DIR / 'student_imports'
+
+# Per-route request metrics served at /metrics (uniSchooling.metrics). With
+# several worker processes, point METRICS_DIR at a directory they share.
+METRICS_ENABLED = True
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5
+METRICS_RETENTION = 24 * 3600
+METRICS_TOKEN = None  # optional bearer token for the Prometheus scraper
+
+# N+1 query detection (uniSchooling.nplusone) on a sample of requests.
+# NPLUSONE_RAISE turns detections into errors, e.g. in tests.
+NPLUSONE_SAMPLE_RATE = 0.01
+NPLUSONE_THRESHOLD = 5
+NPLUSONE_RAISE = False
+
+# Latency/query budgets checked by `manage.py benchmark`
+BENCHMARK_BUDGETS = BASE_DIR / 'benchmarks' / 'budgets.json'
+
+# Image thumbnails (uniSchooling.renditions), bounding box per size bucket
+RENDITION_SIZES = {'small': 160, 'medium': 480}
+
+# Document text extraction (academics.extraction); None uses every core
+EXTRACTION_PROCESSES = None
+EXTRACTION_MAX_CHARS = 2_000_000
+
+# Background jobs (jobs.queue), run by `manage.py run_workers`
+JOBS_EAGER = False  # run jobs in-process right after commit, e.g. in tests
+JOBS_LEASE_SECONDS = 300
+JOBS_POLL_INTERVAL = 1.0
+JOBS_RETRY_BACKOFF = 10
+JOBS_RETRY_BACKOFF_MAX = 3600
+JOBS_KEEP_FINISHED = timedelta(days=7)
+
+# Keyset pagination for list endpoints (uniSchooling.pagination)
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
 
@@ -12,8 +12,8 @@ class UserAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['subject', 'sender', 'sent_at', 'is_read']
-    list_filter = ['sent_at', 'is_read', 'sender__is_staff']
+    list_display = ['subject', 'sender', 'sent_at']
+    list_filter = ['sent_at', 'sender__is_staff']
     search_fields = ['subject', 'body', 'sender__username', 'sender__email']
     readonly_fields = ['sent_at']
     ordering = ['-sent_at']
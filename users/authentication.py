@@ -0,0 +1,135 @@
+"""
+JWT authentication without a database query per request.
+
+``CachedJWTAuthentication`` resolves the ``user_id`` claim through a
+per-process ``LRUCache`` in front of the shared Django cache, and only
+reads the ``user`` table on a miss. Saving or deleting a user drops its
+entry (see ``users.signals``); other processes drop theirs when their
+local copy expires after ``AUTH_USER_CACHE_LOCAL_TTL`` seconds.
+
+Tokens carry the user's ``token_version`` (see ``users.tokens``), which
+goes up when the password changes. A token with an older version is
+rejected using the cached user, so signing out every session of a user
+doesn't need a blacklist lookup.
+
+``aauthenticate`` does the same for async views (``uniSchooling.asyncviews``).
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from uniSchooling.cache import LRUCache
+
+from .models import User
+from .tokens import TOKEN_VERSION_CLAIM
+
+
+_local = None
+
+
+def local_cache():
+    global _local
+    if _local is None:
+        _local = LRUCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_LOCAL_TTL)
+    return _local
+
+
+def cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+# Never cached; reading it on a cached user loads it from the database
+UNCACHED_FIELDS = {'password'}
+
+
+def _fields(user):
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in User._meta.concrete_fields if field.attname not in UNCACHED_FIELDS
+    }
+
+
+def _instance(fields):
+    # Fields missing from ``fields`` come back deferred
+    return User.from_db(router.db_for_read(User), list(fields), list(fields.values()))
+
+
+def get_cached_user(user_id):
+    """
+    The user with primary key ``user_id``, or ``None``, as a fresh instance
+    that may be a little out of date. Views that write to the user must
+    save only the fields they change (``update_fields``), or reload it.
+    """
+    key = cache_key(user_id)
+    fields = local_cache().get(key)
+    if fields is None:
+        shared = caches[settings.AUTH_USER_CACHE_ALIAS]
+        fields = shared.get(key)
+        if fields is None:
+            user = User.objects.filter(pk=user_id).first()
+            if user is None:
+                return None
+            fields = _fields(user)
+            shared.set(key, fields, settings.AUTH_USER_CACHE_TIMEOUT)
+        local_cache().set(key, fields)
+    return _instance(fields)
+
+
+async def aget_cached_user(user_id):
+    """``get_cached_user`` for async code"""
+    key = cache_key(user_id)
+    fields = local_cache().get(key)
+    if fields is None:
+        shared = caches[settings.AUTH_USER_CACHE_ALIAS]
+        fields = await shared.aget(key)
+        if fields is None:
+            user = await User.objects.filter(pk=user_id).afirst()
+            if user is None:
+                return None
+            fields = _fields(user)
+            await shared.aset(key, fields, settings.AUTH_USER_CACHE_TIMEOUT)
+        local_cache().set(key, fields)
+    return _instance(fields)
+
+
+def forget_user(user_id):
+    key = cache_key(user_id)
+    local_cache().delete(key)
+    caches[settings.AUTH_USER_CACHE_ALIAS].delete(key)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        return self.check_user(get_cached_user(self.user_id(validated_token)), validated_token)
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        # Checking the signature doesn't touch the database
+        validated_token = self.get_validated_token(raw_token)
+        user = await aget_cached_user(self.user_id(validated_token))
+        return self.check_user(user, validated_token), validated_token
+
+    def user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def check_user(self, user, validated_token):
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        # Tokens issued before the version claim existed count as version 0
+        if validated_token.get(TOKEN_VERSION_CLAIM, 0) < user.token_version:
+            raise AuthenticationFailed(_("The token has been revoked."), code="token_revoked")
+        return user
@@ -7,33 +7,31 @@ User = get_user_model()
 
 class EmailOrUsernameModelBackend(ModelBackend):
     """
-    This backend authenticates with either username or email
+    This backend authenticates with either username or email.
+
+    The identifier is looked up with one query against both unique columns
+    and at most one password hash is checked, even for unknown users, so a
+    login costs the same CPU whether or not the account exists. Hashes made
+    with outdated hasher parameters are upgraded by ``check_password``.
     """
     def authenticate(self, request, username=None, password=None, email=None, **kwargs):
-        # Try to authenticate by email if provided explicitly
-        if email:
-            try:
-                user = User.objects.get(email=email)
-                if user.check_password(password):
-                    return user
-            except User.DoesNotExist:
-                return None
-        
-        # Try with username parameter as either username or email
-        if username:
-            # Check if the username value could be an email
-            try:
-                # First try exact username match
-                user = User.objects.get(username=username)
-                if user.check_password(password):
-                    return user
-            except User.DoesNotExist:
-                try:
-                    # Then try with username as email
-                    user = User.objects.get(email=username)
-                    if user.check_password(password):
-                        return user
-                except User.DoesNotExist:
-                    return None
-                
-        return None
\ No newline at end of file
+        identifier = email or username or kwargs.get(User.USERNAME_FIELD)
+        if not identifier or password is None:
+            return None
+
+        user = self.get_login_user(identifier)
+        if user is None:
+            # Hash anyway so unknown accounts can't be told apart by timing
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_login_user(self, identifier):
+        """The user whose email, else whose username, is ``identifier``"""
+        matches = list(User.objects.filter(Q(email=identifier) | Q(username=identifier))[:2])
+        for user in matches:
+            if user.email == identifier:
+                return user
+        return matches[0] if matches else None
@@ -0,0 +1,247 @@
+"""
+Server-Sent Events feed of new messages, replacing polling of the message
+list.
+
+Each worker process has one ``Broadcaster``. Messages saved in this
+process are published from ``post_save`` once their transaction commits
+(see ``users.signals``). Messages saved by other workers are picked up by
+one poller per event loop, which asks the database every
+``MESSAGE_STREAM_POLL_INTERVAL`` seconds for rows above the highest id it
+has read so far, and for rows sent in the last
+``MESSAGE_STREAM_RESCAN_WINDOW`` seconds: ids are handed out before commit,
+so a message can show up below ids already seen. Ids published recently
+are remembered and not published again. A message whose transaction
+commits more than the window after it was sent is missed, until the
+client reconnects and catches up. Either way a message is serialized once
+per worker, however many clients are connected.
+
+Every connection has a buffer of ``MESSAGE_STREAM_BUFFER`` events. A client
+too slow to keep up loses its buffer and catches up from the database
+instead, so memory stays bounded and no message is skipped. Idle
+connections get a comment line every ``MESSAGE_STREAM_HEARTBEAT`` seconds
+to keep proxies from closing them.
+"""
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Message
+from .serializers import MessageSerializer
+
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds the browser waits before reconnecting
+RETRY_MS = 3000
+
+OVERFLOW = object()
+
+
+def encode(message):
+    data = json.dumps(MessageSerializer(message).data, cls=DjangoJSONEncoder)
+    return f'id: {message.pk}\nevent: message\ndata: {data}\n\n'.encode()
+
+
+async def backlog(after):
+    """The newest ``MESSAGE_STREAM_BACKLOG`` messages after id ``after``, oldest first"""
+    messages = Message.objects.filter(pk__gt=after).select_related('sender').order_by('-pk')
+    return [message async for message in messages[:settings.MESSAGE_STREAM_BACKLOG]][::-1]
+
+
+async def latest_id():
+    return await Message.objects.order_by('-pk').values_list('pk', flat=True).afirst() or 0
+
+
+class Subscription:
+    """One connection's bounded buffer of ``(message id, event bytes)``"""
+
+    def __init__(self, loop, size):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def put(self, event):
+        # Runs on self.loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.overflowed = True
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self):
+        event = await self.queue.get()
+        if event is OVERFLOW:
+            self.overflowed = False
+        return event
+
+
+class Broadcaster:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._pollers = {}
+        # Highest message id the poller has read; local publishes don't move it,
+        # since lower ids may still be committed by other workers
+        self.polled_id = None
+        # Message id -> time.monotonic() it was published by this process
+        self._published = {}
+
+    async def subscribe(self):
+        loop = asyncio.get_running_loop()
+        if self.polled_id is None:
+            # Before the caller's own catch-up query, so nothing falls in between
+            self.polled_id = await latest_id()
+        subscription = Subscription(loop, settings.MESSAGE_STREAM_BUFFER)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            poller = self._pollers.get(loop)
+            if poller is None or poller.done():
+                # Not in the request's context: its thread-sensitive executor
+                # goes away when the request ends, and its queries are its own
+                self._pollers[loop] = loop.create_task(self._poll(loop), context=contextvars.Context())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    async def close(self):
+        """Drop this event loop's connections and stop its poller, e.g. at shutdown"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscriptions = {s for s in self._subscriptions if s.loop is not loop}
+            poller = self._pollers.pop(loop, None)
+        if poller is not None:
+            poller.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await poller
+
+    def clear(self):
+        with self._lock:
+            self._subscriptions.clear()
+            self._pollers.clear()
+            self._published.clear()
+            self.polled_id = None
+
+    def publish(self, message_id, event):
+        """
+        Queue ``event`` for every connection, unless this message was already
+        published; callable from any thread
+        """
+        with self._lock:
+            if message_id in self._published:
+                return
+            self._published[message_id] = time.monotonic()
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, (message_id, event))
+            except RuntimeError:
+                # Its event loop is gone, and the connection with it
+                self.unsubscribe(subscription)
+
+    def publish_message(self, message):
+        self.publish(message.pk, encode(message))
+
+    async def poll(self):
+        """Publish the messages other worker processes committed since the last poll"""
+        window = settings.MESSAGE_STREAM_RESCAN_WINDOW
+        recent = Message.objects.filter(
+            Q(pk__gt=self.polled_id) | Q(sent_at__gte=timezone.now() - timedelta(seconds=window))
+        )
+        ids = [pk async for pk in recent.order_by('pk').values_list('pk', flat=True)]
+        if not ids:
+            return
+        self.polled_id = max(self.polled_id, ids[-1])
+        with self._lock:
+            # Kept for twice the window, so nothing still in it is published again
+            forget_before = time.monotonic() - 2 * window
+            self._published = {
+                message_id: published_at for message_id, published_at in self._published.items()
+                if published_at >= forget_before
+            }
+            ids = [pk for pk in ids if pk not in self._published]
+        if ids:
+            messages = Message.objects.filter(
+                pk__in=ids[-settings.MESSAGE_STREAM_BACKLOG:]
+            ).select_related('sender').order_by('pk')
+            async for message in messages:
+                self.publish_message(message)
+
+    async def _poll(self, loop):
+        """Poll for messages other worker processes saved, while anyone listens here"""
+        while True:
+            await asyncio.sleep(settings.MESSAGE_STREAM_POLL_INTERVAL)
+            with self._lock:
+                if not any(subscription.loop is loop for subscription in self._subscriptions):
+                    self._pollers.pop(loop, None)
+                    return
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Polling for new messages failed")
+
+
+broadcaster = Broadcaster()
+
+
+async def stream(last_event_id=None, expires_at=None):
+    """
+    SSE bytes: messages after ``last_event_id`` (the newest only if there
+    are many), then new ones as they arrive. Ends at ``expires_at`` (a Unix
+    time, e.g. the access token's expiry) so the client reconnects with a
+    fresh token.
+    """
+    subscription = await broadcaster.subscribe()
+    try:
+        last_id = await latest_id() if last_event_id is None else last_event_id
+        # Sent from the database since subscribing, so they may come again live.
+        # Anything else is new: a live event can have a lower id than one sent.
+        caught_up = set()
+        yield f'retry: {RETRY_MS}\n\n'.encode()
+        if last_event_id is not None:
+            messages = await backlog(last_id)
+            caught_up = {message.pk for message in messages}
+            for message in messages:
+                yield encode(message)
+                last_id = message.pk
+
+        while True:
+            timeout = settings.MESSAGE_STREAM_HEARTBEAT
+            if expires_at is not None:
+                timeout = min(timeout, expires_at - time.time())
+                if timeout <= 0:
+                    return
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout)
+            except asyncio.TimeoutError:
+                yield b': ping\n\n'
+                continue
+
+            if event is OVERFLOW:
+                messages = await backlog(last_id)
+                caught_up = {message.pk for message in messages}
+                for message in messages:
+                    yield encode(message)
+                    last_id = max(last_id, message.pk)
+                continue
+            message_id, payload = event
+            if message_id not in caught_up:
+                yield payload
+                last_id = max(last_id, message_id)
+    finally:
+        broadcaster.unsubscribe(subscription)
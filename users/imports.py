@@ -0,0 +1,379 @@
+"""
+Bulk import of students from CSV, for onboarding a whole intake at once.
+
+The CSV is read as a stream, one batch of rows at a time. Password hashing
+is the expensive part (one deliberately slow hash per student), so each
+batch is hashed across a process pool while the previous batch is being
+inserted. ``User`` and ``StudentProfile`` rows are then written with
+``bulk_create`` inside one transaction. Rows whose email, username or
+student id is already taken, in the database or earlier in the file, are
+skipped and reported rather than failing the import.
+
+Rows without a password get an unusable one plus a password reset token,
+so the students can set their own through the usual reset flow.
+
+Files uploaded through the API are saved to ``STUDENT_IMPORT_DIR`` and
+imported by a background job (``run_import``), since a large intake takes
+minutes; the ``StudentImport`` row carries the status and report. The
+process pool only lives as long as one import, and never in a web process.
+"""
+import csv
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.tokens import default_token_generator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from jobs.queue import task
+
+from .models import StudentImport, StudentProfile, User
+
+
+REQUIRED_COLUMNS = ('email', 'student_id', 'first_name', 'last_name')
+OPTIONAL_COLUMNS = ('username', 'password', 'enrollment_year', 'major')
+HASH_CHUNK_SIZE = 16
+
+
+class StudentImportError(ValueError):
+    """The CSV as a whole can't be imported, e.g. a required column is missing"""
+
+
+def processes():
+    configured = settings.STUDENT_IMPORT_PROCESSES
+    if configured is None:
+        return os.cpu_count() or 1
+    return configured
+
+
+def _encode(job):
+    # Runs in the worker processes; the hasher and salt come from the parent
+    # so the workers don't need Django settings
+    hasher, password, salt = job
+    return hasher.encode(password, salt)
+
+
+def hash_passwords(passwords, pool=None):
+    """
+    Start hashing ``passwords`` with the default hasher, across ``pool`` when
+    given. Returns a function that waits for and returns the hashes; ``None``
+    entries get an unusable password.
+    """
+    hasher = get_hasher('default')
+    jobs = [(hasher, password, hasher.salt()) for password in passwords if password is not None]
+    # Executor.map submits every job straight away, so this doesn't block
+    hashed = map(_encode, jobs) if pool is None else pool.map(_encode, jobs, chunksize=HASH_CHUNK_SIZE)
+
+    def result():
+        hashes = iter(hashed)
+        return [next(hashes) if password is not None else make_password(None) for password in passwords]
+    return result
+
+
+def read_rows(stream):
+    """
+    Yield ``(line, row)`` for each data row of the CSV text ``stream``, with
+    values stripped. Raises ``StudentImportError`` for a bad header.
+    """
+    reader = csv.DictReader(stream)
+    reader.fieldnames = check_columns(reader.fieldnames)
+    for row in reader:
+        yield reader.line_num, {
+            column: (row.get(column) or '').strip() for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+        }
+
+
+def check_columns(header):
+    """The lower-cased column names of ``header``, if none is missing"""
+    columns = [name.strip().lower() for name in header or []]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise StudentImportError(f"Missing columns: {', '.join(missing)}")
+    return columns
+
+
+def clean_row(row):
+    """The ``User``/``StudentProfile`` values for a row, or a list of problems"""
+    errors = []
+    email = User.objects.normalize_email(row['email'])
+    try:
+        validate_email(email)
+    except ValidationError:
+        errors.append("invalid email")
+    if not row['student_id']:
+        errors.append("missing student_id")
+    elif len(row['student_id']) > StudentProfile._meta.get_field('student_id').max_length:
+        errors.append("student_id too long")
+    year = row['enrollment_year'] or str(date.today().year)
+    if not year.isdigit():
+        errors.append("invalid enrollment_year")
+    if errors:
+        return None, errors
+    return {
+        'email': email,
+        'username': row['username'],
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'password': row['password'] or None,
+        'student_id': row['student_id'],
+        'enrollment_year': int(year),
+        'major': row['major'],
+    }, []
+
+
+class StudentImporter:
+    """
+    Imports students batch by batch; call ``run(stream)`` once. The report
+    lists created students, skipped rows and reset tokens for students
+    that didn't get a password.
+    """
+
+    def __init__(self, batch_size=None, pool=None, reset_tokens=True):
+        self.batch_size = batch_size or settings.STUDENT_IMPORT_BATCH_SIZE
+        self.pool = pool
+        self.reset_tokens = reset_tokens
+        self.created = 0
+        self.skipped = []
+        self.tokens = []
+        # Identifiers claimed earlier in this file, by key()
+        self.seen = {'email': set(), 'username': set(), 'student_id': set()}
+        self.case_insensitive = connections[router.db_for_write(User)].vendor == 'mysql'
+
+    def skip(self, line, row, reason):
+        self.skipped.append({
+            'line': line,
+            'email': row.get('email', ''),
+            'student_id': row.get('student_id', ''),
+            'error': reason,
+        })
+
+    def run(self, stream):
+        pending = deque()
+        with transaction.atomic():
+            batch = []
+            for line, row in read_rows(stream):
+                batch.append((line, row))
+                if len(batch) >= self.batch_size:
+                    pending.append(self.prepare(batch))
+                    batch = []
+                    # Keep one batch hashing while the previous one is inserted
+                    if len(pending) > 1:
+                        self.insert(*pending.popleft())
+            if batch:
+                pending.append(self.prepare(batch))
+            while pending:
+                self.insert(*pending.popleft())
+        return self.report()
+
+    def prepare(self, batch):
+        """Validate and deduplicate a batch, then start hashing its passwords"""
+        cleaned = []
+        for line, row in batch:
+            values, errors = clean_row(row)
+            if errors:
+                self.skip(line, row, ', '.join(errors))
+            else:
+                cleaned.append((line, values))
+
+        emails = {values['email'] for _, values in cleaned}
+        usernames = {values['username'] or values['email'].split('@')[0] for _, values in cleaned}
+        taken = self.taken(emails, {values['student_id'] for _, values in cleaned}, usernames | emails)
+
+        accepted = []
+        for line, values in cleaned:
+            duplicate = next((
+                field for field in ('email', 'student_id')
+                if self.key(field, values[field]) in taken[field] | self.seen[field]
+            ), None)
+            if duplicate is None:
+                values['username'] = self.pick_username(values, taken['username'])
+                if values['username'] is None:
+                    duplicate = 'username'
+            if duplicate is not None:
+                value = values.get(duplicate)
+                reason = 'repeated in file' if value and self.key(duplicate, value) in self.seen[duplicate] else 'already exists'
+                self.skip(line, values, f"duplicate {duplicate} ({reason})")
+                continue
+            for field in self.seen:
+                self.seen[field].add(self.key(field, values[field]))
+            # Stored lower-case, so it matches its key wherever it is looked up
+            values['email'] = self.key('email', values['email'])
+            values['line'] = line
+            accepted.append(values)
+
+        return accepted, hash_passwords([values['password'] for values in accepted], self.pool)
+
+    def taken(self, emails, student_ids, usernames):
+        """Keys of the given identifiers that are already in the database"""
+        emails = set(emails) | {self.key('email', email) for email in emails}
+        # Compared by key: a case-insensitive collation matches, and returns,
+        # spellings that differ from the ones asked for
+        return {
+            'email': self.keys('email', User.objects.filter(email__in=emails).values_list('email', flat=True)),
+            'student_id': self.keys('student_id', StudentProfile.objects.filter(
+                student_id__in=student_ids
+            ).values_list('student_id', flat=True)),
+            'username': self.keys('username', User.objects.filter(
+                username__in=usernames
+            ).values_list('username', flat=True)),
+        }
+
+    def key(self, field, value):
+        # Emails that only differ in case are one mailbox; on MySQL's
+        # case-insensitive collations every identifier is one row regardless
+        # of case
+        return value.lower() if field == 'email' or self.case_insensitive else value
+
+    def keys(self, field, values):
+        return {self.key(field, value) for value in values}
+
+    def pick_username(self, values, taken):
+        """The given username, else the email's local part, else the whole email"""
+        candidates = [values['username']] if values['username'] else [values['email'].split('@')[0], values['email']]
+        for username in candidates:
+            key = self.key('username', username)
+            if key not in taken and key not in self.seen['username']:
+                return username
+        return None
+
+    def insert(self, accepted, hashed):
+        if not accepted:
+            return
+        rows = list(zip(accepted, hashed()))
+        while True:
+            try:
+                with transaction.atomic():
+                    users = self.write(rows)
+                break
+            except IntegrityError:
+                # Another import inserted some of these since they were checked
+                remaining = self.recheck(rows)
+                if len(remaining) == len(rows):
+                    raise
+                rows = remaining
+        accepted = [values for values, _ in rows]
+        self.created += len(accepted)
+
+        if self.reset_tokens:
+            for values in accepted:
+                if values['password'] is None:
+                    user = users[values['email']]
+                    self.tokens.append({
+                        'email': user.email,
+                        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+                        'token': default_token_generator.make_token(user),
+                    })
+
+    def write(self, rows):
+        """Insert ``(values, password hash)`` rows; returns their users by email"""
+        User.objects.bulk_create([
+            User(
+                email=values['email'],
+                username=values['username'],
+                first_name=values['first_name'],
+                last_name=values['last_name'],
+                password=password,
+                is_student=True,
+            )
+            for values, password in rows
+        ])
+        # Not every backend returns primary keys from bulk_create (MySQL doesn't)
+        users = User.objects.in_bulk([values['email'] for values, _ in rows], field_name='email')
+        StudentProfile.objects.bulk_create([
+            StudentProfile(
+                user_id=users[values['email']].pk,
+                student_id=values['student_id'],
+                enrollment_year=values['enrollment_year'],
+                major=values['major'],
+            )
+            for values, _ in rows
+        ])
+        return users
+
+    def recheck(self, rows):
+        """Skip the rows whose identifiers were taken since ``prepare``"""
+        taken = self.taken(
+            {values['email'] for values, _ in rows},
+            {values['student_id'] for values, _ in rows},
+            {values['username'] for values, _ in rows},
+        )
+        remaining = []
+        for values, password in rows:
+            duplicate = next((
+                field for field in ('email', 'student_id', 'username')
+                if self.key(field, values[field]) in taken[field]
+            ), None)
+            if duplicate is None:
+                remaining.append((values, password))
+            else:
+                self.skip(values['line'], values, f"duplicate {duplicate} (already exists)")
+        return remaining
+
+    def report(self):
+        return {'created': self.created, 'skipped': self.skipped, 'reset_tokens': self.tokens}
+
+
+def import_students(stream, batch_size=None):
+    """
+    Import students from the CSV text ``stream``; see ``StudentImporter``.
+    Passwords are hashed across a process pool that only lives as long as
+    the import.
+    """
+    if not processes():
+        return StudentImporter(batch_size=batch_size).run(stream)
+    with ProcessPoolExecutor(max_workers=processes()) as pool:
+        return StudentImporter(batch_size=batch_size, pool=pool).run(stream)
+
+
+def upload_path(student_import):
+    path = Path(settings.STUDENT_IMPORT_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path / f'{student_import.id}.csv'
+
+
+def queue_import(upload, user):
+    """
+    Save the uploaded CSV and queue its import. Returns the
+    ``StudentImport``; raises ``StudentImportError`` for a bad header.
+    """
+    student_import = StudentImport(uploaded_by=user)
+    path = upload_path(student_import)
+    with open(path, 'wb') as target:
+        for chunk in upload.chunks():
+            target.write(chunk)
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            check_columns(next(csv.reader(stream), []))
+        with transaction.atomic():
+            student_import.save()
+            run_import.enqueue(str(student_import.id))
+    except Exception:
+        os.remove(path)
+        raise
+    return student_import
+
+
+@task(max_attempts=3)
+def run_import(import_id):
+    student_import = StudentImport.objects.filter(pk=import_id, status='queued').first()
+    if student_import is None:
+        return
+    path = upload_path(student_import)
+    imported = StudentImport.objects.filter(pk=import_id, status='queued')
+    try:
+        # The status changes with the import, so a retry never imports twice
+        with open(path, newline='', encoding='utf-8-sig') as stream, transaction.atomic():
+            report = import_students(stream)
+            imported.update(status='done', report=report, finished_at=timezone.now())
+    except (StudentImportError, UnicodeDecodeError) as error:
+        imported.update(status='failed', error=str(error), finished_at=timezone.now())
+    os.remove(path)
@@ -0,0 +1,53 @@
+import csv
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import imports
+
+
+class Command(BaseCommand):
+    help = 'Imports students (user and student profile) from a CSV file, hashing passwords on all cores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with email, student_id, first_name and last_name "
+                                         "columns (optionally username, password, enrollment_year, major); "
+                                         "'-' reads stdin")
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Password hashing processes (default: one per core, 0 hashes inline)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows hashed and inserted per batch')
+        parser.add_argument('--tokens', metavar='PATH',
+                            help='Write password reset tokens for rows without a password to this CSV file')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes is None:
+            processes = imports.processes()
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8-sig')
+        try:
+            if processes:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    report = imports.StudentImporter(options['batch_size'], pool=pool).run(stream)
+            else:
+                report = imports.StudentImporter(options['batch_size']).run(stream)
+        except imports.StudentImportError as error:
+            raise CommandError(str(error))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for row in report['skipped']:
+            self.stdout.write(self.style.WARNING(
+                f"Line {row['line']}: skipped {row['email'] or row['student_id']}: {row['error']}"
+            ))
+        if options['tokens'] and report['reset_tokens']:
+            with open(options['tokens'], 'w', newline='') as handle:
+                writer = csv.DictWriter(handle, fieldnames=['email', 'uid', 'token'])
+                writer.writeheader()
+                writer.writerows(report['reset_tokens'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['created']} students, skipped {len(report['skipped'])} rows"
+        ))
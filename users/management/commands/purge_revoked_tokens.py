@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from users import revocation
+
+
+class Command(BaseCommand):
+    help = 'Deletes revoked refresh tokens that have expired anyway, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows deleted per statement (default: REVOKED_TOKEN_PURGE_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        deleted = revocation.purge(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} expired revoked tokens'))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['-sent_at', 'id'], name='users_messa_sent_at_2024af_idx'),
+        ),
+    ]
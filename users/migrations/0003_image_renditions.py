@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_message_sent_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Profile photo thumbnail names by size'),
+        ),
+    ]
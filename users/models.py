@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils import timezone
@@ -34,11 +36,16 @@ class User(AbstractUser):
     # Keep the username field from AbstractUser
     email = models.EmailField(unique=True)
     profile_photo = models.ImageField(upload_to='profile_photos/', blank=True, null=True)
+    renditions = models.JSONField(default=dict, blank=True, editable=False,
+                                  help_text="Profile photo thumbnail names by size")
     is_student = models.BooleanField(default=False)
     
     # Common fields for all users
     date_of_birth = models.DateField(null=True, blank=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
+
+    # Goes up when the password changes; older JWTs are then rejected
+    token_version = models.PositiveIntegerField(default=0, editable=False)
     
     # Use email as the username field for authentication
     USERNAME_FIELD = 'email'
@@ -49,6 +56,15 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        # set_password() leaves the new password in _password until saved;
+        # check_password() clears it first when it only rehashes
+        if self._password is not None and self.pk is not None:
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+        super().save(*args, **kwargs)
+
     class Meta:
         db_table = "user"
         verbose_name = "User"
@@ -85,7 +101,63 @@ class Message(models.Model):
     subject = models.CharField(max_length=255)
     body = models.TextField()
     sent_at = models.DateTimeField(default=timezone.now)
-    is_read = models.BooleanField(default=False)
 
     def __str__(self):
-        return f"Message from {self.sender} - {self.subject}"
\ No newline at end of file
+        return f"Message from {self.sender} - {self.subject}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-sent_at', 'id']),
+        ]
+
+class MessageReadState(models.Model):
+    """A user's read watermark: every message up to ``last_read_id`` is read (see ``users.reads``)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='message_read_state')
+    last_read_id = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} read up to {self.last_read_id}"
+
+class MessageRead(models.Model):
+    """A message read by a user above their watermark"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='message_reads')
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='reads')
+
+    def __str__(self):
+        return f"{self.user} read {self.message_id}"
+
+    class Meta:
+        unique_together = ['user', 'message']
+
+class StudentImport(models.Model):
+    """
+    A students CSV uploaded through the API and imported by a background
+    job (see ``users.imports``)
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='student_imports')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    report = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Student import {self.id} ({self.status})"
+
+class RevokedToken(models.Model):
+    """
+    A refresh token that may no longer be used, kept until it would have
+    expired anyway (see ``users.revocation``)
+    """
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
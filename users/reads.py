@@ -0,0 +1,159 @@
+"""
+Per-user read state of messages.
+
+Every user sees every message, so read state is kept per user as a
+watermark plus sparse exceptions: ``MessageReadState.last_read_id`` says
+every message up to that id is read, and ``MessageRead`` rows mark single
+messages above it. "Mark all read up to X" is one ``UPDATE`` however many
+messages it covers. Exceptions at or below the watermark are ignored.
+
+Unread counts come from the shared cache: the total number of messages,
+bumped when a message is posted (see ``users.signals``), minus the number
+this user has read, kept with their watermark. The latter is keyed by a
+per-user version that marking something read bumps, so a count computed
+concurrently with the mark lands under a key nobody reads any more.
+A post committed while the total is being counted can't bump it yet, so
+a counted total only lives ``MESSAGE_TOTAL_CACHE_TIMEOUT`` seconds.
+Deleting a message invalidates all of it, which is rare.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Message, MessageRead, MessageReadState
+
+
+TOTAL_KEY = 'messages:total'
+GENERATION_KEY = 'messages:read-generation'
+
+
+def shared():
+    return caches[settings.MESSAGE_COUNT_CACHE_ALIAS]
+
+
+def version_key(user_id):
+    return f'messages:read-version:{user_id}'
+
+
+def summary_key(user_id, generation, version):
+    return f'messages:read:{user_id}:{generation or 0}:{version or 0}'
+
+
+class ReadState:
+    def __init__(self, last_read_id=0, read_ids=()):
+        self.last_read_id = last_read_id
+        self.read_ids = set(read_ids)
+
+    def is_read(self, message_id):
+        return message_id <= self.last_read_id or message_id in self.read_ids
+
+
+# Counting ---------------------------------------------------------------------
+
+async def _asummary(user):
+    """``(last_read_id, number of messages read)`` from the database"""
+    last_read_id = await MessageReadState.objects.filter(user=user).values_list(
+        'last_read_id', flat=True
+    ).afirst() or 0
+    below = await Message.objects.filter(pk__lte=last_read_id).acount()
+    above = await MessageRead.objects.filter(user=user, message_id__gt=last_read_id).acount()
+    return last_read_id, below + above
+
+
+async def asummary(user):
+    cache = shared()
+    keys = await cache.aget_many([GENERATION_KEY, version_key(user.pk)])
+    key = summary_key(user.pk, keys.get(GENERATION_KEY), keys.get(version_key(user.pk)))
+    summary = await cache.aget(key)
+    if summary is None:
+        summary = await _asummary(user)
+        await cache.aset(key, summary, settings.MESSAGE_COUNT_CACHE_TIMEOUT)
+    return summary
+
+
+async def atotal():
+    cache = shared()
+    total = await cache.aget(TOTAL_KEY)
+    if total is None:
+        total = await Message.objects.acount()
+        # add(), so a count that a concurrent post already bumped isn't overwritten
+        await cache.aadd(TOTAL_KEY, total, settings.MESSAGE_TOTAL_CACHE_TIMEOUT)
+    return total
+
+
+async def aunread_count(user):
+    """``(unread messages, last_read_id)``, usually without a query"""
+    last_read_id, read = await asummary(user)
+    return max(await atotal() - read, 0), last_read_id
+
+
+async def aread_state(user, messages):
+    """The ``ReadState`` of ``user`` for a page of ``messages``"""
+    last_read_id, _ = await asummary(user)
+    above = [message.pk for message in messages if message.pk > last_read_id]
+    read_ids = []
+    if above:
+        read_ids = [
+            message_id async for message_id in MessageRead.objects.filter(
+                user=user, message_id__in=above
+            ).values_list('message_id', flat=True)
+        ]
+    return ReadState(last_read_id, read_ids)
+
+
+def message_posted():
+    try:
+        shared().incr(TOTAL_KEY)
+    except ValueError:
+        # Not cached; the next count reads the table
+        pass
+
+
+def message_deleted():
+    cache = shared()
+    cache.delete(TOTAL_KEY)
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def forget(user_id):
+    cache = shared()
+    try:
+        cache.incr(version_key(user_id))
+    except ValueError:
+        # From the clock, so a version lost with an eviction isn't reused
+        cache.set(version_key(user_id), time.time_ns(), None)
+
+
+# Marking ----------------------------------------------------------------------
+
+def mark_read_up_to(user, message_id):
+    """Mark every message up to ``message_id`` read; the watermark never moves back"""
+    latest = Message.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    # Not past the newest message, or later messages would arrive already read
+    message_id = min(message_id, latest)
+    behind = MessageReadState.objects.filter(user=user, last_read_id__lt=message_id)
+    if not behind.update(last_read_id=message_id):
+        _, created = MessageReadState.objects.get_or_create(user=user, defaults={'last_read_id': message_id})
+        if not created:
+            # Already further along, or created concurrently since the update
+            behind.update(last_read_id=message_id)
+    transaction.on_commit(lambda: forget(user.pk))
+    return message_id
+
+
+def mark_read(user, message_ids):
+    """Mark single messages read, as exceptions above the watermark"""
+    last_read_id = MessageReadState.objects.filter(user=user).values_list(
+        'last_read_id', flat=True
+    ).first() or 0
+    message_ids = Message.objects.filter(pk__in=message_ids, pk__gt=last_read_id).values_list('pk', flat=True)
+    MessageRead.objects.bulk_create(
+        [MessageRead(user=user, message_id=message_id) for message_id in message_ids],
+        ignore_conflicts=True,
+    )
+    transaction.on_commit(lambda: forget(user.pk))
@@ -0,0 +1,153 @@
+"""
+Revoked refresh tokens.
+
+Only revoked tokens are stored (their JTI and expiry), not every token
+ever issued, and ``purge`` deletes rows once the token would have expired
+anyway, in chunks so the table isn't locked for long. With 50-day refresh
+tokens the table holds at most 50 days of logouts and rotations.
+
+Nearly every token checked is not revoked, so each process keeps a Bloom
+filter of the revoked JTIs: a miss means "not revoked" without touching
+the database, and only the rare hit is confirmed with a query. New
+revocations bump a generation in the shared cache; other processes see it
+on their next check and load just the rows added since. The filter is
+rebuilt from scratch every ``REVOCATION_BLOOM_REBUILD_INTERVAL`` seconds,
+or when it fills up, which drops expired JTIs.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RevokedToken
+
+
+GENERATION_KEY = 'revoked-tokens:generation'
+# Rows are reread from a little before the last one seen, because
+# concurrent revocations can commit out of primary key order
+LOAD_OVERLAP = 100
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + index * second) % self.size for index in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def full(self):
+        return self.count > self.capacity
+
+
+class RevocationStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        self._generation = None
+        self._built_at = 0.0
+
+    @property
+    def shared(self):
+        return caches[settings.REVOCATION_CACHE_ALIAS]
+
+    def _load(self, bloom, after=0):
+        rows = (
+            RevokedToken.objects.filter(pk__gt=after, expires_at__gt=timezone.now())
+            .order_by('pk').values_list('pk', 'jti')
+        )
+        last_id = after
+        for last_id, jti in rows.iterator(chunk_size=settings.REVOKED_TOKEN_PURGE_CHUNK_SIZE):
+            bloom.add(jti)
+        return last_id
+
+    def _rebuild(self, generation):
+        live = RevokedToken.objects.filter(expires_at__gt=timezone.now()).count()
+        # Room to grow before the next rebuild
+        capacity = max(settings.REVOCATION_BLOOM_MIN_CAPACITY, live * 2)
+        bloom = BloomFilter(capacity, settings.REVOCATION_BLOOM_ERROR_RATE)
+        self._last_id = self._load(bloom)
+        self._filter = bloom
+        self._generation = generation
+        self._built_at = time.monotonic()
+
+    def bloom(self):
+        """This process's filter, brought up to date with other processes"""
+        generation = self.shared.get(GENERATION_KEY)
+        with self._lock:
+            stale = (
+                self._filter is None or self._filter.full
+                or time.monotonic() - self._built_at > settings.REVOCATION_BLOOM_REBUILD_INTERVAL
+            )
+            if stale:
+                self._rebuild(generation)
+            elif generation != self._generation:
+                loaded = self._load(self._filter, max(0, self._last_id - LOAD_OVERLAP))
+                self._last_id = max(self._last_id, loaded)
+                self._generation = generation
+            return self._filter
+
+    def is_revoked(self, jti):
+        if jti not in self.bloom():
+            return False
+        return RevokedToken.objects.filter(jti=jti, expires_at__gt=timezone.now()).exists()
+
+    def revoke(self, jti, expires_at):
+        RevokedToken.objects.bulk_create(
+            [RevokedToken(jti=jti, expires_at=expires_at)], ignore_conflicts=True
+        )
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+        # Other processes must not reload before the row is visible to them
+        transaction.on_commit(self._bump_generation)
+
+    def _bump_generation(self):
+        try:
+            self.shared.incr(GENERATION_KEY)
+        except ValueError:
+            self.shared.set(GENERATION_KEY, time.time_ns(), None)
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+
+
+store = RevocationStore()
+
+
+def purge(chunk_size=None, now=None):
+    """Delete rows of tokens that have expired, a chunk at a time; returns the count"""
+    chunk_size = chunk_size or settings.REVOKED_TOKEN_PURGE_CHUNK_SIZE
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        ids = list(
+            RevokedToken.objects.filter(expires_at__lte=now)
+            .order_by('expires_at').values_list('pk', flat=True)[:chunk_size]
+        )
+        if ids:
+            deleted += RevokedToken.objects.filter(pk__in=ids).delete()[0]
+        if len(ids) < chunk_size:
+            return deleted
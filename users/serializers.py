@@ -1,7 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from uniSchooling.renditions import ThumbnailsField
+from .authentication import get_cached_user
 from .models import Message
+from .tokens import TOKEN_VERSION_CLAIM, RefreshToken
  
 User = get_user_model()
 
@@ -41,28 +46,75 @@ class ChangePasswordSerializer(serializers.Serializer):
         return value
     
 class ProfilePhotoSerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailsField()
+
     class Meta:
         model = User
-        fields = ['profile_photo']
+        fields = ['profile_photo', 'thumbnails']
         extra_kwargs = { 
             'profile_photo': {'required': True}
         }
         
     def update(self, instance, validated_data):
         instance.profile_photo = validated_data.get('profile_photo', instance.profile_photo)
-        instance.save()
+        # request.user may come from the auth cache; don't write its other columns back
+        instance.save(update_fields=['profile_photo'])
         return instance
     
 class MessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source='sender.get_full_name', read_only=True)
     sender_email = serializers.CharField(source='sender.email', read_only=True)
+    # Per user; pass a users.reads.ReadState as context['read_state']
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
         fields = ['id', 'sender', 'sender_name', 'sender_email', 'subject', 'body', 'sent_at', 'is_read']
         read_only_fields = ['id', 'sender', 'sent_at', 'sender_name', 'sender_email']
+
+    def get_is_read(self, message):
+        read_state = self.context.get('read_state')
+        return read_state is not None and read_state.is_read(message.pk)
     
     def create(self, validated_data):
         # Remove sender from validated_data as it will be set in the view
         validated_data.pop('sender', None)
-        return Message.objects.create(**validated_data)
\ No newline at end of file
+        return Message.objects.create(**validated_data)
+
+
+class TokenRefreshSerializer(serializers.Serializer):
+    """
+    simplejwt's refresh, with revocation (``users.revocation``), the cached
+    user lookup and the token version check
+    """
+    refresh = serializers.CharField()
+    access = serializers.CharField(read_only=True)
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        user = get_cached_user(refresh.payload.get(api_settings.USER_ID_CLAIM))
+        if (user is None or not api_settings.USER_AUTHENTICATION_RULE(user)
+                or refresh.payload.get(TOKEN_VERSION_CLAIM, 0) < user.token_version):
+            raise AuthenticationFailed("No active account found for the given token.", "no_active_account")
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class MarkMessagesReadSerializer(serializers.Serializer):
+    """Either every message up to ``up_to``, or the messages in ``ids``"""
+    up_to = serializers.IntegerField(min_value=1, required=False)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False,
+                                allow_empty=False, max_length=500)
+
+    def validate(self, attrs):
+        if ('up_to' in attrs) == ('ids' in attrs):
+            raise serializers.ValidationError("Send either 'up_to' or 'ids'")
+        return attrs
@@ -0,0 +1,43 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from uniSchooling import renditions
+
+from . import feed, reads
+from .authentication import forget_user
+from .models import Message, User
+
+
+@receiver(post_save, sender=User)
+def schedule_profile_photo_renditions(sender, instance, raw=False, **kwargs):
+    if not raw and renditions.needs_renditions(instance, 'profile_photo'):
+        renditions.schedule(instance, 'profile_photo')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+    # Again once committed: until then other requests still read the old
+    # row and may have cached it again meanwhile
+    transaction.on_commit(partial(forget_user, instance.pk))
+
+
+@receiver(post_save, sender=Message)
+def broadcast_message(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(partial(feed.broadcaster.publish_message, instance))
+
+
+@receiver(post_save, sender=Message)
+def count_message(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(reads.message_posted)
+
+
+@receiver(post_delete, sender=Message)
+def uncount_message(sender, instance, **kwargs):
+    transaction.on_commit(reads.message_deleted)
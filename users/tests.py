@@ -1,3 +1,563 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+from contextlib import asynccontextmanager
+import tempfile
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib.auth.hashers import MD5PasswordHasher, PBKDF2PasswordHasher
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from PIL import Image
+from datetime import timedelta
+
+from django.utils import timezone
+
+from uniSchooling.pagination import encode_cursor
+
+from . import authentication, feed, imports, reads, revocation
+from .models import Message, MessageReadState, RevokedToken, StudentProfile
+from .serializers import ProfilePhotoSerializer
+from .tokens import RefreshToken
+
+User = get_user_model()
+
+
+class MessageListPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="student@example.com", password="testpassword")
+        for i in range(5):
+            Message.objects.create(sender=self.user, subject=f"Subject {i}", body="body")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_messages_paginate_newest_first(self):
+        response = self.client.get('/api/auth/messages/?page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['subject'] for m in response.data['data']], ["Subject 4", "Subject 3"])
+
+        subjects = []
+        url = '/api/auth/messages/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            subjects.extend(m['subject'] for m in response.data['data'])
+            url = response.data['next']
+        self.assertEqual(subjects, [f"Subject {i}" for i in reversed(range(5))])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/auth/messages/?cursor=bogus')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_with_wrongly_typed_values(self):
+        for position in (["garbage", 1], [{"a": 1}, "x"]):
+            response = self.client.get(f'/api/auth/messages/?cursor={encode_cursor(position)}')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(JOBS_EAGER=True)
+class ProfilePhotoRenditionTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(MEDIA_ROOT=self.tmp.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user(email="student@example.com", password="testpassword")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_profile_photo_thumbnails(self):
+        buffer = BytesIO()
+        Image.new("RGB", (2000, 1000), (0, 120, 200)).save(buffer, "JPEG")
+        photo = SimpleUploadedFile("me.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/api/auth/profile-photo/', {'profile_photo': photo}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.user.refresh_from_db()
+        self.assertTrue({'small', 'medium'} <= set(self.user.renditions))
+        with self.user.profile_photo.storage.open(self.user.renditions['small']) as small:
+            self.assertEqual(Image.open(small).size, (160, 80))
+
+
+STUDENTS_CSV = """email,student_id,first_name,last_name,password,major
+ada@example.com,S001,Ada,Lovelace,engines123,Mathematics
+alan@example.com,S002,Alan,Turing,,Computer Science
+taken@example.com,S003,Taken,Email,secret123,History
+grace@example.com,S001,Grace,Hopper,,Computer Science
+ADA@Example.com,S004,Ada,Again,,Mathematics
+ada@other.org,S005,Ada,Byron,,Poetry
+not-an-email,S006,Bad,Row,,
+"""
+
+
+class StudentImportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(email="registrar@example.com", password="testpassword", is_staff=True)
+        User.objects.create_user(email="taken@example.com", password="testpassword")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def check_import(self):
+        ada = User.objects.get(email="ada@example.com")
+        self.assertTrue(ada.is_student)
+        self.assertTrue(ada.check_password("engines123"))
+        self.assertEqual(ada.student_profile.student_id, "S001")
+        alan = User.objects.get(email="alan@example.com")
+        self.assertFalse(alan.has_usable_password())
+        # The second "ada" local part falls back to the full email as username
+        self.assertEqual(User.objects.get(email="ada@other.org").username, "ada@other.org")
+        self.assertEqual(StudentProfile.objects.count(), 3)
+
+    def test_command_imports_in_parallel_and_reports_duplicates(self):
+        path = os.path.join(self.tmp.name, "students.csv")
+        tokens = os.path.join(self.tmp.name, "tokens.csv")
+        with open(path, "w") as handle:
+            handle.write(STUDENTS_CSV)
+        out = StringIO()
+        call_command('import_students', path, '--processes', '2', '--batch-size', '2', '--tokens', tokens, stdout=out)
+        output = out.getvalue()
+        self.assertIn("Imported 3 students, skipped 4 rows", output)
+        self.assertIn("Line 4: skipped taken@example.com: duplicate email (already exists)", output)
+        self.assertIn("Line 5: skipped grace@example.com: duplicate student_id (repeated in file)", output)
+        self.assertIn("Line 6: skipped ADA@example.com: duplicate email (repeated in file)", output)
+        self.assertIn("Line 8: skipped not-an-email: invalid email", output)
+        self.check_import()
+
+        with open(tokens) as handle:
+            rows = {row['email']: row for row in csv.DictReader(handle)}
+        self.assertEqual(set(rows), {"alan@example.com", "ada@other.org"})
+        alan = User.objects.get(email="alan@example.com")
+        self.assertTrue(default_token_generator.check_token(alan, rows["alan@example.com"]['token']))
+
+    def test_emails_are_compared_and_stored_lower_case(self):
+        stream = StringIO("email,student_id,first_name,last_name\n"
+                          "TAKEN@example.com,S001,Taken,Again\n"
+                          "Mixed.Case@Example.com,S002,Mixed,Case\n")
+        report = imports.StudentImporter(pool=None).run(stream)
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['skipped'][0]['error'], "duplicate email (already exists)")
+        self.assertTrue(User.objects.filter(email="mixed.case@example.com").exists())
+
+    def test_rows_inserted_concurrently_are_skipped(self):
+        stream = StringIO("email,student_id,first_name,last_name\n"
+                          "grace@example.com,S001,Grace,Hopper\n"
+                          "alan@example.com,S002,Alan,Turing\n")
+        importer = imports.StudentImporter(pool=None)
+        with transaction.atomic():
+            prepared = importer.prepare(list(imports.read_rows(stream)))
+            # Another import wins the race for one of the rows
+            User.objects.create_user(email="grace@example.com", username="grace2", password="testpassword")
+            importer.insert(*prepared)
+        report = importer.report()
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['skipped'][0]['error'], "duplicate email (already exists)")
+        self.assertEqual(report['skipped'][0]['line'], 2)
+        self.assertTrue(StudentProfile.objects.filter(student_id="S002").exists())
+
+    @override_settings(STUDENT_IMPORT_PROCESSES=0, JOBS_EAGER=True)
+    def test_staff_api(self):
+        client = APIClient()
+        upload = SimpleUploadedFile("students.csv", STUDENTS_CSV.encode(), content_type="text/csv")
+        client.force_authenticate(User.objects.get(email="taken@example.com"))
+        response = client.post('/api/auth/import-students/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        client.force_authenticate(self.staff)
+        upload.seek(0)
+        with self.settings(STUDENT_IMPORT_DIR=self.tmp.name), self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/auth/import-students/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(os.listdir(self.tmp.name))
+
+        response = client.get(f"/api/auth/import-students/{response.data['data']['id']}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['status'], 'done')
+        report = response.data['data']['report']
+        self.assertEqual(report['created'], 3)
+        self.assertEqual(len(report['skipped']), 4)
+        self.assertEqual(len(report['reset_tokens']), 2)
+        self.check_import()
+
+        bad = SimpleUploadedFile("students.csv", b"email,name\nx@example.com,X\n", content_type="text/csv")
+        with self.settings(STUDENT_IMPORT_DIR=self.tmp.name):
+            response = client.post('/api/auth/import-students/', {'file': bad}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("student_id", response.data['details'])
+        self.assertFalse(os.listdir(self.tmp.name))
+
+
+class CountingHasher(MD5PasswordHasher):
+    """Fast hasher that counts how many passwords were hashed"""
+    calls = 0
+
+    def encode(self, password, salt):
+        CountingHasher.calls += 1
+        return super().encode(password, salt)
+
+
+@override_settings(PASSWORD_HASHERS=['users.tests.CountingHasher'])
+class LoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="ada@example.com", username="ada", password="testpassword")
+        self.client = APIClient()
+        CountingHasher.calls = 0
+
+    def login(self, identifier, password="testpassword"):
+        return self.client.post('/api/auth/login/', {'email': identifier, 'password': password}, format='json')
+
+    def test_email_or_username(self):
+        for identifier in ("ada@example.com", "ada"):
+            response = self.login(identifier)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['email'], "ada@example.com")
+        self.assertEqual(CountingHasher.calls, 2)
+
+    def test_one_query_and_one_hash_per_failed_login(self):
+        for identifier in ("ada", "nobody@example.com"):
+            CountingHasher.calls = 0
+            with self.assertNumQueries(1):
+                response = self.login(identifier, "wrong")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(CountingHasher.calls, 1)
+
+    def test_email_match_wins_over_username(self):
+        User.objects.create_user(email="other@example.com", username="ada@example.com", password="otherpassword")
+        self.assertEqual(self.login("ada@example.com").status_code, status.HTTP_200_OK)
+        self.assertEqual(self.login("ada@example.com", "otherpassword").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_inactive_user_is_refused(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.login("ada").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher'])
+    def test_outdated_hash_is_upgraded(self):
+        hasher = PBKDF2PasswordHasher()
+        User.objects.filter(pk=self.user.pk).update(
+            password=hasher.encode("testpassword", hasher.salt(), iterations=1000)
+        )
+        self.assertEqual(self.login("ada").status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(hasher.decode(self.user.password)['iterations'], hasher.iterations)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache().clear()
+        self.user = User.objects.create_user(email="ada@example.com", username="ada", password="testpassword")
+        self.auth = authentication.CachedJWTAuthentication()
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.auth.authenticate(request)[0]
+
+    def test_user_is_loaded_once(self):
+        token = RefreshToken.for_user(self.user).access_token
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(token), self.user)
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+        self.assertEqual(user.email, "ada@example.com")
+        # Each request gets its own instance
+        self.assertIsNot(user, self.authenticate(token))
+
+        # Another process only has the shared cache
+        authentication.local_cache().clear()
+        with self.assertNumQueries(0):
+            self.authenticate(token)
+
+    def test_saving_the_user_refreshes_the_cache(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.authenticate(token)
+        self.user.first_name = "Ada"
+        self.user.save()
+        self.assertEqual(self.authenticate(token).first_name, "Ada")
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_cache_is_dropped_again_when_the_change_commits(self):
+        token = RefreshToken.for_user(self.user).access_token
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            # A concurrent request caches the row before the change commits
+            authentication.get_cached_user(self.user.pk)
+            self.assertIsNotNone(cache.get(authentication.cache_key(self.user.pk)))
+        self.assertIsNone(cache.get(authentication.cache_key(self.user.pk)))
+        self.assertIsNone(authentication.local_cache().get(authentication.cache_key(self.user.pk)))
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_password_change_revokes_earlier_tokens(self):
+        old = RefreshToken.for_user(self.user).access_token
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {old}')
+        response = client.put('/api/auth/change-password/', {
+            'old_password': "testpassword", 'new_password': "a-new-Passw0rd",
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertRaisesMessage(AuthenticationFailed, "revoked"):
+            self.authenticate(old)
+        self.assertEqual(self.authenticate(response.data['access_token']), self.user)
+
+    def test_writes_through_a_stale_cached_user_keep_other_columns(self):
+        token = RefreshToken.for_user(self.user).access_token
+        user = self.authenticate(token)
+        self.assertIn('password', user.get_deferred_fields())
+        # Deactivated by another process, whose cache drop this one hasn't seen
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        ProfilePhotoSerializer().update(user, {'profile_photo': "profile_photos/ada.png"})
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(self.user.profile_photo.name, "profile_photos/ada.png")
+
+    def test_rehash_on_login_keeps_tokens(self):
+        token = RefreshToken.for_user(self.user).access_token
+        # What check_password() does when it upgrades a hash
+        self.user.set_password("testpassword")
+        self.user._password = None
+        self.user.save(update_fields=['password'])
+        self.assertEqual(self.authenticate(token), self.user)
+
+
+class RevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache().clear()
+        revocation.store.reset()
+        self.user = User.objects.create_user(email="ada@example.com", username="ada", password="testpassword")
+        self.client = APIClient()
+
+    def test_bloom_filter(self):
+        bloom = revocation.BloomFilter(1000, 0.01)
+        for index in range(1000):
+            bloom.add(f"jti-{index}")
+        self.assertTrue(all(f"jti-{index}" in bloom for index in range(1000)))
+        false_positives = sum(f"other-{index}" in bloom for index in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_rotation_revokes_the_old_refresh_token(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        response = self.client.post('/api/auth/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+        self.assertNotEqual(response.data['refresh'], refresh)
+
+        again = self.client.post('/api/auth/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(again.status_code, status.HTTP_401_UNAUTHORIZED)
+        rotated = self.client.post('/api/auth/token/refresh/', {'refresh': response.data['refresh']}, format='json')
+        self.assertEqual(rotated.status_code, status.HTTP_200_OK)
+
+    def test_unrevoked_tokens_are_checked_without_a_query(self):
+        RefreshToken.for_user(self.user).blacklist()
+        token = str(RefreshToken.for_user(self.user))
+        RefreshToken(token)
+        with self.assertNumQueries(0):
+            RefreshToken(token)
+
+    def test_logout(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        response = self.client.post('/api/auth/logout/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post('/api/auth/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_other_processes_pick_up_revocations(self):
+        token = RefreshToken.for_user(self.user)
+        RefreshToken(str(token))
+        other = revocation.RevocationStore()
+        other.bloom()
+        with self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+        self.assertTrue(other.is_revoked(token['jti']))
+
+    def test_purge_deletes_expired_rows_in_chunks(self):
+        now = timezone.now()
+        RevokedToken.objects.bulk_create(
+            [RevokedToken(jti=f"old-{index}", expires_at=now - timedelta(days=1)) for index in range(5)]
+            + [RevokedToken(jti="live", expires_at=now + timedelta(days=1))]
+        )
+        out = StringIO()
+        with self.assertNumQueries(6):
+            call_command('purge_revoked_tokens', '--chunk-size', '2', stdout=out)
+        self.assertIn("Purged 5", out.getvalue())
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ["live"])
+
+
+@override_settings(MESSAGE_STREAM_HEARTBEAT=0.05, MESSAGE_STREAM_POLL_INTERVAL=0.05, MESSAGE_STREAM_BUFFER=2)
+class MessageStreamTests(TransactionTestCase):
+    def setUp(self):
+        feed.broadcaster.clear()
+        self.addCleanup(feed.broadcaster.clear)
+        self.user = User.objects.create_user(email="ada@example.com", username="ada", password="testpassword")
+        self.first = Message.objects.create(sender=self.user, subject="First", body="body")
+        self.second = Message.objects.create(sender=self.user, subject="Second", body="body")
+        token = RefreshToken.for_user(self.user).access_token
+        self.headers = {'Authorization': f"Bearer {token}"}
+
+    @asynccontextmanager
+    async def stream(self, **headers):
+        response = await self.async_client.get('/api/auth/messages/stream/', headers={**self.headers, **headers})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        try:
+            yield aiter(response.streaming_content)
+        finally:
+            await feed.broadcaster.close()
+
+    async def next_chunk(self, chunks):
+        return (await asyncio.wait_for(anext(chunks), 5)).decode()
+
+    async def next_event(self, chunks):
+        async with asyncio.timeout(5):
+            while True:
+                chunk = await self.next_chunk(chunks)
+                if chunk.startswith('id:'):
+                    lines = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+                    return int(lines['id']), json.loads(lines['data'])
+
+    async def test_resumes_after_last_event_id_then_pushes_new_messages(self):
+        async with self.stream(**{'Last-Event-ID': str(self.first.pk)}) as chunks:
+            message_id, data = await self.next_event(chunks)
+            self.assertEqual((message_id, data['subject']), (self.second.pk, "Second"))
+
+            live = await Message.objects.acreate(sender=self.user, subject="Live", body="body")
+            message_id, data = await self.next_event(chunks)
+            self.assertEqual((message_id, data['subject']), (live.pk, "Live"))
+
+    async def test_heartbeat(self):
+        async with self.stream() as chunks:
+            self.assertTrue((await self.next_chunk(chunks)).startswith('retry:'))
+            self.assertEqual(await self.next_chunk(chunks), ': ping\n\n')
+
+    async def test_messages_from_other_workers_are_polled(self):
+        async with self.stream() as chunks:
+            await self.next_chunk(chunks)
+            # bulk_create sends no post_save, like a message saved by another process
+            await Message.objects.abulk_create([Message(sender=self.user, subject="Other", body="body")])
+            other = await Message.objects.aget(subject="Other")
+            message_id, data = await self.next_event(chunks)
+            self.assertEqual((message_id, data['subject']), (other.pk, "Other"))
+
+    @override_settings(MESSAGE_STREAM_POLL_INTERVAL=60)
+    async def test_messages_committed_late_below_seen_ids_are_polled(self):
+        subscription = await feed.broadcaster.subscribe()
+        # Another worker takes an id but commits after a higher one was seen
+        await Message.objects.abulk_create([Message(sender=self.user, subject="Gap", body="body")])
+        gap = await Message.objects.aget(subject="Gap")
+        await Message.objects.filter(pk=gap.pk).adelete()
+        later = await Message.objects.acreate(sender=self.user, subject="Later", body="body")
+        self.assertEqual((await subscription.get())[0], later.pk)
+        await feed.broadcaster.poll()
+
+        await Message.objects.abulk_create([Message(pk=gap.pk, sender=self.user, subject="Gap", body="body")])
+        await feed.broadcaster.poll()
+        await feed.broadcaster.poll()
+        self.assertEqual((await subscription.get())[0], gap.pk)
+        self.assertTrue(subscription.queue.empty())
+        await feed.broadcaster.close()
+
+    async def test_overflowing_buffer_is_dropped_for_a_resync(self):
+        subscription = await feed.broadcaster.subscribe()
+        for message_id in range(3):
+            subscription.put((message_id, b''))
+        self.assertIs(await subscription.get(), feed.OVERFLOW)
+        subscription.put((4, b''))
+        self.assertEqual(await subscription.get(), (4, b''))
+        await feed.broadcaster.close()
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get('/api/auth/messages/stream/', headers={'Accept': 'text/event-stream'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refused_outside_asgi(self):
+        response = self.client.get('/api/auth/messages/stream/', headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+    async def test_invalid_last_event_id(self):
+        response = await self.async_client.get('/api/auth/messages/stream/?last_event_id=x', headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MessageReadStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="ada@example.com", username="ada", password="testpassword")
+        self.other = User.objects.create_user(email="bob@example.com", username="bob", password="testpassword")
+        self.messages = [
+            Message.objects.create(sender=self.other, subject=f"Subject {i}", body="body") for i in range(5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def unread_count(self):
+        response = self.client.get('/api/auth/messages/unread-count/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['data']['unread_count']
+
+    def test_read_state_is_per_user(self):
+        response = self.client.post('/api/auth/messages/read/', {'up_to': self.messages[2].pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.post('/api/auth/messages/read/', {'ids': [self.messages[4].pk]}, format='json')
+
+        response = self.client.get('/api/auth/messages/')
+        read = {m['subject']: m['is_read'] for m in response.data['data']}
+        self.assertEqual(read, {"Subject 0": True, "Subject 1": True, "Subject 2": True,
+                                "Subject 3": False, "Subject 4": True})
+        self.assertEqual(self.unread_count(), 1)
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.unread_count(), 5)
+
+    def test_mark_all_read_is_one_write_and_never_moves_back(self):
+        self.client.post('/api/auth/messages/read/', {'up_to': self.messages[3].pk}, format='json')
+        with self.assertNumQueries(2):
+            # The newest message id, then the watermark update
+            self.client.post('/api/auth/messages/read/', {'up_to': self.messages[4].pk}, format='json')
+        self.client.post('/api/auth/messages/read/', {'up_to': self.messages[0].pk}, format='json')
+        self.assertEqual(MessageReadState.objects.get(user=self.user).last_read_id, self.messages[4].pk)
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_unread_count_is_cached_and_counts_new_messages(self):
+        self.assertEqual(self.unread_count(), 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(sender=self.other, subject="New", body="body")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.unread_count(), 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.messages[0].delete()
+        self.assertEqual(self.unread_count(), 5)
+
+    def test_count_computed_during_a_mark_is_not_served_after_it(self):
+        self.assertEqual(self.unread_count(), 5)
+        key = reads.summary_key(
+            self.user.pk, cache.get(reads.GENERATION_KEY), cache.get(reads.version_key(self.user.pk))
+        )
+        stale = cache.get(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/auth/messages/read/', {'up_to': self.messages[4].pk}, format='json')
+        # A request that counted before the mark stores its count after it
+        cache.set(key, stale)
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_mark_read_needs_up_to_or_ids(self):
+        response = self.client.post('/api/auth/messages/read/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/auth/messages/read/', {'up_to': 1, 'ids': [1]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,34 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .revocation import store
+
+
+# Holds User.token_version; checked by CachedJWTAuthentication
+TOKEN_VERSION_CLAIM = 'tv'
+
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    Refresh token whose access tokens stop working when the user's token
+    version changes, and which can be revoked (see ``users.revocation``)
+    """
+
+    def verify(self, *args, **kwargs):
+        # Signature and expiry first, so garbage never reaches the store
+        super().verify(*args, **kwargs)
+        if store.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        store.revoke(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload['exp']))
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        # Copied into the access token along with the other claims
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        return token
@@ -1,12 +1,20 @@
 from django.urls import path
-from users.views import (ProfilePhotoView, RegisterView , LoginView , ChangePasswordView, MessageView , MessageListView)
+from users.views import (ProfilePhotoView, RegisterView , LoginView , ChangePasswordView, MessageView , MessageListView, StudentImportView,
+                         StudentImportStatusView, TokenRefreshView, LogoutView, MessageStreamView, MarkMessagesReadView, UnreadCountView)
 
 urlpatterns = [
     path('register/' , RegisterView.as_view(), name="register" ),
+    path('import-students/', StudentImportView.as_view(), name='import-students'),
+    path('import-students/<uuid:import_id>/', StudentImportStatusView.as_view(), name='import-student-status'),
     path('login/' , LoginView.as_view() , name='login'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('change-password/' ,ChangePasswordView.as_view(), name='change-password'),
     path('profile-photo/' , ProfilePhotoView.as_view(), name='profile-photo'),
     path('send-message/' , MessageView.as_view(), name='send-message' ),
-    path("messages/", MessageListView.as_view(), name="message-list")
+    path("messages/", MessageListView.as_view(), name="message-list"),
+    path("messages/stream/", MessageStreamView.as_view(), name="message-stream"),
+    path("messages/read/", MarkMessagesReadView.as_view(), name="message-read"),
+    path("messages/unread-count/", UnreadCountView.as_view(), name="message-unread-count"),
 ]
 
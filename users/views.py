@@ -1,12 +1,25 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import ChangePasswordSerializer, ProfilePhotoSerializer, RegisterSerializer , MessageSerializer
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from .serializers import (ChangePasswordSerializer, ProfilePhotoSerializer, RegisterSerializer , MessageSerializer,
+                          TokenRefreshSerializer, MarkMessagesReadSerializer)
 from django.contrib.auth import authenticate
-from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from .models import Message 
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.views import TokenRefreshView as BaseTokenRefreshView
+from uniSchooling import renditions
+from uniSchooling.asyncviews import AsyncAPIViewMixin
+from uniSchooling.pagination import KeysetPagination
+from . import feed, imports, reads
+from .authentication import CachedJWTAuthentication
+from .tokens import RefreshToken
+from .models import Message, StudentImport, User
 
 class RegisterView(APIView):
     def post(self, request):
@@ -29,6 +42,64 @@ class RegisterView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+def student_import_data(student_import):
+    return {
+        "id": str(student_import.id),
+        "status": student_import.status,
+        "report": student_import.report,
+        "error": student_import.error,
+        "created_at": student_import.created_at,
+        "finished_at": student_import.finished_at,
+    }
+
+
+class StudentImportView(APIView):
+    """
+    Staff upload of a students CSV (see ``users.imports``). A large intake
+    takes minutes, so the file is imported by a background job; poll
+    ``import-students/<id>/`` for its status and report.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({
+                "error": True,
+                "message": "Please upload a CSV file as 'file'"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            student_import = imports.queue_import(upload, request.user)
+        except (imports.StudentImportError, UnicodeDecodeError) as error:
+            return Response({
+                "error": True,
+                "message": "Import failed",
+                "details": str(error)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "error": False,
+            "message": "Import queued",
+            "data": student_import_data(student_import)
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class StudentImportStatusView(APIView):
+    """Status and, once finished, report of a queued student import"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, import_id):
+        student_import = StudentImport.objects.filter(pk=import_id).first()
+        if student_import is None:
+            raise NotFound("Import not found")
+        return Response({
+            "error": False,
+            "data": student_import_data(student_import)
+        }, status=status.HTTP_200_OK)
+
+
 class LoginView(APIView):
     def post(self, request):
         # Support both email and username for login
@@ -41,13 +112,9 @@ class LoginView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Try to authenticate with email
-        user = authenticate(email=identifier, password=password)
-        
-        # If email authentication fails, try with username
-        if user is None:
-            user = authenticate(username=identifier, password=password)
-        
+        # One lookup by email or username and at most one password hash
+        user = authenticate(request, username=identifier, password=password)
+
         if user is None:
             return Response(
                 {'error': 'Invalid credentials'},
@@ -71,11 +138,36 @@ class LoginView(APIView):
         
 
 
+class TokenRefreshView(BaseTokenRefreshView):
+    """New access token (and, rotating, a new refresh token) for a refresh token"""
+    serializer_class = TokenRefreshSerializer
+
+
+class LogoutView(APIView):
+    """Revokes the given refresh token; its access tokens expire on their own"""
+    authentication_classes = []
+
+    def post(self, request):
+        token = request.data.get('refresh')
+        if not token:
+            return Response(
+                {'error': 'Please provide the refresh token'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            RefreshToken(token).blacklist()
+        except TokenError as error:
+            raise InvalidToken(error.args[0])
+        return Response({'message': 'Logged out'}, status=status.HTTP_200_OK)
+
+
 class ChangePasswordView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get_object(self, queryset=None):
-        return self.request.user
+        # request.user may come from the auth cache, without the password
+        # and with a token_version another process has since bumped
+        return User.objects.get(pk=self.request.user.pk)
     
     def put(self, request, *args, **kwargs):
         self.object = self.get_object()
@@ -95,15 +187,22 @@ class ChangePasswordView(APIView):
                 )
                 
             self.object.set_password(serializer.validated_data.get("new_password"))
-            self.object.save()
-            return Response({"message": "Password changed successfully"}, status=status.HTTP_200_OK)
+            # save() adds token_version
+            self.object.save(update_fields=['password'])
+            # Saving revoked every earlier token, including the one used here
+            refresh = RefreshToken.for_user(self.object)
+            return Response({
+                "message": "Password changed successfully",
+                "access_token": str(refresh.access_token),
+                "refresh": str(refresh),
+            }, status=status.HTTP_200_OK)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
 class ProfilePhotoView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def put(self, request, *args, **kwargs):
         user = request.user
@@ -113,14 +212,16 @@ class ProfilePhotoView(APIView):
             serializer.save()
             return Response({
                 "message": "Profile photo updated successfully",
-                "profile_photo": request.build_absolute_uri(user.profile_photo.url) if user.profile_photo else None
+                "profile_photo": request.build_absolute_uri(user.profile_photo.url) if user.profile_photo else None,
+                # Thumbnails are rendered in the background; null until they are ready
+                "thumbnails": renditions.thumbnail_urls(user.renditions, request),
             }, status=status.HTTP_200_OK)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 class MessageView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def post(self, request):
         serializer = MessageSerializer(data=request.data)
@@ -144,22 +245,123 @@ class MessageView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
         
         
-class MessageListView(APIView):
+class MessageListView(AsyncAPIViewMixin, APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
+    keyset_ordering = ('-sent_at', 'id')
 
-    def get(self, request):
+    async def get(self, request):
         try:
-            messages = Message.objects.all().order_by('-sent_at')
-            serializer = MessageSerializer(messages, many=True)
+            paginator = KeysetPagination()
+            messages = await paginator.apaginate_queryset(Message.objects.select_related('sender'), request, view=self)
+            read_state = await reads.aread_state(request.user, messages)
+            serializer = MessageSerializer(messages, many=True, context={'read_state': read_state})
             return Response({
                 "error": False,
                 "message": "Messages retrieved successfully",
-                "data": serializer.data
+                "data": serializer.data,
+                "next": paginator.get_next_link(),
+                "previous": paginator.get_previous_link()
             }, status=status.HTTP_200_OK)
+        except APIException:
+            raise
         except Exception as e:
             return Response({
                 "error": True,
                 "message": "Failed to retrieve messages",
                 "details": str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class MarkMessagesReadView(APIView):
+    """
+    Mark messages read for the current user: everything up to a message
+    (``{"up_to": id}``), or single messages (``{"ids": [...]}``).
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+
+    def post(self, request):
+        serializer = MarkMessagesReadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                "error": True,
+                "message": "Marking messages read failed",
+                "errors": serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if 'up_to' in serializer.validated_data:
+            reads.mark_read_up_to(request.user, serializer.validated_data['up_to'])
+        else:
+            reads.mark_read(request.user, serializer.validated_data['ids'])
+        return Response({
+            "error": False,
+            "message": "Messages marked read"
+        }, status=status.HTTP_200_OK)
+
+
+class UnreadCountView(AsyncAPIViewMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+
+    async def get(self, request):
+        unread_count, last_read_id = await reads.aunread_count(request.user)
+        return Response({
+            "error": False,
+            "message": "Unread count retrieved successfully",
+            "data": {
+                "unread_count": unread_count,
+                "last_read_id": last_read_id
+            }
+        }, status=status.HTTP_200_OK)
+
+
+class ErrorsAsJSON(DefaultContentNegotiation):
+    """Render errors as JSON even for clients that only accept an event stream"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class MessageStreamView(AsyncAPIViewMixin, APIView):
+    """
+    Server-Sent Events feed of new messages (see ``users.feed``). Event ids
+    are message ids: on reconnect the browser sends the last one as
+    ``Last-Event-ID`` and gets what it missed; a first connection can pass
+    ``?last_event_id=``. Without either, only messages sent from now on are
+    streamed. The stream ends when the access token expires.
+
+    Only served over ASGI (see ``uniSchooling.asgi``): a WSGI server reads an
+    async stream to the end before sending any of it, which holds a worker
+    for the token's lifetime and delivers nothing.
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedJWTAuthentication]
+    renderer_classes = [JSONRenderer]
+    content_negotiation_class = ErrorsAsJSON
+
+    async def get(self, request):
+        if not isinstance(request._request, ASGIRequest):
+            return Response({
+                "error": True,
+                "message": "The message stream is only available from the ASGI server"
+            }, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+        if last_event_id is not None:
+            try:
+                last_event_id = int(last_event_id)
+            except ValueError:
+                return Response({
+                    "error": True,
+                    "message": "Last-Event-ID must be a message id"
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            feed.stream(last_event_id, expires_at=request.auth.get('exp')),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response